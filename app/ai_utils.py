@@ -1,13 +1,18 @@
 import os
 import json
+import numpy as np
 import google.generativeai as genai
-from typing import List, Optional
+from typing import List, Optional, Dict, Set
 from app.models.category import Category
 import re
-from playwright.async_api import async_playwright
 import asyncio
+import time
 from uuid import uuid4
 from google.api_core.exceptions import ResourceExhausted
+from app.rate_limiter import gemini_limiter
+from app.browser_pool import browser_pool, wait_for_page_to_settle
+from app.metrics import GEMINI_REQUEST_SECONDS, record_gemini_usage
+from app.text_processing import estimate_tokens, truncate_to_token_budget
 
 try:
     api_key = os.getenv("GOOGLE_API_KEY")
@@ -17,14 +22,103 @@ try:
 except Exception as e:
     print(f"Error configuring Google API: {e}")
 
+AI_BATCH_SIZE = int(os.getenv("AI_BATCH_SIZE", "10"))
+AI_MAX_EMAIL_TOKENS = int(os.getenv("AI_MAX_EMAIL_TOKENS", "1500"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "5"))
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "models/text-embedding-004")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+UNSUBSCRIBE_SCAN_CHARS = int(os.getenv("UNSUBSCRIBE_SCAN_CHARS", "20000"))
+OTHER_CATEGORY_DESCRIPTION = "Use this category for any email that does not clearly fit into the other categories."
 
-def summarize_and_categorize_email(body: str, user_categories: List[Category]) -> dict:
+
+def _generate_content(prompt: str, function: str = "other"):
+    """Calls Gemini through the shared rate limiter, backing off and retrying
+    on ResourceExhausted. Only re-raises once GEMINI_MAX_RETRIES is used up.
+    `function` labels the call's metrics."""
+    model = genai.GenerativeModel('gemini-1.5-flash')
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        gemini_limiter.acquire(estimate_tokens(prompt))
+        start = time.perf_counter()
+        try:
+            response = model.generate_content(prompt)
+            GEMINI_REQUEST_SECONDS.observe(time.perf_counter() - start, function=function, outcome="ok")
+            record_gemini_usage(function, response)
+            gemini_limiter.record_success()
+            return response
+        except ResourceExhausted:
+            GEMINI_REQUEST_SECONDS.observe(time.perf_counter() - start, function=function, outcome="rate_limited")
+            delay = gemini_limiter.record_rate_limited()
+            if attempt == GEMINI_MAX_RETRIES:
+                raise
+            print(f"Gemini API rate limit hit, retrying in {delay:.1f}s (attempt {attempt + 1}/{GEMINI_MAX_RETRIES}).")
+            time.sleep(delay)
+
+async def _generate_content_async(prompt: str, function: str = "other"):
+    model = genai.GenerativeModel('gemini-1.5-flash')
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        await gemini_limiter.acquire_async(estimate_tokens(prompt))
+        start = time.perf_counter()
+        try:
+            response = await model.generate_content_async(prompt)
+            GEMINI_REQUEST_SECONDS.observe(time.perf_counter() - start, function=function, outcome="ok")
+            record_gemini_usage(function, response)
+            gemini_limiter.record_success()
+            return response
+        except ResourceExhausted:
+            GEMINI_REQUEST_SECONDS.observe(time.perf_counter() - start, function=function, outcome="rate_limited")
+            delay = gemini_limiter.record_rate_limited()
+            if attempt == GEMINI_MAX_RETRIES:
+                raise
+            print(f"Gemini API rate limit hit, retrying in {delay:.1f}s (attempt {attempt + 1}/{GEMINI_MAX_RETRIES}).")
+            await asyncio.sleep(delay)
+
+def embed_texts(texts: List[str]) -> Optional[np.ndarray]:
+    """Embeds texts with Gemini, EMBEDDING_BATCH_SIZE per request. Returns a
+    (len(texts), dimensions) array, or None if a request failed."""
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    vectors = []
+    try:
+        for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            # Empty content is rejected by the API.
+            batch = [text or "(empty)" for text in texts[start:start + EMBEDDING_BATCH_SIZE]]
+            gemini_limiter.acquire(sum(estimate_tokens(text) for text in batch))
+            began = time.perf_counter()
+            result = genai.embed_content(model=EMBEDDING_MODEL, content=batch, task_type="classification")
+            GEMINI_REQUEST_SECONDS.observe(time.perf_counter() - began, function="embed_texts", outcome="ok")
+            gemini_limiter.record_success()
+            vectors.extend(result["embedding"])
+    except ResourceExhausted as e:
+        gemini_limiter.record_rate_limited()
+        print(f"Gemini API rate limit exceeded while embedding: {e}")
+        return None
+    except Exception as e:
+        print(f"Error calling Gemini embeddings API: {e}")
+        return None
+    return np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+
+
+def _build_category_list(user_categories: List[Category]) -> str:
     category_list_str = "\n".join(
         [f'- "{cat.name}": {cat.description}' for cat in user_categories]
     )
-    
-    category_list_str += '\n- "Other": Use this category for any email that does not clearly fit into the other categories.'
+    return category_list_str + f'\n- "Other": {OTHER_CATEGORY_DESCRIPTION}'
+
+
+def _valid_classification(entry, valid_categories: Set[str]) -> Optional[dict]:
+    """The {"summary", "category"} of a model answer, or None when it is not
+    an object with a non-empty summary and one of the offered categories."""
+    if not isinstance(entry, dict):
+        return None
+    summary = entry.get("summary")
+    category = entry.get("category")
+    if not isinstance(summary, str) or not summary.strip() or category not in valid_categories:
+        return None
+    return {"summary": summary.strip(), "category": category}
+
 
+def summarize_and_categorize_email(body: str, user_categories: List[Category]) -> dict:
+    category_list_str = _build_category_list(user_categories)
 
     prompt = f"""
 Analyze the email content below. Your task is:
@@ -36,7 +130,7 @@ User Categories:
 
 Email Content:
 \"\"\"
-{body[:8000]}
+{truncate_to_token_budget(body, AI_MAX_EMAIL_TOKENS)}
 \"\"\"
 
 Respond ONLY with a valid JSON object in the following format, with no other text or formatting:
@@ -44,8 +138,7 @@ Respond ONLY with a valid JSON object in the following format, with no other tex
 """
 
     try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        response = model.generate_content(prompt)
+        response = _generate_content(prompt, function="summarize_and_categorize_email")
         cleaned_response = response.text.strip().replace("```json", "").replace("```", "")
         return json.loads(cleaned_response)
     except ResourceExhausted as e:
@@ -54,8 +147,77 @@ Respond ONLY with a valid JSON object in the following format, with no other tex
     except Exception as e:
         print(f"Error calling Gemini API or parsing JSON: {e}")
         return None
+
+def summarize_and_categorize_emails(emails: List[Dict], user_categories: List[Category]) -> Dict[str, dict]:
+    """Summarizes and classifies several emails with a single Gemini prompt.
+
+    `emails` holds {"id", "body"} dicts. Returns {id: {"summary", "category"}}
+    for every email that could be classified; entries the batched answer got
+    wrong are retried one by one with summarize_and_categorize_email.
+    """
+    if not emails:
+        return {}
+
+    category_list_str = _build_category_list(user_categories)
+    valid_categories = {cat.name for cat in user_categories} | {"Other"}
+    bodies_by_id = {email["id"]: email.get("body") or "" for email in emails}
+
+    email_blocks = "\n\n".join(
+        f'<email id="{email_id}">\n{truncate_to_token_budget(body, AI_MAX_EMAIL_TOKENS)}\n</email>'
+        for email_id, body in bodies_by_id.items()
+    )
+
+    prompt = f"""
+Analyze each of the emails below. For every email your task is:
+1. Summarize the email in a single sentence.
+2. Classify the email into ONE of the user-defined categories provided. You MUST choose one from the list.
+
+User Categories:
+{category_list_str}
+
+Emails:
+{email_blocks}
+
+Respond ONLY with a valid JSON array containing one object per email, in the following format, with no other text or formatting:
+[{{"id": "The email id", "summary": "Your one-sentence summary here", "category": "The Exact Name of the Chosen Category"}}]
+"""
+
+    results = {}
+    try:
+        response = _generate_content(prompt, function="summarize_and_categorize_emails")
+        cleaned_response = response.text.strip().replace("```json", "").replace("```", "")
+        entries = json.loads(cleaned_response)
+        if not isinstance(entries, list):
+            raise ValueError("Expected a JSON array of classifications")
+
+        for entry in entries:
+            classification = _valid_classification(entry, valid_categories)
+            if classification is None:
+                continue
+            email_id = str(entry.get("id"))
+            if email_id not in bodies_by_id or email_id in results:
+                continue
+            results[email_id] = classification
+    except ResourceExhausted as e:
+        print(f"Gemini API rate limit exceeded during batch summarization: {e}")
+        raise e
+    except Exception as e:
+        print(f"Error calling Gemini API or parsing batch JSON: {e}")
+
+    for email_id, body in bodies_by_id.items():
+        if email_id in results:
+            continue
+        print(f"Retrying email {email_id} on its own after an invalid batch answer.")
+        single_result = _valid_classification(summarize_and_categorize_email(body, user_categories), valid_categories)
+        if single_result:
+            results[email_id] = single_result
+        else:
+            print(f"Leaving email {email_id} unclassified after an invalid answer.")
+
+    return results
     
 def find_unsubscribe_link(body: str) -> Optional[str]:
+    # Unsubscribe links live in the footer, so only the tail of long bodies is sent.
     prompt = f"""
 Analyze the following email's HTML body. Your task is to find the most likely URL for unsubscribing from this newsletter or mailing list.
 
@@ -65,14 +227,13 @@ Return ONLY the URL from the `href` attribute of that anchor tag. Do not return
 
 HTML Body:
 \"\"\"
-{body}
+{body[-UNSUBSCRIBE_SCAN_CHARS:]}
 \"\"\"
 
 Unsubscribe URL:
 """
     try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        response = model.generate_content(prompt)
+        response = _generate_content(prompt, function="find_unsubscribe_link")
         
         url_match = re.search(r'https?://[^\s"]+', response.text)
         if url_match:
@@ -92,12 +253,9 @@ async def agent_unsubscribe_from_link(url: str) -> dict:
         return {"success": False, "reason": "Invalid URL."}
 
     try:
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            page = await browser.new_page()
+        async with browser_pool.page() as page:
             await page.goto(url, timeout=60000)
-            
-            await asyncio.sleep(3)
+            await wait_for_page_to_settle(page)
 
             html_content = await page.content()
 
@@ -119,25 +277,21 @@ async def agent_unsubscribe_from_link(url: str) -> dict:
             \"\"\"
             """
 
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            response = model.generate_content(prompt)
+            response = await _generate_content_async(prompt, function="agent_unsubscribe_from_link")
             cleaned_response = response.text.strip().replace("```json", "").replace("```", "")
             result_json = json.loads(cleaned_response)
             
             selector = result_json.get("selector")
 
             if not selector:
-                await browser.close()
                 return {"success": False, "reason": "AI could not identify a confirmation button on the page."}
 
             await page.click(selector, timeout=25000)
-            
-            await asyncio.sleep(2)
+            await wait_for_page_to_settle(page)
+
             screenshot_path = f"unsubscribe_{uuid4()}.png"
             await page.screenshot(path=screenshot_path)
 
-            await browser.close()
-            
             return {"success": True, "reason": f"Unsubscribe action executed. Screenshot saved at {screenshot_path}"}
     except ResourceExhausted as e:
         print(f"Gemini API rate limit exceeded during unsubscribe agent: {e}")
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Request, Depends, BackgroundTasks
+from fastapi import APIRouter, Request, Depends
 from fastapi.responses import RedirectResponse
 from starlette.config import Config
 from authlib.integrations.starlette_client import OAuth
@@ -8,7 +8,7 @@ import json
 from app.db import engine
 from app.models.category import Category
 from app.models.linked_account import LinkedAccount
-from app.tasks import process_emails_task_wrapper, set_sync_status
+from app.job_queue import enqueue_job
 
 config = Config(".env")
 router = APIRouter()
@@ -54,7 +54,6 @@ async def add_account(request: Request):
 @router.get("/auth/callback")
 async def auth_callback(
     request: Request,
-    background_tasks: BackgroundTasks,
     session: Session = Depends(get_session)
 ):
     try:
@@ -104,7 +103,10 @@ async def auth_callback(
                 new_cat = Category(name=cat_data["name"], description=cat_data["description"], user_email=user_email)
                 session.add(new_cat)
             
-            background_tasks.add_task(process_emails_task_wrapper, user_email, user_session_data, token_data_to_store)
+            enqueue_job(
+                "sync_emails", {"owner_email": user_email, "account_email": user_email}, session,
+                owner_email=user_email, account_email=user_email
+            )
 
         session.commit()
         return RedirectResponse(url="/dashboard")
@@ -0,0 +1,115 @@
+import os
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+from playwright.async_api import async_playwright, Browser, Page, TimeoutError as PlaywrightTimeoutError
+
+from app.metrics import BROWSER_SESSION_SECONDS
+
+BROWSER_MAX_PAGES = int(os.getenv("BROWSER_MAX_PAGES", "4"))
+BROWSER_MAX_USES = int(os.getenv("BROWSER_MAX_USES", "50"))
+PAGE_SETTLE_TIMEOUT = int(os.getenv("PAGE_SETTLE_TIMEOUT", "10000"))
+
+
+class _PooledBrowser:
+    def __init__(self, browser: Browser):
+        self.browser = browser
+        self.uses = 0
+        self.active = 0
+        self.retired = False
+
+
+class BrowserPool:
+    """Keeps one long-lived Chromium and hands out a fresh, isolated browser
+    context per job. At most max_pages contexts are open at once. The browser
+    is replaced after max_uses contexts or as soon as it disconnects; a
+    retired browser is closed once its last context is done with it.
+
+    Playwright and the pool's locks belong to the event loop that first uses
+    them. The unsubscribe jobs run on the shared background loop (run_gmail),
+    so the pool must also be closed there: see worker.close_job_resources."""
+
+    def __init__(self, max_pages: int = BROWSER_MAX_PAGES, max_uses: int = BROWSER_MAX_USES):
+        self.max_pages = max_pages
+        self.max_uses = max_uses
+        self._playwright = None
+        self._current: Optional[_PooledBrowser] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _ensure_primitives(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_pages)
+            self._lock = asyncio.Lock()
+
+    async def _acquire(self) -> _PooledBrowser:
+        async with self._lock:
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+
+            current = self._current
+            if current and (not current.browser.is_connected() or current.uses >= self.max_uses):
+                current.retired = True
+                if current.active == 0:
+                    await self._close_browser(current)
+                current = self._current = None
+
+            if current is None:
+                browser = await self._playwright.chromium.launch(headless=True)
+                current = self._current = _PooledBrowser(browser)
+
+            current.uses += 1
+            current.active += 1
+            return current
+
+    async def _release(self, pooled: _PooledBrowser):
+        async with self._lock:
+            pooled.active -= 1
+            if not pooled.browser.is_connected() and self._current is pooled:
+                pooled.retired = True
+                self._current = None
+            if pooled.retired and pooled.active == 0:
+                await self._close_browser(pooled)
+
+    async def _close_browser(self, pooled: _PooledBrowser):
+        try:
+            await pooled.browser.close()
+        except Exception as e:
+            print(f"Error closing pooled browser: {e}")
+
+    @asynccontextmanager
+    async def page(self):
+        self._ensure_primitives()
+        async with self._semaphore:
+            pooled = await self._acquire()
+            context = None
+            try:
+                context = await pooled.browser.new_context()
+                with BROWSER_SESSION_SECONDS.time():
+                    yield await context.new_page()
+            finally:
+                if context is not None:
+                    try:
+                        await context.close()
+                    except Exception as e:
+                        print(f"Error closing browser context: {e}")
+                await self._release(pooled)
+
+    async def close(self):
+        if self._current:
+            await self._close_browser(self._current)
+            self._current = None
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+
+
+async def wait_for_page_to_settle(page: Page, timeout: int = PAGE_SETTLE_TIMEOUT):
+    """Waits until the page has no network activity left, giving up after timeout ms."""
+    try:
+        await page.wait_for_load_state("networkidle", timeout=timeout)
+    except PlaywrightTimeoutError:
+        pass
+
+
+browser_pool = BrowserPool()
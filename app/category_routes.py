@@ -1,25 +1,75 @@
-from fastapi import APIRouter, Request, Form, Depends, BackgroundTasks
-from fastapi.responses import RedirectResponse
+from fastapi import APIRouter, Request, Form, Depends
+from fastapi.responses import RedirectResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 from sqlmodel import Session, select
-from typing import List
-import asyncio
+from sqlalchemy import tuple_
+from typing import List, Optional, Tuple
+from datetime import datetime
+import base64
+import json
+from uuid import uuid4
 
 from app.models.category import Category
 from app.models.email import Email
+from app.models.unsubscribe_result import UnsubscribeResult
 from app.db import engine
-from app.tasks import process_emails_task_wrapper, set_sync_status
-from app.gmail import get_gmail_service, batch_delete_emails
-from app.ai_utils import find_unsubscribe_link, agent_unsubscribe_from_link
+from app.tasks import set_sync_status, save_refreshed_token
+from app.job_queue import enqueue_job
+from app.gmail_async import get_async_gmail_client, batch_delete_emails
+from app.email_content import delete_orphaned_contents
+from app.search import remove_emails
 
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
 
+CATEGORY_PAGE_SIZE = 50
+CATEGORY_MAX_PAGE_SIZE = 200
+
 def get_session():
     with Session(engine) as session:
         yield session
 
+def encode_email_cursor(sent_at: Optional[datetime], email_id: str) -> str:
+    raw = json.dumps([sent_at.isoformat() if sent_at else None, email_id])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_email_cursor(cursor: str) -> Tuple[Optional[datetime], str]:
+    sent_at, email_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    return (datetime.fromisoformat(sent_at) if sent_at else None), email_id
+
+def list_category_emails(session: Session, category_id: str, cursor: Optional[str] = None, limit: int = CATEGORY_PAGE_SIZE):
+    """Returns one page of a category's emails, newest first, and the cursor of
+    the next page (None on the last page).
+
+    Rows without a parsed sent_at sort after all dated ones. Dated and undated
+    rows are read with separate keyset queries, each a range scan of
+    ix_email_category_sent_at_desc, and only the list columns are selected so
+    bodies are never loaded.
+    """
+    columns = (Email.id, Email.from_address, Email.summary, Email.snippet, Email.sent_date, Email.sent_at)
+    cursor_sent_at, cursor_id = decode_email_cursor(cursor) if cursor else (None, None)
+
+    rows = []
+    if not cursor or cursor_sent_at is not None:
+        dated = select(*columns).where(Email.category_id == category_id, Email.sent_at.is_not(None))
+        if cursor:
+            dated = dated.where(tuple_(Email.sent_at, Email.id) < tuple_(cursor_sent_at, cursor_id))
+        rows = session.exec(
+            dated.order_by(Email.sent_at.desc().nulls_last(), Email.id.desc()).limit(limit + 1)
+        ).all()
+    if len(rows) <= limit:
+        undated = select(*columns).where(Email.category_id == category_id, Email.sent_at.is_(None))
+        if cursor_id is not None and cursor_sent_at is None:
+            undated = undated.where(Email.id < cursor_id)
+        rows += session.exec(undated.order_by(Email.id.desc()).limit(limit + 1 - len(rows))).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_email_cursor(rows[-1].sent_at, rows[-1].id)
+    return rows, next_cursor
+
 @router.get("/categories")
 def list_categories(
     request: Request,
@@ -40,28 +90,28 @@ def list_categories(
 @router.post("/categories")
 def create_category(
     request: Request,
-    background_tasks: BackgroundTasks,
     name: str = Form(...),
     description: str = Form(""),
     session: Session = Depends(get_session)
 ):
     user = request.session.get("user")
-    token_data = request.session.get("token")
     if not user:
         return RedirectResponse(url="/")
 
     new_cat = Category(name=name, description=description, user_email=user["email"])
     session.add(new_cat)
-    
-    set_sync_status(user['email'], 'processing', session)
-    background_tasks.add_task(process_emails_task_wrapper, user['email'], user, token_data)
-    
     session.commit()
 
+    set_sync_status(user['email'], 'processing', session)
+    enqueue_job(
+        "sync_emails", {"owner_email": user['email'], "account_email": user['email']}, session,
+        owner_email=user['email'], account_email=user['email']
+    )
+
     return RedirectResponse(url="/processing", status_code=303)
 
 @router.get("/categories/{category_id}")
-def get_category_details(request: Request, category_id: str, session: Session = Depends(get_session)):
+def get_category_details(request: Request, category_id: str, cursor: Optional[str] = None, session: Session = Depends(get_session)):
     user = request.session.get("user")
     if not user:
         return RedirectResponse(url="/")
@@ -70,8 +120,46 @@ def get_category_details(request: Request, category_id: str, session: Session =
     if not category or category.user_email != user['email']:
         return RedirectResponse(url="/categories")
 
+    try:
+        emails, next_cursor = list_category_emails(session, category_id, cursor)
+    except (ValueError, TypeError):
+        return RedirectResponse(url=f"/categories/{category_id}")
+
     return templates.TemplateResponse("category_detail.html", {
-        "request": request, "category": category, "user": user
+        "request": request, "category": category, "user": user,
+        "emails": emails, "next_cursor": next_cursor, "is_first_page": cursor is None
+    })
+
+@router.get("/api/categories/{category_id}/emails")
+def list_category_emails_api(
+    request: Request,
+    category_id: str,
+    cursor: Optional[str] = None,
+    limit: int = CATEGORY_PAGE_SIZE,
+    session: Session = Depends(get_session)
+):
+    user = request.session.get("user")
+    if not user:
+        return JSONResponse({"status": "error", "message": "Not authenticated"}, status_code=401)
+
+    category = session.get(Category, category_id)
+    if not category or category.user_email != user['email']:
+        return JSONResponse({"status": "error", "message": "Category not found"}, status_code=404)
+
+    try:
+        emails, next_cursor = list_category_emails(session, category_id, cursor, max(1, min(limit, CATEGORY_MAX_PAGE_SIZE)))
+    except (ValueError, TypeError):
+        return JSONResponse({"status": "error", "message": "Invalid cursor"}, status_code=400)
+
+    return JSONResponse({
+        "emails": [
+            {
+                "id": email.id, "from_address": email.from_address, "summary": email.summary,
+                "snippet": email.snippet, "sent_date": email.sent_date
+            }
+            for email in emails
+        ],
+        "next_cursor": next_cursor
     })
 
 @router.post("/categories/{category_id}/batch-action")
@@ -88,38 +176,72 @@ async def handle_batch_action(
         return RedirectResponse(url="/")
 
     if action == "delete":
-        service = get_gmail_service(token_data)
-        batch_delete_emails(service, email_ids)
+        client = get_async_gmail_client(token_data, account_email=user['email'])
+        await batch_delete_emails(client, email_ids)
+        request.session["token"] = save_refreshed_token(user['email'], token_data, client, session)
 
+        content_hashes = []
+        deleted_ids = []
         for email_id in email_ids:
             email_to_delete = session.get(Email, email_id)
             if email_to_delete and email_to_delete.user_email == user['email']:
+                content_hashes.append(email_to_delete.content_hash)
+                deleted_ids.append(email_id)
                 session.delete(email_to_delete)
-        
+        session.flush()
+        delete_orphaned_contents(session, content_hashes)
+        remove_emails(session, deleted_ids)
+
         session.commit()
         return RedirectResponse(url=f"/categories/{category_id}", status_code=303)
 
     elif action == "unsubscribe":
-        unsubscribe_results = []
+        batch_id = str(uuid4())
         for email_id in email_ids:
             email = session.get(Email, email_id)
             if email and email.user_email == user['email']:
-                link = find_unsubscribe_link(email.body)
-                if link and link != "None":
-                    result = await agent_unsubscribe_from_link(link)
-                    result['from_address'] = email.from_address
-                    unsubscribe_results.append(result)
-        
-        request.session["unsubscribe_results"] = unsubscribe_results
-        return RedirectResponse(url="/unsubscribe-results", status_code=303)
+                session.add(UnsubscribeResult(
+                    batch_id=batch_id, owner_email=user['email'], email_id=email.id, from_address=email.from_address
+                ))
+        session.commit()
+        enqueue_job(
+            "unsubscribe_emails", {"owner_email": user['email'], "batch_id": batch_id}, session,
+            owner_email=user['email']
+        )
+        return RedirectResponse(url=f"/unsubscribe-results/{batch_id}", status_code=303)
 
     return RedirectResponse(url=f"/categories/{category_id}", status_code=303)
 
-@router.get("/unsubscribe-results")
-def unsubscribe_results(request: Request):
+def _unsubscribe_results(owner_email: str, batch_id: str, session: Session) -> List[UnsubscribeResult]:
+    return session.exec(
+        select(UnsubscribeResult)
+        .where(UnsubscribeResult.batch_id == batch_id, UnsubscribeResult.owner_email == owner_email)
+        .order_by(UnsubscribeResult.created_at, UnsubscribeResult.id)
+    ).all()
+
+@router.get("/unsubscribe-results/{batch_id}")
+def unsubscribe_results(request: Request, batch_id: str, session: Session = Depends(get_session)):
     user = request.session.get("user")
     if not user:
         return RedirectResponse(url="/")
-    
-    results = request.session.pop("unsubscribe_results", [])
-    return templates.TemplateResponse("unsubscribe_results.html", {"request": request, "unsubscribe_results": results})
\ No newline at end of file
+
+    results = _unsubscribe_results(user['email'], batch_id, session)
+    return templates.TemplateResponse("unsubscribe_results.html", {
+        "request": request, "batch_id": batch_id, "unsubscribe_results": results
+    })
+
+@router.get("/unsubscribe-results/{batch_id}/status")
+def unsubscribe_results_status(request: Request, batch_id: str, session: Session = Depends(get_session)):
+    user = request.session.get("user")
+    if not user:
+        return JSONResponse({"status": "error", "message": "Not authenticated"}, status_code=401)
+
+    results = _unsubscribe_results(user['email'], batch_id, session)
+    return JSONResponse({
+        "done": sum(1 for result in results if result.status == 'done'),
+        "total": len(results),
+        "results": [
+            {"id": result.id, "status": result.status, "success": result.success, "reason": result.reason}
+            for result in results
+        ]
+    })
@@ -0,0 +1,95 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+from sqlmodel import Session, select, delete
+
+from app.models.category import Category
+from app.models.classification_cache import ClassificationCache
+
+CLASSIFICATION_CACHE_SIZE = int(os.getenv("CLASSIFICATION_CACHE_SIZE", "10000"))
+
+_lru: "OrderedDict[str, dict]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def normalize_body(body: str) -> str:
+    return re.sub(r"\s+", " ", body or "").strip()
+
+def category_fingerprint(user_categories: List[Category]) -> str:
+    """Hash of the user's category names and descriptions. Any edit to the
+    category set changes it, which makes every old cache key unreachable."""
+    categories = sorted((cat.name, cat.description or "") for cat in user_categories)
+    return hashlib.sha256(json.dumps(categories).encode("utf-8")).hexdigest()
+
+def cache_key(body: str, fingerprint: str) -> str:
+    body_hash = hashlib.sha256(normalize_body(body).encode("utf-8")).hexdigest()
+    return f"{fingerprint}:{body_hash}"
+
+def _remember(key: str, value: dict):
+    _lru[key] = value
+    _lru.move_to_end(key)
+    while len(_lru) > CLASSIFICATION_CACHE_SIZE:
+        _lru.popitem(last=False)
+        _stats["evictions"] += 1
+
+def lookup_classifications(keys: List[str], db_session: Session) -> Dict[str, dict]:
+    """Returns {key: {"summary", "category"}} for the keys already classified,
+    checking the in-process LRU first and the cache table for the rest."""
+    found = {}
+    missing = []
+    with _lock:
+        for key in dict.fromkeys(keys):
+            if key in _lru:
+                _lru.move_to_end(key)
+                found[key] = _lru[key]
+            else:
+                missing.append(key)
+
+    rows = []
+    if missing:
+        rows = db_session.exec(select(ClassificationCache).where(ClassificationCache.key.in_(missing))).all()
+
+    with _lock:
+        for row in rows:
+            value = {"summary": row.summary, "category": row.category}
+            found[row.key] = value
+            _remember(row.key, value)
+        _stats["hits"] += len(found)
+        _stats["misses"] += len(missing) - len(rows)
+    return found
+
+def store_classifications(entries: Dict[str, dict], user_email: str, fingerprint: str, db_session: Session):
+    if not entries:
+        return
+    for key, value in entries.items():
+        db_session.merge(ClassificationCache(
+            key=key, user_email=user_email, category_fingerprint=fingerprint,
+            summary=value["summary"], category=value["category"]
+        ))
+    db_session.commit()
+    with _lock:
+        for key, value in entries.items():
+            _remember(key, {"summary": value["summary"], "category": value["category"]})
+
+def purge_stale_entries(user_email: str, fingerprint: str, db_session: Session):
+    """Deletes the user's rows that were stored under an older category set."""
+    db_session.exec(delete(ClassificationCache).where(
+        ClassificationCache.user_email == user_email,
+        ClassificationCache.category_fingerprint != fingerprint
+    ))
+    db_session.commit()
+
+def get_cache_stats() -> dict:
+    with _lock:
+        return {**_stats, "size": len(_lru), "max_size": CLASSIFICATION_CACHE_SIZE}
+
+def clear_cache():
+    with _lock:
+        _lru.clear()
+        for name in _stats:
+            _stats[name] = 0
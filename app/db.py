@@ -1,7 +1,12 @@
 import os
-from sqlmodel import create_engine, SQLModel
+from typing import List, Set
+from sqlalchemy import inspect, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import create_engine, SQLModel, Session
 from dotenv import load_dotenv
 
+from app.metrics import instrument_engine
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://postgres:mysecretpassword@db:5432/email_ai_db")
@@ -10,8 +15,53 @@ if not DATABASE_URL:
     raise ValueError("DATABASE_URL was not set in the environment variables")
 
 engine = create_engine(DATABASE_URL, echo=True)
+instrument_engine(engine)
+
+def add_missing_columns(engine):
+    """create_all never alters existing tables, so columns added to a model
+    after its table was created are added here (always as nullable), along
+    with any index declared on them."""
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+                print(f"Added missing column {table.name}.{column.name}")
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
+
+# Indexes replaced under a new name, dropped so they stop slowing down writes.
+OBSOLETE_INDEXES = ["ix_email_category_sent_at_id"]
+
+def drop_obsolete_indexes(engine):
+    with engine.begin() as connection:
+        for name in OBSOLETE_INDEXES:
+            connection.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
 
 def create_db_and_tables():
     print("Creating database tables...")
     SQLModel.metadata.create_all(engine)
-    print("Database tables created successfully.")
\ No newline at end of file
+    add_missing_columns(engine)
+    drop_obsolete_indexes(engine)
+    from app.search import create_search_index
+    create_search_index(engine)
+    print("Database tables created successfully.")
+
+def insert_ignoring_conflicts(db_session: Session, model, rows: List[dict]) -> Set:
+    """Inserts all rows with one INSERT ... ON CONFLICT DO NOTHING and returns
+    the primary keys that were actually inserted. Does not commit."""
+    if not rows:
+        return set()
+    dialect = db_session.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    primary_key = model.__table__.primary_key.columns.values()[0]
+    statement = insert(model).values(rows).on_conflict_do_nothing().returning(primary_key)
+    return set(db_session.execute(statement).scalars().all())
@@ -0,0 +1,69 @@
+import zlib
+import hashlib
+from typing import Dict, List, Optional
+from sqlalchemy import delete
+from sqlmodel import Session, select
+
+from app.db import insert_ignoring_conflicts
+from app.models.email import Email
+from app.models.email_content import EmailContent
+from app.text_processing import html_to_text
+
+COMPRESSION_LEVEL = 6
+
+
+def content_hash(body: str) -> str:
+    return hashlib.sha256((body or "").encode("utf-8")).hexdigest()
+
+def compress(text: str) -> bytes:
+    return zlib.compress((text or "").encode("utf-8"), COMPRESSION_LEVEL)
+
+def decompress(data: Optional[bytes]) -> str:
+    return zlib.decompress(data).decode("utf-8") if data else ""
+
+def store_email_contents(db_session: Session, bodies: List[str], texts: Optional[Dict[str, str]] = None) -> List[str]:
+    """Stores each body compressed, next to its plain-text form, and returns
+    their content hashes. Bodies already stored (by this or another account)
+    are skipped. `texts` maps hash -> text for callers that already converted it.
+    Does not commit."""
+    texts = texts or {}
+    hashes = []
+    rows = {}
+    for body in bodies:
+        body_hash = content_hash(body)
+        hashes.append(body_hash)
+        if body_hash not in rows:
+            text = texts.get(body_hash)
+            rows[body_hash] = dict(
+                content_hash=body_hash, html=compress(body),
+                text=compress(text if text is not None else html_to_text(body)), size=len(body or "")
+            )
+    insert_ignoring_conflicts(db_session, EmailContent, list(rows.values()))
+    return hashes
+
+def load_email_body(db_session: Session, email: Email) -> str:
+    """Returns the email's HTML body, from the content table or, for rows not
+    migrated yet, from the legacy body column."""
+    if email.content_hash:
+        content = db_session.get(EmailContent, email.content_hash)
+        if content:
+            return decompress(content.html)
+    return email.body or ""
+
+def load_email_text(db_session: Session, email: Email) -> str:
+    if email.content_hash:
+        content = db_session.get(EmailContent, email.content_hash)
+        if content:
+            return decompress(content.text)
+    return html_to_text(email.body or "")
+
+def delete_orphaned_contents(db_session: Session, hashes: List[str]):
+    """Deletes the given contents once no email references them any more. Does not commit.
+
+    The reference check is part of the DELETE itself, so an email stored
+    between a separate check and the delete cannot lose its content."""
+    hashes = [h for h in set(hashes) if h]
+    if not hashes:
+        return
+    still_used = select(Email.content_hash).where(Email.content_hash == EmailContent.content_hash).exists()
+    db_session.execute(delete(EmailContent).where(EmailContent.content_hash.in_(hashes), ~still_used))
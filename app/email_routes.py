@@ -1,16 +1,28 @@
-from fastapi import APIRouter, Request, Depends, BackgroundTasks
-from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse
+from fastapi import APIRouter, Request, Depends, Form
+from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from sqlmodel import Session, select
 import json
 import os
+import asyncio
+from datetime import datetime
+from typing import Optional
+from urllib.parse import quote
 from app.db import engine
 from app.models.email import Email
 from app.models.linked_account import LinkedAccount
 from app.models.sync_status import SyncStatus
-from app.tasks import process_emails_task_wrapper, set_sync_status 
+from app.tasks import set_sync_status, start_backfill
+from app.job_queue import enqueue_job
+from app.scheduler import schedule_sync_all, get_sync_run_progress
+from app.classification_cache import get_cache_stats
+from app.email_content import load_email_body
+from app.search import search_emails
+from app.progress import progress_broker, sync_progress_event
 
 CRON_SECRET = os.getenv("CRON_SECRET")
+SSE_POLL_INTERVAL = float(os.getenv("SSE_POLL_INTERVAL", "5"))
+SSE_MAX_POLLS = int(os.getenv("SSE_MAX_POLLS", "20"))
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
@@ -20,7 +32,7 @@ def get_session():
         yield session
 
 @router.get("/process-emails")
-def trigger_manual_process(request: Request, background_tasks: BackgroundTasks, session: Session = Depends(get_session)):
+def trigger_manual_process(request: Request, session: Session = Depends(get_session)):
     user = request.session.get("user")
     token_data = request.session.get("token")
     if not user or not token_data:
@@ -29,18 +41,65 @@ def trigger_manual_process(request: Request, background_tasks: BackgroundTasks,
     owner_email = user['email']
     set_sync_status(owner_email, 'processing', session)
 
-    background_tasks.add_task(process_emails_task_wrapper, owner_email, user, token_data)
+    enqueue_job(
+        "sync_emails", {"owner_email": owner_email, "account_email": owner_email}, session,
+        owner_email=owner_email, account_email=owner_email
+    )
 
     linked_accounts = session.exec(
         select(LinkedAccount).where(LinkedAccount.owner_email == owner_email, LinkedAccount.is_primary == False)
     ).all()
     for acc in linked_accounts:
-        linked_token_data = json.loads(acc.token_data)
-        linked_user_info = {"email": acc.linked_email} 
-        background_tasks.add_task(process_emails_task_wrapper, owner_email, linked_user_info, linked_token_data)
+        enqueue_job(
+            "sync_emails", {"owner_email": owner_email, "account_email": acc.linked_email}, session,
+            owner_email=owner_email, account_email=acc.linked_email
+        )
     
     return RedirectResponse(url="/processing", status_code=303)
 
+def parse_backfill_date(value: str) -> Optional[str]:
+    """Normalizes a form date to YYYY-MM-DD, the only form that may reach the
+    Gmail search query. Raises ValueError for anything else."""
+    if not value:
+        return None
+    return datetime.strptime(value, "%Y-%m-%d").date().isoformat()
+
+@router.post("/backfill")
+def trigger_backfill(
+    request: Request,
+    after: str = Form(""),
+    before: str = Form(""),
+    label: str = Form("INBOX"),
+    session: Session = Depends(get_session)
+):
+    user = request.session.get("user")
+    token_data = request.session.get("token")
+    if not user or not token_data:
+        return RedirectResponse(url="/", status_code=303)
+
+    try:
+        after, before = parse_backfill_date(after), parse_backfill_date(before)
+    except ValueError:
+        return JSONResponse({"status": "error", "message": "Dates must be given as YYYY-MM-DD"}, status_code=400)
+
+    owner_email = user['email']
+    label_ids = tuple(name.strip() for name in label.split(",") if name.strip())
+    accounts = [owner_email] + [
+        acc.linked_email
+        for acc in session.exec(
+            select(LinkedAccount).where(LinkedAccount.owner_email == owner_email, LinkedAccount.is_primary == False)
+        ).all()
+    ]
+    set_sync_status(owner_email, 'processing', session)
+    for linked_email in accounts:
+        start_backfill(owner_email, linked_email, session, after=after, before=before, label_ids=label_ids)
+        enqueue_job(
+            "backfill_emails", {"owner_email": owner_email, "account_email": linked_email},
+            session, owner_email=owner_email, account_email=linked_email
+        )
+
+    return RedirectResponse(url="/processing", status_code=303)
+
 @router.get("/processing", response_class=HTMLResponse)
 def processing_page(request: Request):
     user = request.session.get("user")
@@ -52,18 +111,50 @@ def get_sync_status(request: Request, session: Session = Depends(get_session)):
     user = request.session.get("user")
     if not user:
         return JSONResponse({"status": "error", "message": "Not authenticated"}, status_code=401)
-    
+    return JSONResponse(sync_progress_event(session.get(SyncStatus, user['email'])))
+
+def _read_sync_progress(owner_email: str) -> dict:
+    with Session(engine) as session:
+        return sync_progress_event(session.get(SyncStatus, owner_email))
+
+@router.get("/sync-events")
+async def sync_events(request: Request):
+    """Streams progress events as Server-Sent Events. The persisted counters
+    are sent first so reconnecting clients catch up; after that events come
+    from the broker, which on Postgres relays them from every worker process.
+    Without the relay, events only arrive from workers embedded in this
+    process, so when nothing arrives for a while the counters are re-read,
+    at most SSE_MAX_POLLS times per connection."""
+    user = request.session.get("user")
+    if not user:
+        return JSONResponse({"status": "error", "message": "Not authenticated"}, status_code=401)
     owner_email = user['email']
-    status_obj = session.get(SyncStatus, owner_email)
-    
-    if status_obj:
-        status_value = status_obj.status
-        if status_value != 'processing':
-            session.delete(status_obj)
-            session.commit()
-        return JSONResponse({"status": status_value})
-    
-    return JSONResponse({"status": "idle"})
+
+    async def event_stream():
+        queue = progress_broker.subscribe(owner_email)
+        polls_left = 0 if progress_broker.cross_process else SSE_MAX_POLLS
+        try:
+            last_event = await asyncio.to_thread(_read_sync_progress, owner_email)
+            yield f"data: {json.dumps(last_event)}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    if not polls_left:
+                        yield ": keep-alive\n\n"
+                        continue
+                    polls_left -= 1
+                    event = await asyncio.to_thread(_read_sync_progress, owner_email)
+                    if event == last_event:
+                        yield ": keep-alive\n\n"
+                        continue
+                if event.get("type") == "sync":
+                    last_event = event
+                yield f"data: {json.dumps(event)}\n\n"
+        finally:
+            progress_broker.unsubscribe(owner_email, queue)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 @router.get("/emails/{email_id}", response_class=HTMLResponse)
 def view_email(request: Request, email_id: str, session: Session = Depends(get_session)):
@@ -72,22 +163,46 @@ def view_email(request: Request, email_id: str, session: Session = Depends(get_s
     email = session.get(Email, email_id)
     if not email or email.user_email != user['email']:
         return RedirectResponse(url="/categories")
-    return templates.TemplateResponse("email_detail.html", {"request": request, "email": email, "user": user})
+    body = load_email_body(session, email)
+    return templates.TemplateResponse("email_detail.html", {"request": request, "email": email, "body": body, "user": user})
+
+@router.get("/search", response_class=HTMLResponse)
+def search_page(request: Request, q: str = "", cursor: Optional[str] = None, session: Session = Depends(get_session)):
+    user = request.session.get("user")
+    if not user: return RedirectResponse(url="/")
+    try:
+        results, next_cursor = search_emails(session, user['email'], q, cursor) if q.strip() else ([], None)
+    except (ValueError, TypeError):
+        return RedirectResponse(url=f"/search?q={quote(q)}")
+    return templates.TemplateResponse("search.html", {
+        "request": request, "user": user, "query": q, "results": results,
+        "next_cursor": next_cursor, "is_first_page": cursor is None
+    })
 
 @router.post("/cron/sync-all/{secret}")
-async def trigger_cron_sync_all(secret: str, background_tasks: BackgroundTasks, session: Session = Depends(get_session)):
+def trigger_cron_sync_all(secret: str, session: Session = Depends(get_session)):
     if not CRON_SECRET or secret != CRON_SECRET:
         return {"detail": "Not authorized"}
 
-    all_accounts = session.exec(select(LinkedAccount)).all()
-    for account in all_accounts:
-        owner_email = account.owner_email
-        set_sync_status(owner_email, 'processing', session)
-        
-        processing_email = account.linked_email
-        token_data = json.loads(account.token_data)
-        processing_user_info = {"email": processing_email}
-        
-        background_tasks.add_task(process_emails_task_wrapper, owner_email, processing_user_info, token_data)
-
-    return {"status": f"Queued {len(all_accounts)} sync tasks."}
\ No newline at end of file
+    run = schedule_sync_all(session)
+    return {
+        "status": f"Queued {run.queued_accounts} sync tasks.",
+        "run_id": run.id,
+        "queued": run.queued_accounts,
+        "skipped": run.skipped_accounts,
+    }
+
+@router.get("/cron/sync-runs/{run_id}/{secret}")
+def sync_run_progress(run_id: str, secret: str, session: Session = Depends(get_session)):
+    if not CRON_SECRET or secret != CRON_SECRET:
+        return {"detail": "Not authorized"}
+    progress = get_sync_run_progress(run_id, session)
+    if progress is None:
+        return JSONResponse({"detail": "Sync run not found"}, status_code=404)
+    return progress
+
+@router.get("/cron/cache-stats/{secret}")
+def classification_cache_stats(secret: str):
+    if not CRON_SECRET or secret != CRON_SECRET:
+        return {"detail": "Not authorized"}
+    return get_cache_stats()
\ No newline at end of file
@@ -0,0 +1,160 @@
+import os
+import time
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlmodel import Session, select
+
+from app.ai_utils import embed_texts, OTHER_CATEGORY_DESCRIPTION
+from app.classification_cache import category_fingerprint
+from app.email_content import load_email_text
+from app.text_processing import prepare_for_prompt
+from app.models.category import Category
+from app.models.email import Email
+
+EMBEDDING_ROUTER_ENABLED = os.getenv("EMBEDDING_ROUTER_ENABLED", "true").lower() == "true"
+EMBEDDING_ROUTER_MARGIN = float(os.getenv("EMBEDDING_ROUTER_MARGIN", "0.08"))
+EMBEDDING_ROUTER_MIN_SCORE = float(os.getenv("EMBEDDING_ROUTER_MIN_SCORE", "0.5"))
+EMBEDDING_ROUTER_SAMPLES = int(os.getenv("EMBEDDING_ROUTER_SAMPLES", "20"))
+EMBEDDING_ROUTER_REFRESH_SECONDS = int(os.getenv("EMBEDDING_ROUTER_REFRESH_SECONDS", "3600"))
+EMBEDDING_ROUTER_RETRY_SECONDS = int(os.getenv("EMBEDDING_ROUTER_RETRY_SECONDS", "300"))
+EMBEDDING_MAX_TOKENS = int(os.getenv("EMBEDDING_MAX_TOKENS", "512"))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def embed_emails(texts: List[str]) -> Optional[np.ndarray]:
+    return embed_texts([prepare_for_prompt(text, EMBEDDING_MAX_TOKENS) for text in texts])
+
+
+class CategoryRouter:
+    """Routes emails to the nearest category centroid by cosine similarity.
+
+    A centroid is the embedding of the category's name and description plus
+    the mean embedding of emails already filed under it. All centroids form
+    one (categories x dimensions) matrix, so a batch of emails is scored with
+    a single matrix multiply. An optional "Other" centroid competes with the
+    categories; emails nearest to it are left to Gemini."""
+
+    def __init__(
+        self, category_ids: List[str], description_vectors: np.ndarray, fingerprint: str,
+        other_vector: Optional[np.ndarray] = None
+    ):
+        self.category_ids: List[Optional[str]] = list(category_ids)
+        self.fingerprint = fingerprint
+        description_vectors = np.asarray(description_vectors, dtype=np.float32)
+        if other_vector is not None:
+            self.category_ids.append(None)
+            description_vectors = np.vstack([description_vectors, np.asarray(other_vector, dtype=np.float32)])
+        self.descriptions = _normalize(description_vectors)
+        self.sample_sums = np.zeros_like(self.descriptions)
+        self.sample_counts = np.zeros(len(self.category_ids))
+        self.built_at = time.monotonic()
+        self._matrix: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    @property
+    def matrix(self) -> np.ndarray:
+        with self._lock:
+            if self._matrix is None:
+                means = self.sample_sums / np.maximum(self.sample_counts, 1)[:, None]
+                self._matrix = _normalize(self.descriptions + means)
+            return self._matrix
+
+    def learn(self, category_id: str, vectors: np.ndarray):
+        if category_id is None or category_id not in self.category_ids or not len(vectors):
+            return
+        index = self.category_ids.index(category_id)
+        with self._lock:
+            self.sample_sums[index] += _normalize(np.asarray(vectors, dtype=np.float32)).sum(axis=0)
+            self.sample_counts[index] += len(vectors)
+            self._matrix = None
+
+    def route(self, vectors: np.ndarray) -> List[Optional[Tuple[str, float]]]:
+        """Returns (category_id, margin) for each email whose best category
+        beats the runner-up, "Other" included, by EMBEDDING_ROUTER_MARGIN, None
+        for the rest and for emails closest to "Other"."""
+        if not len(vectors):
+            return []
+        scores = _normalize(np.asarray(vectors, dtype=np.float32)) @ self.matrix.T
+        rows = np.arange(len(scores))
+        order = np.argsort(scores, axis=1)
+        best = order[:, -1]
+        best_scores = scores[rows, best]
+        runner_up = scores[rows, order[:, -2]] if len(self.category_ids) > 1 else np.zeros(len(scores))
+        margins = best_scores - runner_up
+        confident = (best_scores >= EMBEDDING_ROUTER_MIN_SCORE) & (margins >= EMBEDDING_ROUTER_MARGIN)
+        return [
+            (self.category_ids[best[i]], float(margins[i])) if confident[i] and self.category_ids[best[i]] else None
+            for i in range(len(scores))
+        ]
+
+
+_routers: Dict[str, CategoryRouter] = {}
+_retry_after: Dict[str, float] = {}
+_routers_lock = threading.Lock()
+
+
+def _build_router(owner_email: str, user_categories: List[Category], fingerprint: str, db_session: Session) -> Optional[CategoryRouter]:
+    categories = sorted(user_categories, key=lambda cat: cat.id)
+    description_vectors = embed_texts(
+        [f"{cat.name}: {cat.description or ''}" for cat in categories] + [f"Other: {OTHER_CATEGORY_DESCRIPTION}"]
+    )
+    if description_vectors is None:
+        return None
+    router = CategoryRouter(
+        [cat.id for cat in categories], description_vectors[:-1], fingerprint, other_vector=description_vectors[-1]
+    )
+
+    samples = []
+    for cat in categories:
+        emails = db_session.exec(
+            select(Email).where(Email.user_email == owner_email, Email.category_id == cat.id)
+            .order_by(Email.sent_at.desc()).limit(EMBEDDING_ROUTER_SAMPLES)
+        ).all()
+        samples.extend((cat.id, load_email_text(db_session, email)) for email in emails)
+    if samples:
+        sample_vectors = embed_emails([text for _, text in samples])
+        if sample_vectors is not None:
+            sample_categories = np.array([category_id for category_id, _ in samples])
+            for cat in categories:
+                router.learn(cat.id, sample_vectors[sample_categories == cat.id])
+    return router
+
+def get_embedding_router(owner_email: str, user_categories: List[Category], db_session: Session) -> Optional[CategoryRouter]:
+    """Returns the owner's router, rebuilding it when the categories change
+    and every EMBEDDING_ROUTER_REFRESH_SECONDS. Returns None when routing is
+    disabled or the embeddings could not be computed, in which case building
+    is retried after EMBEDDING_ROUTER_RETRY_SECONDS."""
+    if not EMBEDDING_ROUTER_ENABLED or not user_categories:
+        return None
+    fingerprint = category_fingerprint(user_categories)
+    with _routers_lock:
+        router = _routers.get(owner_email)
+        retry_after = _retry_after.get(owner_email, 0)
+    if (
+        router is not None
+        and router.fingerprint == fingerprint
+        and time.monotonic() - router.built_at <= EMBEDDING_ROUTER_REFRESH_SECONDS
+    ):
+        return router
+    if time.monotonic() < retry_after:
+        return None
+
+    router = _build_router(owner_email, user_categories, fingerprint, db_session)
+    with _routers_lock:
+        if router is None:
+            _routers.pop(owner_email, None)
+            _retry_after[owner_email] = time.monotonic() + EMBEDDING_ROUTER_RETRY_SECONDS
+        else:
+            _routers[owner_email] = router
+            _retry_after.pop(owner_email, None)
+    return router
+
+def clear_embedding_routers():
+    with _routers_lock:
+        _routers.clear()
+        _retry_after.clear()
@@ -1,86 +1,116 @@
+import os
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from typing import List, Dict
+from typing import List, Dict, Optional
 import base64
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 
-def get_gmail_service(token_data):
-    credentials = Credentials(
+GMAIL_BATCH_SIZE = 50
+GMAIL_BATCH_MODIFY_LIMIT = 1000
+GMAIL_MAX_BODY_BYTES = int(os.getenv("GMAIL_MAX_BODY_BYTES", "1000000"))
+GMAIL_DECODE_CHUNK_BYTES = 64 * 1024
+GMAIL_MIME_MAX_DEPTH = 8
+GMAIL_SCOPES = ['openid', 'email', 'profile', 'https://www.googleapis.com/auth/gmail.readonly', 'https://www.googleapis.com/auth/gmail.modify']
+
+
+def build_credentials(token_data: dict) -> Credentials:
+    expiry = token_data.get("expiry")
+    return Credentials(
         token=token_data["access_token"],
         refresh_token=token_data.get("refresh_token"),
         token_uri="https://oauth2.googleapis.com/token",
         client_id=token_data["client_id"],
         client_secret=token_data["client_secret"],
-        scopes=['openid', 'email', 'profile', 'https://www.googleapis.com/auth/gmail.readonly', 'https://www.googleapis.com/auth/gmail.modify']
+        scopes=GMAIL_SCOPES,
+        # google-auth compares expiry against naive UTC datetimes.
+        expiry=datetime.fromisoformat(expiry).replace(tzinfo=None) if expiry else None
     )
-    service = build("gmail", "v1", credentials=credentials)
-    return service
 
-def list_messages(service, user_id="me", max_results=10) -> List[Dict]:
-    try:
-        response = service.users().messages().list(
-            userId=user_id, maxResults=max_results, labelIds=['INBOX']
-        ).execute()
-        return response.get("messages", [])
-    except HttpError as e:
-        print(f"Error listing messages: {e}")
-        return []
+def refreshed_token_data(client, token_data: dict) -> Optional[dict]:
+    """Returns token_data updated with the client's current access token if
+    the credentials were refreshed since token_data was issued, else None."""
+    credentials = getattr(client, "credentials", None)
+    if not isinstance(credentials, Credentials):
+        return None
+    if not credentials.token or credentials.token == token_data.get("access_token"):
+        return None
+    updated = dict(token_data, access_token=credentials.token)
+    if credentials.expiry:
+        updated["expiry"] = credentials.expiry.replace(tzinfo=timezone.utc).isoformat()
+    return updated
 
-def get_message_details(service, msg_id: str, user_id="me") -> Dict:
+def parse_sent_at(date_header: Optional[str]) -> Optional[datetime]:
+    if not date_header:
+        return None
     try:
-        message = service.users().messages().get(userId=user_id, id=msg_id, format="full").execute()
-        
-        payload = message.get("payload", {})
-        headers = payload.get("headers", [])
-        
-        body_html = ""
-        body_plain = ""
+        sent_at = parsedate_to_datetime(date_header)
+    except (TypeError, ValueError):
+        return None
+    if sent_at.tzinfo is None:
+        sent_at = sent_at.replace(tzinfo=timezone.utc)
+    return sent_at.astimezone(timezone.utc)
 
-        date = next((h['value'] for h in headers if h['name'].lower() == 'date'), None)
-        from_address = next((h['value'] for h in headers if h['name'].lower() == 'from'), None)
+def decode_base64url(data: str, max_bytes: int = GMAIL_MAX_BODY_BYTES) -> bytes:
+    """Decodes Gmail's unpadded URL-safe base64 chunk by chunk, stopping once
+    max_bytes are decoded, so a huge part is never decoded in full."""
+    chunk_chars = GMAIL_DECODE_CHUNK_BYTES // 3 * 4
+    decoded = bytearray()
+    for start in range(0, len(data), chunk_chars):
+        chunk = data[start:start + chunk_chars]
+        decoded += base64.urlsafe_b64decode(chunk + "=" * (-len(chunk) % 4))
+        if len(decoded) >= max_bytes:
+            break
+    return bytes(decoded[:max_bytes])
 
-        def decode_part(part):
-            data = part.get("body", {}).get("data")
-            if data:
-                return base64.urlsafe_b64decode(data).decode("utf-8", errors="ignore")
-            return ""
+def _decode_part(part, max_bytes: int = GMAIL_MAX_BODY_BYTES) -> str:
+    data = part.get("body", {}).get("data")
+    if data:
+        return decode_base64url(data, max_bytes).decode("utf-8", errors="ignore")
+    return ""
 
-        if "parts" in payload:
-            for part in payload["parts"]:
-                if part['mimeType'] == 'text/html':
-                    body_html = decode_part(part)
-                elif part['mimeType'] == 'text/plain':
-                    body_plain = decode_part(part)
-        else:
-            body_plain = decode_part(payload)
-        
-        final_body = body_html if body_html else body_plain
-        
-        return {
-            "id": message['id'],
-            "snippet": message['snippet'],
-            "body": final_body,
-            "date": date,
-            "from": from_address
-        }
-    except HttpError as e:
-        print(f"Error fetching message details for {msg_id}: {e}")
-        return None
-    
-def archive_email(service, msg_id: str, user_id="me"):
-    try:
-        body = {"removeLabelIds": ["INBOX"]}
-        service.users().messages().modify(userId=user_id, id=msg_id, body=body).execute()
-        print(f"Email {msg_id} archived successfully.")
-    except HttpError as e:
-        print(f"Error archiving email {msg_id}: {e}")
+def _is_attachment(part: Dict) -> bool:
+    if part.get("filename"):
+        return True
+    disposition = next((h['value'] for h in part.get("headers", []) if h['name'].lower() == 'content-disposition'), "")
+    return disposition.lower().startswith("attachment")
 
-def batch_delete_emails(service, email_ids: List[str], user_id="me"):
-    if not email_ids:
-        return
-    try:
-        body = {"ids": email_ids}
-        service.users().messages().batchDelete(userId=user_id, body=body).execute()
-        print(f"{len(email_ids)} emails successfully deleted from Gmail.")
-    except HttpError as e:
-        print(f"Error batch deleting emails: {e}")
+def find_body_parts(payload: Dict, depth: int = 0) -> Dict[str, Dict]:
+    """Walks the MIME tree and returns the first text/html and text/plain
+    parts that are not attachments, keyed by mime type. Nested multiparts
+    (alternative inside related inside mixed, forwarded messages) are
+    searched depth first, so parts are found in display order."""
+    found = {}
+    # Without a Content-Type, MIME defaults to text/plain.
+    mime_type = (payload.get("mimeType") or "text/plain").lower()
+    if mime_type in ("text/html", "text/plain") and not _is_attachment(payload):
+        found[mime_type] = payload
+    if depth < GMAIL_MIME_MAX_DEPTH:
+        for part in payload.get("parts", []) or []:
+            for part_type, body_part in find_body_parts(part, depth + 1).items():
+                found.setdefault(part_type, body_part)
+    return found
+
+def select_body_parts(payload: Dict) -> List[Dict]:
+    """Body parts worth decoding, best first: HTML, then plain text."""
+    found = find_body_parts(payload)
+    return [found[mime_type] for mime_type in ("text/html", "text/plain") if mime_type in found]
+
+def parse_message_metadata(message: Dict) -> Dict:
+    """Everything get_message_details returns except the body, from a message
+    in any format."""
+    headers = message.get("payload", {}).get("headers", [])
+
+    def header(name: str) -> Optional[str]:
+        return next((h['value'] for h in headers if h['name'].lower() == name), None)
+
+    date = header('date')
+    return {
+        "id": message['id'],
+        "snippet": message['snippet'],
+        "body": "",
+        "date": date,
+        "sent_at": parse_sent_at(date),
+        "from": header('from'),
+        "list_unsubscribe": header('list-unsubscribe'),
+        "list_unsubscribe_post": header('list-unsubscribe-post')
+    }
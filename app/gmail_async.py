@@ -0,0 +1,428 @@
+import os
+import json
+import asyncio
+import concurrent.futures
+import random
+import threading
+import weakref
+from collections import OrderedDict
+from email.parser import BytesParser
+from urllib.parse import urlencode, urlsplit
+from uuid import uuid4
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+import httpx
+
+from app.gmail import (
+    build_credentials, parse_message_metadata, select_body_parts, decode_base64url, _decode_part,
+    GMAIL_BATCH_SIZE, GMAIL_BATCH_MODIFY_LIMIT, GMAIL_MAX_BODY_BYTES, GMAIL_MIME_MAX_DEPTH
+)
+from app.metrics import GMAIL_REQUESTS, GMAIL_REQUEST_SECONDS, GMAIL_RESPONSE_BYTES
+
+GMAIL_API_URL = os.getenv("GMAIL_API_URL", "https://gmail.googleapis.com/gmail/v1/users")
+GMAIL_BATCH_URL = os.getenv("GMAIL_BATCH_URL", GMAIL_API_URL.rsplit("/gmail/v1/users", 1)[0] + "/batch/gmail/v1")
+GMAIL_FULL_SYNC_MAX_RESULTS = int(os.getenv("GMAIL_FULL_SYNC_MAX_RESULTS", "10"))
+GMAIL_LIST_PAGE_SIZE = int(os.getenv("GMAIL_LIST_PAGE_SIZE", "100"))
+GMAIL_ACCOUNT_CONCURRENCY = int(os.getenv("GMAIL_ACCOUNT_CONCURRENCY", "10"))
+GMAIL_MAX_CONNECTIONS = int(os.getenv("GMAIL_MAX_CONNECTIONS", "100"))
+GMAIL_REQUEST_TIMEOUT = float(os.getenv("GMAIL_REQUEST_TIMEOUT", "30"))
+GMAIL_MAX_RETRIES = int(os.getenv("GMAIL_MAX_RETRIES", "3"))
+GMAIL_CLIENT_CACHE_SIZE = int(os.getenv("GMAIL_CLIENT_CACHE_SIZE", "64"))
+
+_RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class GmailApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Gmail API returned HTTP {status}: {message}")
+        self.status = status
+
+
+# httpx connection pools are bound to the event loop that first uses them, so
+# there is one shared pool per loop: the web server's and the sync bridge's.
+_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+def get_http_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=GMAIL_REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_connections=GMAIL_MAX_CONNECTIONS, max_keepalive_connections=GMAIL_MAX_CONNECTIONS),
+        )
+        _http_clients[loop] = client
+    return client
+
+async def close_http_client():
+    client = _http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def parse_batch_response(content_type: str, content: bytes) -> Dict[str, Tuple[int, dict]]:
+    """Splits a multipart/mixed batch response into {content id: (status,
+    JSON body)}, dropping the "response-" prefix Gmail adds to the ids."""
+    message = BytesParser().parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode("utf-8") + content)
+    results = {}
+    for part in message.get_payload() if message.is_multipart() else []:
+        content_id = (part.get("Content-ID") or "").strip().strip("<>").removeprefix("response-")
+        raw = part.get_payload(decode=True) or b""
+        status_line, _, rest = raw.replace(b"\r\n", b"\n").partition(b"\n")
+        _, _, body = rest.partition(b"\n\n")
+        try:
+            status = int(status_line.split()[1])
+            payload = json.loads(body) if body.strip() else {}
+        except (IndexError, ValueError):
+            status, payload = 502, {"error": {"message": "Unreadable batch response part."}}
+        results[content_id] = (status, payload)
+    return results
+
+
+class AsyncGmailClient:
+    """Gmail REST client for one account on top of the shared httpx pool.
+    At most max_concurrency requests per account are in flight at once, and
+    the access token is refreshed in place when it expires."""
+
+    def __init__(self, token_data: dict, max_concurrency: int = GMAIL_ACCOUNT_CONCURRENCY, user_id: str = "me"):
+        self.credentials = build_credentials(token_data)
+        self.refresh_token = token_data.get("refresh_token")
+        self.max_concurrency = max_concurrency
+        self.user_id = user_id
+        self._loop_primitives = weakref.WeakKeyDictionary()
+
+    def _primitives(self) -> Tuple[asyncio.Semaphore, asyncio.Lock]:
+        loop = asyncio.get_running_loop()
+        primitives = self._loop_primitives.get(loop)
+        if primitives is None:
+            primitives = self._loop_primitives[loop] = (asyncio.Semaphore(self.max_concurrency), asyncio.Lock())
+        return primitives
+
+    async def _refresh(self, stale_token: Optional[str]):
+        _, refresh_lock = self._primitives()
+        async with refresh_lock:
+            if self.credentials.token != stale_token and not self.credentials.expired:
+                return
+            response = await get_http_client().post(self.credentials.token_uri, data={
+                "grant_type": "refresh_token", "refresh_token": self.credentials.refresh_token,
+                "client_id": self.credentials.client_id, "client_secret": self.credentials.client_secret,
+            })
+            if response.status_code != 200:
+                raise GmailApiError(response.status_code, f"token refresh failed: {response.text}")
+            payload = response.json()
+            self.credentials.token = payload["access_token"]
+            # google-auth keeps expiry as a naive UTC datetime.
+            self.credentials.expiry = (datetime.now(timezone.utc) + timedelta(seconds=payload.get("expires_in", 3600))).replace(tzinfo=None)
+
+    async def request(self, method: str, path: str, api_method: str = "other", **kwargs) -> dict:
+        response = await self._send(method, f"{GMAIL_API_URL}/{self.user_id}/{path}", api_method, **kwargs)
+        return response.json() if response.content else {}
+
+    async def _send(self, method: str, url: str, api_method: str, headers: Optional[dict] = None, **kwargs) -> httpx.Response:
+        semaphore, _ = self._primitives()
+        async with semaphore:
+            refreshed = False
+            for attempt in range(GMAIL_MAX_RETRIES + 1):
+                if self.credentials.expired:
+                    await self._refresh(self.credentials.token)
+                token = self.credentials.token
+                try:
+                    with GMAIL_REQUEST_SECONDS.time(method=api_method):
+                        response = await get_http_client().request(
+                            method, url, headers={**(headers or {}), "Authorization": f"Bearer {token}"}, **kwargs
+                        )
+                except httpx.HTTPError:
+                    GMAIL_REQUESTS.inc(method=api_method, status="error")
+                    raise
+                GMAIL_REQUESTS.inc(method=api_method, status=response.status_code)
+                GMAIL_RESPONSE_BYTES.inc(len(response.content), method=api_method)
+                if response.status_code == 401 and not refreshed and self.credentials.refresh_token:
+                    await self._refresh(token)
+                    refreshed = True
+                    continue
+                if response.status_code in _RETRYABLE_STATUSES and attempt < GMAIL_MAX_RETRIES:
+                    await asyncio.sleep(min(2 ** attempt, 30) + random.uniform(0, 1))
+                    continue
+                if response.status_code >= 400:
+                    raise GmailApiError(response.status_code, response.text)
+                return response
+        raise GmailApiError(response.status_code, response.text)
+
+    async def list_messages(
+        self, max_results: int = 10, label_ids: Tuple[str, ...] = ("INBOX",), page_token: Optional[str] = None, query: Optional[str] = None
+    ) -> dict:
+        params = {"maxResults": max_results, "labelIds": list(label_ids)}
+        if page_token:
+            params["pageToken"] = page_token
+        if query:
+            params["q"] = query
+        return await self.request("GET", "messages", api_method="messages.list", params=params)
+
+    async def get_profile(self) -> dict:
+        return await self.request("GET", "profile", api_method="getProfile")
+
+    async def list_history(self, start_history_id: str, page_token: Optional[str] = None) -> dict:
+        params = {"startHistoryId": start_history_id, "historyTypes": "messageAdded", "labelId": "INBOX"}
+        if page_token:
+            params["pageToken"] = page_token
+        return await self.request("GET", "history", api_method="history.list", params=params)
+
+    async def get_message(self, msg_id: str, format: str = "full", metadata_headers: Tuple[str, ...] = (), fields: Optional[str] = None) -> dict:
+        params = {"format": format}
+        if metadata_headers:
+            params["metadataHeaders"] = list(metadata_headers)
+        if fields:
+            params["fields"] = fields
+        return await self.request("GET", f"messages/{msg_id}", api_method="messages.get", params=params)
+
+    async def batch_get_messages(self, msg_ids: List[str], fields: Optional[str] = None) -> Dict[str, Tuple[int, dict]]:
+        """Sends a messages.get (format=full) per id as one request to Gmail's
+        batch endpoint and returns {id: (status, response body)}."""
+        boundary = f"batch_{uuid4().hex}"
+        query = urlencode({"format": "full", **({"fields": fields} if fields else {})})
+        path = f"{urlsplit(GMAIL_API_URL).path}/{self.user_id}/messages"
+        body = "".join(
+            f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <{msg_id}>\r\n\r\n"
+            f"GET {path}/{msg_id}?{query}\r\n\r\n"
+            for msg_id in msg_ids
+        ) + f"--{boundary}--\r\n"
+        response = await self._send(
+            "POST", GMAIL_BATCH_URL, "messages.get.batch", content=body.encode("utf-8"),
+            headers={"Content-Type": f"multipart/mixed; boundary={boundary}"}
+        )
+        return parse_batch_response(response.headers.get("content-type", ""), response.content)
+
+    async def get_attachment(self, msg_id: str, attachment_id: str) -> dict:
+        return await self.request("GET", f"messages/{msg_id}/attachments/{attachment_id}", api_method="messages.attachments.get")
+
+    async def batch_modify(self, msg_ids: List[str], add_label_ids: List[str] = None, remove_label_ids: List[str] = None) -> dict:
+        body = {"ids": msg_ids, "addLabelIds": add_label_ids or [], "removeLabelIds": remove_label_ids or []}
+        return await self.request("POST", "messages/batchModify", api_method="messages.batchModify", json=body)
+
+    async def batch_delete(self, msg_ids: List[str]) -> dict:
+        return await self.request("POST", "messages/batchDelete", api_method="messages.batchDelete", json={"ids": msg_ids})
+
+
+_clients: "OrderedDict[str, AsyncGmailClient]" = OrderedDict()
+_clients_lock = threading.Lock()
+
+def get_async_gmail_client(token_data: dict, account_email: Optional[str] = None) -> AsyncGmailClient:
+    """Returns the client for an account, reusing the one created earlier (and
+    its refreshed token) as long as the refresh token has not changed."""
+    key = account_email or token_data.get("refresh_token") or token_data["access_token"]
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None or client.refresh_token != token_data.get("refresh_token"):
+            client = _clients[key] = AsyncGmailClient(token_data)
+        _clients.move_to_end(key)
+        while len(_clients) > GMAIL_CLIENT_CACHE_SIZE:
+            _clients.popitem(last=False)
+    return client
+
+def clear_async_gmail_clients():
+    with _clients_lock:
+        _clients.clear()
+
+
+async def list_messages(client: AsyncGmailClient, max_results: int = 10) -> List[Dict]:
+    try:
+        response = await client.list_messages(max_results=max_results)
+        return response.get("messages", [])
+    except (GmailApiError, httpx.HTTPError) as e:
+        print(f"Error listing messages: {e}")
+        return []
+
+async def list_messages_page(
+    client: AsyncGmailClient, page_token: Optional[str] = None, query: Optional[str] = None,
+    label_ids: Tuple[str, ...] = ("INBOX",), max_results: int = GMAIL_LIST_PAGE_SIZE
+) -> Tuple[List[Dict], Optional[str]]:
+    """One page of messages.list and the token of the next page (None on the
+    last one). Unlike list_messages, errors are raised, so a backfill can
+    tell a failed page from the end of the mailbox."""
+    response = await client.list_messages(max_results=max_results, label_ids=label_ids, page_token=page_token, query=query)
+    return response.get("messages", []), response.get("nextPageToken")
+
+async def get_current_history_id(client: AsyncGmailClient) -> Optional[str]:
+    try:
+        profile = await client.get_profile()
+        return profile.get("historyId")
+    except (GmailApiError, httpx.HTTPError) as e:
+        print(f"Error fetching mailbox profile: {e}")
+        return None
+
+async def list_history(client: AsyncGmailClient, start_history_id: str) -> Optional[Tuple[List[Dict], Optional[str]]]:
+    """Pages through users.history.list and returns the INBOX messages added
+    since start_history_id together with the newest history ID.
+
+    Returns None when the cursor is no longer valid (Gmail answers 404 once a
+    history ID falls out of its retention window), so the caller can resync.
+    """
+    messages = []
+    seen_ids = set()
+    latest_history_id = start_history_id
+    page_token = None
+    try:
+        while True:
+            response = await client.list_history(start_history_id, page_token=page_token)
+            for record in response.get("history", []):
+                for added in record.get("messagesAdded", []):
+                    message = added.get("message", {})
+                    if 'INBOX' not in message.get("labelIds", []):
+                        continue
+                    if message.get("id") and message["id"] not in seen_ids:
+                        seen_ids.add(message["id"])
+                        messages.append({"id": message["id"], "threadId": message.get("threadId")})
+
+            latest_history_id = response.get("historyId", latest_history_id)
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+        return messages, latest_history_id
+    except GmailApiError as e:
+        if e.status == 404:
+            print(f"History ID {start_history_id} expired, a full resync is required.")
+            return None
+        print(f"Error listing history: {e}")
+        return [], start_history_id
+    except httpx.HTTPError as e:
+        print(f"Error listing history: {e}")
+        return [], start_history_id
+
+async def sync_messages(client: AsyncGmailClient, start_history_id: Optional[str] = None, max_results: int = GMAIL_FULL_SYNC_MAX_RESULTS) -> Tuple[List[Dict], Optional[str]]:
+    """Returns the messages to process and the history ID to store as the new cursor.
+
+    With a cursor only the messages added since then are returned. Without one,
+    or when it has expired, falls back to a full resync of the newest inbox
+    messages and starts a fresh cursor from the current mailbox state.
+    """
+    if start_history_id:
+        result = await list_history(client, start_history_id)
+        if result is not None:
+            return result
+
+    history_id, messages = await asyncio.gather(
+        get_current_history_id(client), list_messages(client, max_results=max_results)
+    )
+    return messages, history_id
+
+def _part_fields(depth: int) -> str:
+    fields = "partId,mimeType,filename,body(size,data,attachmentId)"
+    return f"{fields},parts({_part_fields(depth - 1)})" if depth else fields
+
+# The top-level headers and the MIME tree without part headers; a partial-response
+# mask cannot recurse, so the tree is spelled out to a fixed depth.
+GMAIL_MESSAGE_FIELDS = f"id,snippet,payload(headers,{_part_fields(GMAIL_MIME_MAX_DEPTH)})"
+
+async def _message_details(client: AsyncGmailClient, message: Dict) -> Dict:
+    """Parses a message fetched with GMAIL_MESSAGE_FIELDS, decoding only the
+    best text part. A part Gmail stores by attachmentId is downloaded
+    separately, unless it is over GMAIL_MAX_BODY_BYTES."""
+    details = parse_message_metadata(message)
+    for part in select_body_parts(message.get("payload", {})):
+        body = part.get("body", {})
+        if body.get("data"):
+            details["body"] = _decode_part(part)
+        elif body.get("attachmentId"):
+            if (body.get("size") or 0) > GMAIL_MAX_BODY_BYTES:
+                print(f"Skipping the {part.get('mimeType')} body of {message['id']}, it is {body['size']} bytes.")
+                continue
+            attachment = await client.get_attachment(message['id'], body["attachmentId"])
+            details["body"] = decode_base64url(attachment.get("data") or "").decode("utf-8", errors="ignore")
+        if details["body"]:
+            break
+    return details
+
+async def get_message_details(client: AsyncGmailClient, msg_id: str) -> Dict:
+    """Fetches a message in one request, masked to the fields the app uses."""
+    message = await client.get_message(msg_id, format="full", fields=GMAIL_MESSAGE_FIELDS)
+    return await _message_details(client, message)
+
+async def batch_get_message_details(
+    client: AsyncGmailClient, msg_ids: List[str], batch_size: int = GMAIL_BATCH_SIZE
+) -> Tuple[Dict[str, Dict], Dict[str, str]]:
+    """Fetches messages through Gmail's batch endpoint, batch_size per HTTP
+    request, then downloads attachment-stored bodies concurrently.
+
+    Returns (details_by_id, errors_by_id); a failing message only lands in
+    errors_by_id and never affects the rest of its batch. Messages that got
+    a retryable status are sent again in a smaller batch.
+    """
+    messages = {}
+    details_by_id = {}
+    errors_by_id = {}
+
+    async def fetch_batch(batch_ids: List[str]):
+        for attempt in range(GMAIL_MAX_RETRIES + 1):
+            try:
+                responses = await client.batch_get_messages(batch_ids, fields=GMAIL_MESSAGE_FIELDS)
+            except (GmailApiError, httpx.HTTPError) as e:
+                print(f"Error executing message batch: {e}")
+                for msg_id in batch_ids:
+                    errors_by_id[msg_id] = str(e)
+                return
+            retry_ids = []
+            for msg_id in batch_ids:
+                status, payload = responses.get(msg_id, (502, {"error": {"message": "Missing from the batch response."}}))
+                if status == 200:
+                    messages[msg_id] = payload
+                elif status in _RETRYABLE_STATUSES and attempt < GMAIL_MAX_RETRIES:
+                    retry_ids.append(msg_id)
+                else:
+                    error = GmailApiError(status, json.dumps(payload))
+                    print(f"Error fetching message details for {msg_id}: {error}")
+                    errors_by_id[msg_id] = str(error)
+            if not retry_ids:
+                return
+            batch_ids = retry_ids
+            await asyncio.sleep(min(2 ** attempt, 30) + random.uniform(0, 1))
+
+    async def parse(msg_id: str, message: Dict):
+        try:
+            details_by_id[msg_id] = await _message_details(client, message)
+        except (GmailApiError, httpx.HTTPError, KeyError, ValueError) as e:
+            print(f"Error fetching message details for {msg_id}: {e}")
+            errors_by_id[msg_id] = str(e)
+
+    await asyncio.gather(*(fetch_batch(msg_ids[start:start + batch_size]) for start in range(0, len(msg_ids), batch_size)))
+    await asyncio.gather(*(parse(msg_id, message) for msg_id, message in messages.items()))
+    return details_by_id, errors_by_id
+
+async def batch_archive_emails(client: AsyncGmailClient, msg_ids: List[str]) -> Dict[str, str]:
+    errors_by_id = {}
+    for start in range(0, len(msg_ids), GMAIL_BATCH_MODIFY_LIMIT):
+        chunk = msg_ids[start:start + GMAIL_BATCH_MODIFY_LIMIT]
+        try:
+            await client.batch_modify(chunk, remove_label_ids=["INBOX"])
+            print(f"{len(chunk)} emails archived successfully.")
+        except (GmailApiError, httpx.HTTPError) as e:
+            print(f"Error archiving {len(chunk)} emails: {e}")
+            for msg_id in chunk:
+                errors_by_id[msg_id] = str(e)
+    return errors_by_id
+
+async def batch_delete_emails(client: AsyncGmailClient, msg_ids: List[str]):
+    if not msg_ids:
+        return
+    try:
+        await client.batch_delete(msg_ids)
+        print(f"{len(msg_ids)} emails successfully deleted from Gmail.")
+    except (GmailApiError, httpx.HTTPError) as e:
+        print(f"Error batch deleting emails: {e}")
+
+
+_bridge_loop: Optional[asyncio.AbstractEventLoop] = None
+_bridge_lock = threading.Lock()
+
+def submit_gmail(coroutine) -> concurrent.futures.Future:
+    """Schedules a Gmail coroutine from synchronous code (the job workers) on
+    one background event loop, so all worker threads share its connection
+    pool and their requests interleave instead of each blocking a thread."""
+    global _bridge_loop
+    with _bridge_lock:
+        if _bridge_loop is None:
+            _bridge_loop = asyncio.new_event_loop()
+            threading.Thread(target=_bridge_loop.run_forever, name="gmail-io", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coroutine, _bridge_loop)
+
+def run_gmail(coroutine):
+    """Runs a Gmail coroutine to completion with submit_gmail."""
+    return submit_gmail(coroutine).result()
@@ -0,0 +1,139 @@
+import os
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import and_, or_, func, tuple_, update
+from sqlmodel import Session, select
+
+from app.db import engine
+from app.metrics import registry, Gauge
+from app.models.job import Job
+
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_VISIBILITY_TIMEOUT = int(os.getenv("JOB_VISIBILITY_TIMEOUT", "900"))
+JOB_RETRY_BASE_DELAY = int(os.getenv("JOB_RETRY_BASE_DELAY", "30"))
+JOB_MAX_RUNNING_PER_OWNER = int(os.getenv("JOB_MAX_RUNNING_PER_OWNER", "1"))
+JOB_HEARTBEAT_INTERVAL = int(os.getenv("JOB_HEARTBEAT_INTERVAL", "60"))
+
+
+def enqueue_job(
+    kind: str, payload: dict, db_session: Session, max_attempts: int = JOB_MAX_ATTEMPTS,
+    owner_email: Optional[str] = None, account_email: Optional[str] = None, run_id: Optional[str] = None
+) -> Job:
+    job = Job(
+        kind=kind, payload=json.dumps(payload), max_attempts=max_attempts,
+        owner_email=owner_email, account_email=account_email, run_id=run_id
+    )
+    db_session.add(job)
+    db_session.commit()
+    return job
+
+def claim_job(db_session: Session, visibility_timeout: int = JOB_VISIBILITY_TIMEOUT) -> Optional[Job]:
+    """Claims the next runnable job: a queued job that is due, or a running
+    job whose worker let its visibility timeout expire without finishing.
+
+    Postgres skips rows other workers have locked. SQLite has no row locks, so
+    the claim is a compare-and-set on (status, attempts) and losing the race
+    simply returns None.
+
+    Jobs of an owner that already has JOB_MAX_RUNNING_PER_OWNER jobs of the
+    same kind running are passed over, so the workers are shared across
+    owners instead of going to whoever queued the most. The cap is per kind:
+    an owner's long sync does not hold back their unsubscribe job.
+    """
+    now = datetime.now(timezone.utc)
+    busy_owner_kinds = (
+        select(Job.owner_email, Job.kind)
+        .where(Job.status == "running", Job.locked_until >= now, Job.owner_email.is_not(None))
+        .group_by(Job.owner_email, Job.kind)
+        .having(func.count() >= JOB_MAX_RUNNING_PER_OWNER)
+    )
+    statement = select(Job).where(
+        or_(
+            and_(Job.status == "queued", Job.run_after <= now),
+            and_(Job.status == "running", Job.locked_until < now, Job.attempts < Job.max_attempts),
+        ),
+        or_(Job.owner_email.is_(None), tuple_(Job.owner_email, Job.kind).not_in(busy_owner_kinds)),
+    ).order_by(Job.run_after).limit(1)
+    if db_session.get_bind().dialect.name == "postgresql":
+        statement = statement.with_for_update(skip_locked=True)
+
+    job = db_session.exec(statement).first()
+    if not job:
+        db_session.rollback()
+        return None
+
+    result = db_session.execute(
+        update(Job)
+        .where(Job.id == job.id, Job.status == job.status, Job.attempts == job.attempts)
+        .values(
+            status="running", attempts=job.attempts + 1,
+            locked_until=now + timedelta(seconds=visibility_timeout), updated_at=now
+        )
+    )
+    db_session.commit()
+    if result.rowcount != 1:
+        return None
+    db_session.refresh(job)
+    return job
+
+def extend_lease(job_id: str, attempts: int, db_session: Session, visibility_timeout: int = JOB_VISIBILITY_TIMEOUT) -> bool:
+    """Pushes the lock of a running job forward. Returns False when the job
+    is no longer held by this attempt (it was re-claimed or finished)."""
+    now = datetime.now(timezone.utc)
+    result = db_session.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == "running", Job.attempts == attempts)
+        .values(locked_until=now + timedelta(seconds=visibility_timeout), updated_at=now)
+    )
+    db_session.commit()
+    return result.rowcount == 1
+
+def _finish_attempt(job: Job, db_session: Session, **values) -> bool:
+    # Compare-and-set on (id, attempts): a worker whose lease expired and was
+    # re-claimed must not overwrite the state of the newer attempt. The job
+    # should be detached (see worker.run_next_job) so that its attempts are
+    # the ones claimed, not reloaded from the database.
+    values.update(locked_until=None, updated_at=datetime.now(timezone.utc))
+    result = db_session.execute(
+        update(Job).where(Job.id == job.id, Job.status == "running", Job.attempts == job.attempts).values(**values)
+    )
+    db_session.commit()
+    if result.rowcount != 1:
+        print(f"Job {job.id} attempt {job.attempts} lost its lease, leaving its status to the current attempt.")
+        return False
+    for name, value in values.items():
+        setattr(job, name, value)
+    return True
+
+def complete_job(job: Job, db_session: Session) -> bool:
+    return _finish_attempt(job, db_session, status="completed")
+
+def fail_job(job: Job, error: str, db_session: Session) -> bool:
+    """Puts the job back in the queue with exponential backoff, or marks it
+    failed once it has used all of its attempts."""
+    if job.attempts >= job.max_attempts:
+        return _finish_attempt(job, db_session, status="failed", last_error=error)
+    run_after = datetime.now(timezone.utc) + timedelta(seconds=JOB_RETRY_BASE_DELAY * 2 ** (job.attempts - 1))
+    return _finish_attempt(job, db_session, status="queued", last_error=error, run_after=run_after)
+
+def fail_abandoned_jobs(db_session: Session) -> int:
+    """Marks running jobs failed when their lock expired after the last attempt."""
+    now = datetime.now(timezone.utc)
+    result = db_session.execute(
+        update(Job)
+        .where(Job.status == "running", Job.locked_until < now, Job.attempts >= Job.max_attempts)
+        .values(status="failed", last_error="Visibility timeout expired on the last attempt.", updated_at=now)
+    )
+    db_session.commit()
+    return result.rowcount
+
+def queue_depth() -> dict:
+    """Unfinished jobs by (kind, status), for the job_queue_depth gauge."""
+    with Session(engine) as session:
+        rows = session.exec(
+            select(Job.kind, Job.status, func.count()).where(Job.status.in_(["queued", "running"])).group_by(Job.kind, Job.status)
+        ).all()
+    return {(kind, status): count for kind, status, count in rows}
+
+registry.register(Gauge("job_queue_depth", "Queued and running jobs by kind and status.", ["kind", "status"], callback=queue_depth))
@@ -0,0 +1,179 @@
+import os
+import re
+import html
+import time
+import threading
+from collections import Counter, defaultdict
+from email.utils import parseaddr
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlmodel import Session, select
+
+from app.models.category import Category
+from app.models.email import Email
+
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.9"))
+LOCAL_CLASSIFIER_MIN_EXAMPLES = int(os.getenv("LOCAL_CLASSIFIER_MIN_EXAMPLES", "20"))
+LOCAL_CLASSIFIER_REFRESH_SECONDS = int(os.getenv("LOCAL_CLASSIFIER_REFRESH_SECONDS", "3600"))
+SENDER_RULE_MIN_EMAILS = int(os.getenv("SENDER_RULE_MIN_EMAILS", "3"))
+# Label sources worth learning from: Gemini's answers, fresh or from the
+# classification cache. Labels the local model, the embedding router or a
+# near-duplicate produced would only feed the model its own guesses.
+TRAINING_LABEL_SOURCES = ("llm", "cache")
+# Unrelated people share these domains, so their sender rules use the full address.
+FREEMAIL_DOMAINS = frozenset(os.getenv(
+    "FREEMAIL_DOMAINS",
+    "gmail.com,googlemail.com,outlook.com,hotmail.com,live.com,msn.com,yahoo.com,ymail.com,icloud.com,me.com,"
+    "mac.com,aol.com,proton.me,protonmail.com,gmx.com,gmx.net,mail.com,yandex.com,zoho.com,fastmail.com"
+).split(","))
+
+_TOKEN_RE = re.compile(r"[a-z0-9]{2,}")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+
+def sender_domain(from_address: str) -> str:
+    address = parseaddr(from_address or "")[1].lower()
+    return address.rsplit("@", 1)[-1] if "@" in address else address
+
+def sender_key(from_address: str) -> str:
+    """What sender rules are keyed on: the domain, or the full address for freemail domains."""
+    domain = sender_domain(from_address)
+    return parseaddr(from_address or "")[1].lower() if domain in FREEMAIL_DOMAINS else domain
+
+def _tokenize(from_address: str, snippet: str) -> List[str]:
+    tokens = _TOKEN_RE.findall(html.unescape(snippet or "").lower())
+    address = parseaddr(from_address or "")[1].lower()
+    tokens.append(f"from:{address}")
+    tokens.append(f"domain:{sender_domain(from_address)}")
+    return tokens
+
+def extractive_summary(snippet: str, max_length: int = 200) -> str:
+    text = html.unescape(snippet or "").strip()
+    first_sentence = _SENTENCE_END_RE.split(text, maxsplit=1)[0]
+    if len(first_sentence) > max_length:
+        first_sentence = first_sentence[:max_length].rsplit(" ", 1)[0] + "..."
+    return first_sentence
+
+
+class LocalClassifier:
+    """Per-user sender rules (by domain, or by address for freemail senders)
+    plus a multinomial naive Bayes model over the sender and snippet of
+    emails the LLM has already categorized."""
+
+    def __init__(self, category_ids: List[str], alpha: float = 1.0):
+        self.category_ids = list(category_ids)
+        self.class_index = {category_id: i for i, category_id in enumerate(self.category_ids)}
+        self.alpha = alpha
+        self.vocabulary: Dict[str, int] = {}
+        self.word_counts = np.zeros((len(self.category_ids), 256))
+        self.class_doc_counts = np.zeros(len(self.category_ids))
+        self.sender_counts: Dict[str, Counter] = defaultdict(Counter)
+        self.trained_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def example_count(self) -> int:
+        return int(self.class_doc_counts.sum())
+
+    def _token_index(self, token: str) -> int:
+        index = self.vocabulary.get(token)
+        if index is None:
+            index = len(self.vocabulary)
+            self.vocabulary[token] = index
+            if index >= self.word_counts.shape[1]:
+                grown = np.zeros((self.word_counts.shape[0], self.word_counts.shape[1] * 2))
+                grown[:, :self.word_counts.shape[1]] = self.word_counts
+                self.word_counts = grown
+        return index
+
+    def learn(self, from_address: str, snippet: str, category_id: str):
+        class_index = self.class_index.get(category_id)
+        if class_index is None:
+            return
+        with self._lock:
+            for token in _tokenize(from_address, snippet):
+                self.word_counts[class_index, self._token_index(token)] += 1
+            self.class_doc_counts[class_index] += 1
+            self.sender_counts[sender_key(from_address)][category_id] += 1
+
+    def _predict_by_sender(self, from_address: str) -> Optional[Tuple[str, float]]:
+        counts = self.sender_counts.get(sender_key(from_address))
+        if not counts:
+            return None
+        total = sum(counts.values())
+        if total < SENDER_RULE_MIN_EMAILS:
+            return None
+        category_id, top = counts.most_common(1)[0]
+        # The +1 keeps a sender seen only a handful of times from reaching full confidence.
+        return category_id, top / (total + 1)
+
+    def _predict_by_content(self, from_address: str, snippet: str) -> Optional[Tuple[str, float]]:
+        if self.example_count < LOCAL_CLASSIFIER_MIN_EXAMPLES:
+            return None
+        vocabulary_size = len(self.vocabulary)
+        doc = np.zeros(vocabulary_size)
+        for token in _tokenize(from_address, snippet):
+            index = self.vocabulary.get(token)
+            if index is not None:
+                doc[index] += 1
+        if not doc.any():
+            return None
+
+        counts = self.word_counts[:, :vocabulary_size]
+        log_likelihood = np.log(counts + self.alpha) - np.log(counts.sum(axis=1, keepdims=True) + self.alpha * vocabulary_size)
+        log_prior = np.log((self.class_doc_counts + 1) / (self.class_doc_counts.sum() + len(self.category_ids)))
+        scores = log_prior + log_likelihood @ doc
+        probabilities = np.exp(scores - scores.max())
+        probabilities /= probabilities.sum()
+        best = int(probabilities.argmax())
+        return self.category_ids[best], float(probabilities[best])
+
+    def predict(self, from_address: str, snippet: str) -> Optional[Tuple[str, float]]:
+        """Returns (category_id, confidence) from whichever signal is more confident."""
+        with self._lock:
+            predictions = [
+                prediction for prediction in (
+                    self._predict_by_sender(from_address),
+                    self._predict_by_content(from_address, snippet),
+                ) if prediction
+            ]
+        if not predictions:
+            return None
+        return max(predictions, key=lambda prediction: prediction[1])
+
+
+_classifiers: Dict[str, LocalClassifier] = {}
+_classifiers_lock = threading.Lock()
+
+
+def _train_from_table(owner_email: str, category_ids: List[str], db_session: Session) -> LocalClassifier:
+    classifier = LocalClassifier(category_ids)
+    rows = db_session.exec(
+        select(Email.from_address, Email.snippet, Email.category_id)
+        .where(Email.user_email == owner_email, Email.label_source.in_(TRAINING_LABEL_SOURCES))
+    ).all()
+    for from_address, snippet, category_id in rows:
+        classifier.learn(from_address, snippet, category_id)
+    return classifier
+
+def get_local_classifier(owner_email: str, user_categories: List[Category], db_session: Session) -> LocalClassifier:
+    """Returns the owner's classifier, training it from the Email table the
+    first time, whenever the category set changes, and every
+    LOCAL_CLASSIFIER_REFRESH_SECONDS so rows stored by other workers are picked up."""
+    category_ids = sorted(cat.id for cat in user_categories)
+    with _classifiers_lock:
+        classifier = _classifiers.get(owner_email)
+    if (
+        classifier is None
+        or sorted(classifier.category_ids) != category_ids
+        or time.monotonic() - classifier.trained_at > LOCAL_CLASSIFIER_REFRESH_SECONDS
+    ):
+        classifier = _train_from_table(owner_email, category_ids, db_session)
+        with _classifiers_lock:
+            _classifiers[owner_email] = classifier
+    return classifier
+
+def clear_local_classifiers():
+    with _classifiers_lock:
+        _classifiers.clear()
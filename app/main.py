@@ -1,17 +1,22 @@
 import os
+import asyncio
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 load_dotenv(encoding='utf-8')
 
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
 
 from app.db import create_db_and_tables
 from app import auth, category_routes, email_routes
+from app.worker import start_workers, stop_workers, close_job_resources
+from app.gmail_async import close_http_client
+from app.progress import progress_broker
+from app.metrics import registry
 
 from app.models import linked_account
 
@@ -19,12 +24,22 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 if not SECRET_KEY:
     raise ValueError("SECRET_KEY was not set in the environment variables")
 
+EMBEDDED_WORKERS = int(os.getenv("EMBEDDED_WORKERS", "1"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("Starting the application...")
     create_db_and_tables()
+    workers = start_workers(EMBEDDED_WORKERS) if EMBEDDED_WORKERS > 0 else None
+    progress_broker.start_listener()
     yield
     print("Finishing application...")
+    progress_broker.stop_listener()
+    if workers:
+        stop_workers(*workers)
+    await asyncio.to_thread(close_job_resources)
+    await close_http_client()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -47,6 +62,12 @@ def dashboard(request: Request):
         return RedirectResponse(url="/")
     return templates.TemplateResponse("dashboard.html", {"request": request, "user": user})
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return PlainTextResponse("Not authorized", status_code=401)
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/privacy", response_class=HTMLResponse)
 def privacy_policy(request: Request):
     return templates.TemplateResponse("privacy.html", {"request": request})
@@ -0,0 +1,234 @@
+import time
+import inspect
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(label_names: Sequence[str], labels: Dict[str, str]) -> Tuple[str, ...]:
+    return tuple(str(labels.get(name, "")) for name in label_names)
+
+def _format_labels(label_names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(label_names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(self.label_names, labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(self.label_names, labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket (non-cumulative) counts, then sum and count.
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def timed(self, **labels) -> Callable:
+        """Decorator form of time(), for sync and async functions."""
+        def decorator(function):
+            if inspect.iscoroutinefunction(function):
+                @wraps(function)
+                async def async_wrapper(*args, **kwargs):
+                    with self.time(**labels):
+                        return await function(*args, **kwargs)
+                return async_wrapper
+
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.time(**labels):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, **labels) -> int:
+        series = self._series.get(_label_key(self.label_names, labels))
+        return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', _format_value(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class Gauge:
+    """A gauge whose values are computed by a callback at scrape time, so it
+    costs nothing between scrapes. The callback returns {label values: value}."""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (), callback: Callable = None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.callback() if self.callback else {}
+        except Exception as e:
+            print(f"Error collecting metric {self.name}: {e}")
+            return lines
+        for key, value in sorted(values.items()):
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+GMAIL_REQUESTS = registry.register(Counter(
+    "gmail_requests_total", "Gmail API requests by API method and HTTP status.", ["method", "status"]))
+GMAIL_REQUEST_SECONDS = registry.register(Histogram(
+    "gmail_request_seconds", "Gmail API request latency by API method.", ["method"]))
+GMAIL_RESPONSE_BYTES = registry.register(Counter(
+    "gmail_response_bytes_total", "Bytes of Gmail API response bodies by API method.", ["method"]))
+GEMINI_REQUEST_SECONDS = registry.register(Histogram(
+    "gemini_request_seconds", "Gemini call latency by calling function and outcome.", ["function", "outcome"]))
+GEMINI_TOKENS = registry.register(Counter(
+    "gemini_tokens_total", "Gemini tokens by calling function and kind (prompt or response).", ["function", "kind"]))
+CLASSIFICATIONS = registry.register(Counter(
+    "email_classifications_total", "Emails classified by source (cache, local, embedding, llm).", ["source"]))
+EMAIL_PROMPT_TOKENS = registry.register(Counter(
+    "email_prompt_tokens_total", "Estimated tokens of email bodies sent to Gemini, by stage (html, text, prompt).", ["stage"]))
+DB_QUERY_SECONDS = registry.register(Histogram(
+    "db_query_seconds", "Database statement latency by statement type.", ["statement"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)))
+SYNC_EMAILS = registry.register(Counter(
+    "sync_emails_total", "Emails handled by syncs by outcome (classified, skipped, errors).", ["outcome"]))
+SYNC_THROUGHPUT = registry.register(Histogram(
+    "sync_emails_per_second", "Throughput of each completed account sync.", [],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100)))
+SYNC_SECONDS = registry.register(Histogram(
+    "sync_seconds", "Duration of each completed account sync.", [],
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)))
+BROWSER_SESSION_SECONDS = registry.register(Histogram(
+    "browser_session_seconds", "Time a Playwright browser context stays open.", [],
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)))
+
+
+def serve_metrics(port: int) -> ThreadingHTTPServer:
+    """Serves /metrics from a background thread, for processes without a web
+    app of their own (the standalone job worker)."""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+def instrument_engine(engine):
+    """Times every statement the engine executes."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_times", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start_times = conn.info.get("query_start_times")
+        if start_times:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - start_times.pop(), statement=statement.lstrip().split(" ", 1)[0].upper())
+
+def record_gemini_usage(function: str, response):
+    usage = getattr(response, "usage_metadata", None)
+    for kind, attribute in (("prompt", "prompt_token_count"), ("response", "candidates_token_count")):
+        count = getattr(usage, attribute, None)
+        if isinstance(count, int):
+            GEMINI_TOKENS.inc(count, function=function, kind=kind)
@@ -0,0 +1,145 @@
+import argparse
+import json
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from app.db import engine, create_db_and_tables
+from app.gmail import parse_sent_at
+from app.email_content import store_email_contents, load_email_text
+from app.search import index_emails
+from app.text_processing import prepare_for_prompt
+from app.ai_utils import AI_MAX_EMAIL_TOKENS
+from app.near_duplicates import simhash, sender_address
+from app.models.email import Email
+from app.models.job import Job
+
+MIGRATION_BATCH_SIZE = 500
+
+
+def backfill_sent_at(db_session: Session) -> int:
+    """Parses the stored Date header into sent_at for rows synced before the column existed."""
+    updated = 0
+    last_id = ""
+    while True:
+        rows = db_session.exec(
+            select(Email.id, Email.sent_date)
+            .where(Email.sent_at.is_(None), Email.id > last_id)
+            .order_by(Email.id).limit(MIGRATION_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        for email_id, sent_date in rows:
+            sent_at = parse_sent_at(sent_date)
+            if sent_at:
+                db_session.execute(update(Email).where(Email.id == email_id).values(sent_at=sent_at))
+                updated += 1
+        last_id = rows[-1].id
+        db_session.commit()
+    return updated
+
+def move_bodies_to_content_table(db_session: Session) -> int:
+    """Moves legacy Email.body values into the compressed, deduplicated content table."""
+    moved = 0
+    last_id = ""
+    while True:
+        rows = db_session.exec(
+            select(Email.id, Email.body)
+            .where(Email.body.is_not(None), Email.content_hash.is_(None), Email.id > last_id)
+            .order_by(Email.id).limit(MIGRATION_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        hashes = store_email_contents(db_session, [body for _, body in rows])
+        for (email_id, _), body_hash in zip(rows, hashes):
+            db_session.execute(update(Email).where(Email.id == email_id).values(content_hash=body_hash, body=None))
+        moved += len(rows)
+        last_id = rows[-1].id
+        db_session.commit()
+    return moved
+
+def rebuild_search_index(db_session: Session) -> int:
+    """Indexes every stored email for full-text search, replacing existing entries."""
+    indexed = 0
+    last_id = ""
+    while True:
+        emails = db_session.exec(
+            select(Email).where(Email.id > last_id).order_by(Email.id).limit(MIGRATION_BATCH_SIZE)
+        ).all()
+        if not emails:
+            break
+        index_emails(db_session, [
+            dict(id=email.id, user_email=email.user_email, summary=email.summary, from_address=email.from_address,
+                 snippet=email.snippet, body_text=load_email_text(db_session, email))
+            for email in emails
+        ])
+        indexed += len(emails)
+        last_id = emails[-1].id
+        db_session.commit()
+    return indexed
+
+def backfill_simhashes(db_session: Session) -> int:
+    """Computes the sender address and SimHash of emails synced before near-duplicate detection."""
+    updated = 0
+    last_id = ""
+    while True:
+        emails = db_session.exec(
+            select(Email).where(Email.simhash.is_(None), Email.id > last_id).order_by(Email.id).limit(MIGRATION_BATCH_SIZE)
+        ).all()
+        if not emails:
+            break
+        for email in emails:
+            text = prepare_for_prompt(load_email_text(db_session, email), AI_MAX_EMAIL_TOKENS)
+            db_session.execute(update(Email).where(Email.id == email.id).values(
+                sender_address=sender_address(email.from_address), simhash=simhash(text)
+            ))
+        updated += len(emails)
+        last_id = emails[-1].id
+        db_session.commit()
+    return updated
+
+def strip_job_credentials(db_session: Session) -> int:
+    """Rewrites sync and backfill jobs queued with OAuth tokens in their payload
+    to name only the account; their handlers load the token from LinkedAccount."""
+    updated = 0
+    last_id = ""
+    while True:
+        jobs = db_session.exec(
+            select(Job).where(Job.kind.in_(["sync_emails", "backfill_emails"]), Job.id > last_id)
+            .order_by(Job.id).limit(MIGRATION_BATCH_SIZE)
+        ).all()
+        if not jobs:
+            break
+        for job in jobs:
+            payload = json.loads(job.payload)
+            if "token_data" not in payload and "processing_user_info" not in payload:
+                continue
+            owner_email = payload.get("owner_email") or job.owner_email
+            account_email = (payload.get("processing_user_info") or {}).get("email") or job.account_email or owner_email
+            db_session.execute(update(Job).where(Job.id == job.id).values(
+                payload=json.dumps({"owner_email": owner_email, "account_email": account_email})
+            ))
+            updated += 1
+        last_id = jobs[-1].id
+        db_session.commit()
+    return updated
+
+MIGRATIONS = {
+    "sent-at": backfill_sent_at,
+    "bodies": move_bodies_to_content_table,
+    "search-index": rebuild_search_index,
+    "simhash": backfill_simhashes,
+    "job-credentials": strip_job_credentials,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Run one-off data migrations.")
+    parser.add_argument("migration", choices=sorted(MIGRATIONS))
+    args = parser.parse_args()
+
+    create_db_and_tables()
+    with Session(engine) as session:
+        count = MIGRATIONS[args.migration](session)
+    print(f"Migration '{args.migration}' updated {count} rows.")
+
+if __name__ == "__main__":
+    main()
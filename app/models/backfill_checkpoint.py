@@ -0,0 +1,18 @@
+from sqlmodel import SQLModel, Field
+from typing import Optional
+from datetime import datetime, timezone
+
+class BackfillCheckpoint(SQLModel, table=True):
+    linked_email: str = Field(primary_key=True)
+    owner_email: str = Field(index=True)
+    after: Optional[str] = None
+    before: Optional[str] = None
+    label_ids: str = Field(default="INBOX")
+    page_token: Optional[str] = None
+    last_message_id: Optional[str] = None
+    pages_done: int = Field(default=0)
+    processed: int = Field(default=0)
+    status: str = Field(default="running")
+    started_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    completed_at: Optional[datetime] = None
@@ -0,0 +1,10 @@
+from sqlmodel import SQLModel, Field
+from datetime import datetime, timezone
+
+class ClassificationCache(SQLModel, table=True):
+    key: str = Field(primary_key=True)
+    user_email: str = Field(index=True)
+    category_fingerprint: str = Field(index=True)
+    summary: str
+    category: str
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -1,14 +1,34 @@
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Index, Column, BigInteger
 from typing import Optional
+from datetime import datetime
 
 class Email(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_email_user_email_sender_address", "user_email", "sender_address"),
+    )
+
     id: str = Field(primary_key=True)
     user_email: str = Field(index=True)
     summary: str
     snippet: str
     sent_date: str
+    sent_at: Optional[datetime] = None
     from_address: str
+    sender_address: Optional[str] = None
+    simhash: Optional[int] = Field(default=None, sa_column=Column(BigInteger))
     body: Optional[str] = None
+    content_hash: Optional[str] = Field(default=None, foreign_key="emailcontent.content_hash", index=True)
+    list_unsubscribe: Optional[str] = None
+    list_unsubscribe_post: Optional[str] = None
+    label_source: Optional[str] = None
 
     category_id: Optional[str] = Field(default=None, foreign_key="category.id")
-    category: Optional["Category"] = Relationship(back_populates="emails")
\ No newline at end of file
+    category: Optional["Category"] = Relationship(back_populates="emails")
+
+# Matches the category listing's ORDER BY sent_at DESC NULLS LAST, id DESC. SQLite
+# rejects NULLS LAST in an index but already sorts NULLs last when descending.
+Index(
+    "ix_email_category_sent_at_desc", Email.category_id, Email.sent_at.desc().nulls_last(), Email.id.desc()
+).ddl_if(dialect="postgresql")
+Index("ix_email_category_sent_at_desc", Email.category_id, Email.sent_at.desc(), Email.id.desc()).ddl_if(dialect="sqlite")
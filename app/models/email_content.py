@@ -0,0 +1,10 @@
+from sqlmodel import SQLModel, Field
+from sqlalchemy import Column, LargeBinary
+from datetime import datetime, timezone
+
+class EmailContent(SQLModel, table=True):
+    content_hash: str = Field(primary_key=True)
+    html: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    text: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    size: int
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
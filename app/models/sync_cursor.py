@@ -0,0 +1,8 @@
+from sqlmodel import SQLModel, Field
+from typing import Optional
+from datetime import datetime, timezone
+
+class SyncCursor(SQLModel, table=True):
+    linked_email: str = Field(primary_key=True)
+    history_id: Optional[str] = None
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
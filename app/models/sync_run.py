@@ -0,0 +1,11 @@
+from sqlmodel import SQLModel, Field
+from typing import Optional
+from datetime import datetime, timezone
+from uuid import uuid4
+
+class SyncRun(SQLModel, table=True):
+    id: str = Field(default_factory=lambda: str(uuid4()), primary_key=True)
+    queued_accounts: int = Field(default=0)
+    skipped_accounts: int = Field(default=0)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    finished_scheduling_at: Optional[datetime] = None
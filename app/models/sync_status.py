@@ -1,5 +1,16 @@
 from sqlmodel import SQLModel, Field
+from typing import Optional
+from datetime import datetime
 
 class SyncStatus(SQLModel, table=True):
     owner_email: str = Field(primary_key=True)
-    status: str
\ No newline at end of file
+    status: str
+    total: Optional[int] = Field(default=0)
+    fetched: Optional[int] = Field(default=0)
+    classified: Optional[int] = Field(default=0)
+    archived: Optional[int] = Field(default=0)
+    skipped: Optional[int] = Field(default=0)
+    errors: Optional[int] = Field(default=0)
+    duplicates: Optional[int] = Field(default=0)
+    started_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
@@ -0,0 +1,16 @@
+from sqlmodel import SQLModel, Field
+from typing import Optional
+from datetime import datetime, timezone
+from uuid import uuid4
+
+class UnsubscribeResult(SQLModel, table=True):
+    id: str = Field(default_factory=lambda: str(uuid4()), primary_key=True)
+    batch_id: str = Field(index=True)
+    owner_email: str = Field(index=True)
+    email_id: str
+    from_address: Optional[str] = None
+    status: str = Field(default="pending")
+    success: Optional[bool] = None
+    reason: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -0,0 +1,112 @@
+import os
+import re
+import difflib
+import hashlib
+from collections import defaultdict
+from email.utils import parseaddr
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlmodel import Session, select
+
+from app.models.email import Email
+
+SIMHASH_MAX_DISTANCE = int(os.getenv("SIMHASH_MAX_DISTANCE", "6"))
+NEAR_DUPLICATE_CANDIDATES = int(os.getenv("NEAR_DUPLICATE_CANDIDATES", "200"))
+
+_WORD_RE = re.compile(r"\w+")
+_DIGITS_RE = re.compile(r"\d")
+
+
+def sender_address(from_address: str) -> str:
+    return parseaddr(from_address or "")[1].lower()
+
+def _features(text: str) -> List[str]:
+    # Digits are masked so order numbers, prices and dates don't count as differences.
+    words = [_DIGITS_RE.sub("0", word) for word in _WORD_RE.findall((text or "").lower())]
+    if len(words) < 2:
+        return words
+    return [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+def simhash(text: str) -> Optional[int]:
+    """64-bit SimHash over word pairs, as a signed integer so it fits a
+    BIGINT column. Returns None for text without words."""
+    features = _features(text)
+    if not features:
+        return None
+    digests = np.frombuffer(
+        b"".join(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest() for feature in features),
+        dtype=">u8",
+    )
+    bits = np.unpackbits(digests.view(np.uint8).reshape(-1, 8), axis=1)
+    majority = bits.sum(axis=0) * 2 > len(features)
+    return int.from_bytes(np.packbits(majority).tobytes(), "big", signed=True)
+
+def hamming_distances(value: int, candidates: List[int]) -> np.ndarray:
+    xor = np.array(candidates, dtype=np.int64) ^ np.int64(value)
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+def find_near_duplicates(owner_email: str, emails: List[dict], db_session: Session) -> Dict[str, Tuple[Email, int]]:
+    """Matches fetched emails (with "from" and "simhash") against the owner's
+    stored emails from the same sender. Returns {id: (stored email, distance)}
+    for those within SIMHASH_MAX_DISTANCE bits."""
+    by_sender = defaultdict(list)
+    for details in emails:
+        if details.get("simhash") is not None:
+            by_sender[sender_address(details['from'])].append(details)
+
+    matches = {}
+    for sender, sender_emails in by_sender.items():
+        if not sender:
+            continue
+        candidates = db_session.exec(
+            select(Email).where(
+                Email.user_email == owner_email, Email.sender_address == sender, Email.simhash.is_not(None)
+            ).order_by(Email.sent_at.desc()).limit(NEAR_DUPLICATE_CANDIDATES)
+        ).all()
+        if not candidates:
+            continue
+        hashes = [candidate.simhash for candidate in candidates]
+        for details in sender_emails:
+            distances = hamming_distances(details['simhash'], hashes)
+            best = int(distances.argmin())
+            if distances[best] <= SIMHASH_MAX_DISTANCE:
+                matches[details['id']] = (candidates[best], int(distances[best]))
+    return matches
+
+def templated_summary(summary: str, matched_text: str, new_text: str) -> Optional[str]:
+    """Rewrites a near-duplicate's summary for the new email by swapping the
+    words that changed between the two texts (names, numbers, dates).
+    Returns None when the summary mentions a changed word that has no
+    one-to-one replacement, or when the rewritten summary still has a number
+    that the new text lacks."""
+    old_words = _WORD_RE.findall(matched_text or "")
+    new_words = _WORD_RE.findall(new_text or "")
+    replacements = {}
+    removed = set()
+    kept = set()
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(a=old_words, b=new_words, autojunk=False).get_opcodes():
+        if tag == "replace" and i2 - i1 == j2 - j1:
+            for old, new in zip(old_words[i1:i2], new_words[j1:j2]):
+                if replacements.get(old, new) != new:
+                    removed.add(old)
+                replacements[old] = new
+        elif tag in ("replace", "delete"):
+            removed.update(old_words[i1:i2])
+        elif tag == "equal":
+            kept.update(old_words[i1:i2])
+    # A word that also appears unchanged is ambiguous, so it is left alone.
+    replacements = {old: new for old, new in replacements.items() if old not in kept and old not in removed}
+    removed -= kept
+
+    def replace(match: re.Match) -> str:
+        return replacements.get(match.group(0), match.group(0))
+
+    if any(word in removed for word in _WORD_RE.findall(summary or "")):
+        return None
+    rewritten = _WORD_RE.sub(replace, summary or "")
+    # Order numbers, amounts and dates the diff did not cover must not leak into the new summary.
+    new_vocabulary = set(new_words)
+    if any(_DIGITS_RE.search(word) and word not in new_vocabulary for word in _WORD_RE.findall(rewritten)):
+        return None
+    return rewritten
@@ -0,0 +1,157 @@
+import os
+import json
+import select
+import asyncio
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Optional, Set, Tuple
+from sqlalchemy import text
+
+from app.db import engine
+from app.models.sync_status import SyncStatus
+
+PROGRESS_QUEUE_SIZE = 100
+PROGRESS_CHANNEL = "progress_events"
+PROGRESS_LISTEN_RETRY_SECONDS = float(os.getenv("PROGRESS_LISTEN_RETRY_SECONDS", "5"))
+SYNC_COUNTERS = ("total", "fetched", "classified", "archived", "skipped", "errors", "duplicates")
+
+
+class ProgressBroker:
+    """Pub/sub for progress events, keyed by owner email.
+
+    publish() can be called from any thread (the job workers run in threads);
+    each subscriber is an asyncio queue read on the event loop that created it.
+    A slow subscriber loses its oldest events rather than blocking publishers.
+
+    Given a Postgres engine, events are published with NOTIFY and reach
+    subscribers through the LISTEN thread started with start_listener(), so
+    events from separate worker processes arrive too. Without one they only
+    reach subscribers in the publishing process.
+    """
+
+    def __init__(self, queue_size: int = PROGRESS_QUEUE_SIZE, notify_engine=None):
+        self.queue_size = queue_size
+        self.notify_engine = notify_engine
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = defaultdict(set)
+        self._listener: Optional[threading.Thread] = None
+        self._stop_listening = threading.Event()
+
+    @property
+    def cross_process(self) -> bool:
+        return self._listener is not None
+
+    def subscribe(self, owner_email: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers[owner_email].add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, owner_email: str, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(owner_email, set())
+            subscribers.difference_update({entry for entry in subscribers if entry[1] is queue})
+            if not subscribers:
+                self._subscribers.pop(owner_email, None)
+
+    def subscriber_count(self, owner_email: str) -> int:
+        with self._lock:
+            return len(self._subscribers.get(owner_email, ()))
+
+    def publish(self, owner_email: str, event: dict):
+        if self.notify_engine is None:
+            self.deliver(owner_email, event)
+            return
+        try:
+            with self.notify_engine.connect() as connection:
+                connection.execute(
+                    text("SELECT pg_notify(:channel, :payload)"),
+                    {"channel": PROGRESS_CHANNEL, "payload": json.dumps({"owner_email": owner_email, "event": event})}
+                )
+                connection.commit()
+        except Exception as e:
+            print(f"Could not publish a progress event for {owner_email}: {e}")
+
+    def deliver(self, owner_email: str, event: dict):
+        """Hands an event to this process's subscribers."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(owner_email, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, event)
+            except RuntimeError:
+                self.unsubscribe(owner_email, queue)
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, event: dict):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+    def start_listener(self):
+        """Starts delivering events published by any process. Does nothing
+        without a Postgres engine."""
+        if self.notify_engine is None or self._listener is not None:
+            return
+        self._stop_listening.clear()
+        self._listener = threading.Thread(target=self._listen, name="progress-listener", daemon=True)
+        self._listener.start()
+
+    def stop_listener(self):
+        if self._listener is None:
+            return
+        self._stop_listening.set()
+        self._listener.join()
+        self._listener = None
+
+    def _listen(self):
+        while not self._stop_listening.is_set():
+            connection = None
+            try:
+                connection = self.notify_engine.raw_connection()
+                dbapi_connection = connection.driver_connection
+                dbapi_connection.autocommit = True
+                with dbapi_connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {PROGRESS_CHANNEL}")
+                while not self._stop_listening.is_set():
+                    if select.select([dbapi_connection], [], [], 1.0) == ([], [], []):
+                        continue
+                    dbapi_connection.poll()
+                    while dbapi_connection.notifies:
+                        message = json.loads(dbapi_connection.notifies.pop(0).payload)
+                        self.deliver(message["owner_email"], message["event"])
+            except Exception as e:
+                print(f"Progress listener failed, reconnecting in {PROGRESS_LISTEN_RETRY_SECONDS}s: {e}")
+                self._stop_listening.wait(PROGRESS_LISTEN_RETRY_SECONDS)
+            finally:
+                if connection is not None:
+                    # The connection is left listening and in autocommit, so it must not go back to the pool.
+                    connection.invalidate()
+
+
+def sync_progress_event(status_obj: Optional[SyncStatus]) -> dict:
+    """The SSE payload for a sync: status, counters and an ETA in seconds
+    extrapolated from the rate so far. Every listed message ends up counted
+    once as classified, skipped or errors; archived and duplicates (reused
+    from a near-duplicate email) are subsets of classified."""
+    if status_obj is None:
+        return {"type": "sync", "status": "idle"}
+    event = {"type": "sync", "status": status_obj.status}
+    for name in SYNC_COUNTERS:
+        event[name] = getattr(status_obj, name) or 0
+
+    event["duplicate_rate"] = round(event["duplicates"] / event["classified"], 3) if event["classified"] else 0.0
+    done = event["classified"] + event["skipped"] + event["errors"]
+    remaining = max(0, event["total"] - done)
+    event["eta_seconds"] = None
+    if status_obj.status == "processing" and status_obj.started_at and done and remaining:
+        started_at = status_obj.started_at
+        if started_at.tzinfo is None:
+            started_at = started_at.replace(tzinfo=timezone.utc)
+        elapsed = (datetime.now(timezone.utc) - started_at).total_seconds()
+        event["eta_seconds"] = round(elapsed / done * remaining)
+    return event
+
+
+progress_broker = ProgressBroker(notify_engine=engine if engine.dialect.name == "postgresql" else None)
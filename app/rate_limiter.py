@@ -0,0 +1,92 @@
+import os
+import time
+import random
+import asyncio
+import threading
+
+GEMINI_REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "15"))
+GEMINI_TOKENS_PER_MINUTE = float(os.getenv("GEMINI_TOKENS_PER_MINUTE", "1000000"))
+
+
+class RateLimiter:
+    """Token-bucket limiter with one bucket for requests and one for tokens.
+
+    Callers reserve capacity up front and are told how long to wait, so
+    concurrent callers queue behind each other instead of all firing at once.
+    Each rate-limit error halves the allowed rate (down to min_rate_fraction)
+    and every success slowly restores it.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        min_rate_fraction: float = 0.1,
+        recovery_step: float = 0.05,
+        base_backoff: float = 2.0,
+        max_backoff: float = 60.0,
+        clock=time.monotonic,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.min_rate_fraction = min_rate_fraction
+        self.recovery_step = recovery_step
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.rate_fraction = 1.0
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._request_allowance = requests_per_minute
+        self._token_allowance = tokens_per_minute
+        self._consecutive_failures = 0
+        self._last_refill = clock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        request_capacity = self.requests_per_minute * self.rate_fraction
+        token_capacity = self.tokens_per_minute * self.rate_fraction
+        self._request_allowance = min(request_capacity, self._request_allowance + request_capacity * elapsed / 60)
+        self._token_allowance = min(token_capacity, self._token_allowance + token_capacity * elapsed / 60)
+
+    def reserve(self, tokens: int = 0) -> float:
+        """Takes one request and `tokens` tokens from the buckets and returns
+        the number of seconds the caller has to wait before using them."""
+        with self._lock:
+            self._refill(self._clock())
+            token_capacity = self.tokens_per_minute * self.rate_fraction
+            tokens = min(tokens, token_capacity)
+            self._request_allowance -= 1
+            self._token_allowance -= tokens
+
+            request_wait = -self._request_allowance * 60 / (self.requests_per_minute * self.rate_fraction)
+            token_wait = -self._token_allowance * 60 / token_capacity if token_capacity else 0
+            return max(0.0, request_wait, token_wait)
+
+    def acquire(self, tokens: int = 0):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int = 0):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            self.rate_fraction = min(1.0, self.rate_fraction + self.recovery_step)
+
+    def record_rate_limited(self) -> float:
+        """Lowers the allowed rate and returns a jittered backoff delay in seconds."""
+        with self._lock:
+            self._refill(self._clock())
+            self._consecutive_failures += 1
+            self.rate_fraction = max(self.min_rate_fraction, self.rate_fraction / 2)
+            self._request_allowance = min(self._request_allowance, 0)
+            backoff = min(self.max_backoff, self.base_backoff * 2 ** (self._consecutive_failures - 1))
+            return random.uniform(backoff / 2, backoff)
+
+
+gemini_limiter = RateLimiter(GEMINI_REQUESTS_PER_MINUTE, GEMINI_TOKENS_PER_MINUTE)
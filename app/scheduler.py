@@ -0,0 +1,97 @@
+import os
+import json
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from sqlalchemy import func, update
+from sqlmodel import Session, select
+
+from app.db import insert_ignoring_conflicts
+from app.models.job import Job
+from app.models.linked_account import LinkedAccount
+from app.models.sync_run import SyncRun
+from app.models.sync_status import SyncStatus
+from app.progress import SYNC_COUNTERS
+
+SCHEDULER_PAGE_SIZE = int(os.getenv("SCHEDULER_PAGE_SIZE", "200"))
+SYNC_JOB_KIND = "sync_emails"
+
+
+def sync_job(owner_email: str, account_email: str, run_id: Optional[str] = None) -> Job:
+    return Job(
+        kind=SYNC_JOB_KIND, payload=json.dumps({"owner_email": owner_email, "account_email": account_email}),
+        owner_email=owner_email, account_email=account_email, run_id=run_id
+    )
+
+def mark_owners_processing(owner_emails: List[str], db_session: Session):
+    """set_sync_status for many owners with two statements instead of a commit each. Does not commit."""
+    owner_emails = sorted(set(owner_emails))
+    if not owner_emails:
+        return
+    insert_ignoring_conflicts(db_session, SyncStatus, [{"owner_email": email, "status": "processing"} for email in owner_emails])
+    now = datetime.now(timezone.utc)
+    db_session.execute(
+        update(SyncStatus).where(SyncStatus.owner_email.in_(owner_emails))
+        .values(status="processing", started_at=now, updated_at=now, **{name: 0 for name in SYNC_COUNTERS})
+    )
+
+def _accounts_with_pending_sync(account_emails: List[str], db_session: Session) -> set:
+    return set(db_session.exec(
+        select(Job.account_email).where(
+            Job.kind == SYNC_JOB_KIND, Job.status.in_(["queued", "running"]), Job.account_email.in_(account_emails)
+        )
+    ).all())
+
+def schedule_sync_all(db_session: Session, page_size: int = SCHEDULER_PAGE_SIZE) -> SyncRun:
+    """Queues a sync job for every linked account and returns the run they
+    belong to. Accounts are read a page at a time, each page is written with
+    one commit, and accounts whose previous sync is still queued or running
+    are skipped. The job workers do the syncing."""
+    run = SyncRun()
+    db_session.add(run)
+    db_session.commit()
+
+    last_id = 0
+    while True:
+        accounts = db_session.exec(
+            select(LinkedAccount).where(LinkedAccount.id > last_id).order_by(LinkedAccount.id).limit(page_size)
+        ).all()
+        if not accounts:
+            break
+        last_id = accounts[-1].id
+
+        pending = _accounts_with_pending_sync([account.linked_email for account in accounts], db_session)
+        jobs = []
+        for account in accounts:
+            if account.linked_email in pending:
+                run.skipped_accounts += 1
+                continue
+            pending.add(account.linked_email)
+            jobs.append(sync_job(account.owner_email, account.linked_email, run_id=run.id))
+
+        mark_owners_processing([job.owner_email for job in jobs], db_session)
+        db_session.add_all(jobs)
+        run.queued_accounts += len(jobs)
+        db_session.add(run)
+        db_session.commit()
+
+    run.finished_scheduling_at = datetime.now(timezone.utc)
+    db_session.add(run)
+    db_session.commit()
+    return run
+
+def get_sync_run_progress(run_id: str, db_session: Session) -> Dict:
+    run = db_session.get(SyncRun, run_id)
+    if not run:
+        return None
+    counts = dict(db_session.exec(
+        select(Job.status, func.count()).where(Job.run_id == run_id).group_by(Job.status)
+    ).all())
+    jobs = {status: counts.get(status, 0) for status in ("queued", "running", "completed", "failed")}
+    return {
+        "run_id": run.id,
+        "created_at": run.created_at.isoformat(),
+        "queued_accounts": run.queued_accounts,
+        "skipped_accounts": run.skipped_accounts,
+        "jobs": jobs,
+        "finished": run.finished_scheduling_at is not None and jobs["queued"] + jobs["running"] == 0,
+    }
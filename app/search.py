@@ -0,0 +1,160 @@
+import os
+import re
+import json
+import base64
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import text
+from sqlmodel import Session, select
+
+from app.models.email import Email
+
+SEARCH_PAGE_SIZE = 20
+# Postgres rejects a tsvector over 1 MB, which fails the whole batch insert.
+SEARCH_MAX_BODY_CHARS = int(os.getenv("SEARCH_MAX_BODY_CHARS", "100000"))
+
+# Column weights for bm25() in the order the FTS5 table declares them; the id
+# column never matches and the owner column only filters, so both weigh nothing.
+_FTS5_WEIGHTS = "0.0, 0.0, 10.0, 5.0, 3.0, 1.0"
+_FTS5_COLUMNS = "email_id UNINDEXED, user_email, summary, from_address, snippet, body_text"
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _dialect(bind) -> str:
+    return bind.dialect.name
+
+def create_search_index(engine):
+    """Creates the full-text index next to the email table: a tsvector column
+    with a GIN index on Postgres, an FTS5 virtual table everywhere else. An
+    FTS5 table from before the owner column was indexed is recreated empty
+    and has to be refilled with `python -m app.migrate search-index`."""
+    with engine.begin() as connection:
+        if _dialect(engine) == "postgresql":
+            connection.execute(text(
+                "CREATE TABLE IF NOT EXISTS email_search ("
+                "email_id TEXT PRIMARY KEY, user_email TEXT NOT NULL, document TSVECTOR NOT NULL)"
+            ))
+            connection.execute(text("CREATE INDEX IF NOT EXISTS ix_email_search_document ON email_search USING GIN (document)"))
+            connection.execute(text("CREATE INDEX IF NOT EXISTS ix_email_search_user_email ON email_search (user_email)"))
+        else:
+            existing = connection.execute(text("SELECT sql FROM sqlite_master WHERE name = 'email_search'")).scalar()
+            if existing and _FTS5_COLUMNS not in existing:
+                connection.execute(text("DROP TABLE email_search"))
+                print("Recreated the search index, run `python -m app.migrate search-index` to fill it.")
+            connection.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS email_search USING fts5({_FTS5_COLUMNS}, "
+                "tokenize = 'unicode61 remove_diacritics 2')"
+            ))
+
+def drop_search_index(engine):
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE IF EXISTS email_search"))
+
+def index_emails(db_session: Session, documents: List[Dict]):
+    """Adds or replaces index entries. Each document holds id, user_email,
+    summary, from_address, snippet and body_text. Does not commit."""
+    if not documents:
+        return
+    params = [
+        {
+            "email_id": document["id"], "user_email": document["user_email"],
+            "summary": document.get("summary") or "", "from_address": document.get("from_address") or "",
+            "snippet": document.get("snippet") or "", "body_text": document.get("body_text") or "",
+        }
+        for document in documents
+    ]
+    if _dialect(db_session.get_bind()) == "postgresql":
+        for param in params:
+            param["body_text"] = param["body_text"][:SEARCH_MAX_BODY_CHARS]
+        db_session.execute(text(
+            "INSERT INTO email_search (email_id, user_email, document) VALUES (:email_id, :user_email, "
+            "setweight(to_tsvector('simple', :summary), 'A') || setweight(to_tsvector('simple', :from_address), 'B') || "
+            "setweight(to_tsvector('simple', :snippet), 'C') || setweight(to_tsvector('simple', :body_text), 'D')) "
+            "ON CONFLICT (email_id) DO UPDATE SET user_email = EXCLUDED.user_email, document = EXCLUDED.document"
+        ), params)
+    else:
+        remove_emails(db_session, [param["email_id"] for param in params])
+        db_session.execute(text(
+            "INSERT INTO email_search (email_id, user_email, summary, from_address, snippet, body_text) "
+            "VALUES (:email_id, :user_email, :summary, :from_address, :snippet, :body_text)"
+        ), params)
+
+def remove_emails(db_session: Session, email_ids: List[str]):
+    """Drops index entries. Does not commit."""
+    if not email_ids:
+        return
+    db_session.execute(
+        text("DELETE FROM email_search WHERE email_id = :email_id"),
+        [{"email_id": email_id} for email_id in email_ids]
+    )
+
+def _fts5_query(query: str, user_email: str) -> str:
+    # Quoting every token keeps user input from being read as FTS5 syntax;
+    # the trailing * lets the last word match as a prefix while typing. The
+    # owner column filter lets FTS5 narrow to the user's rows itself.
+    tokens = _TOKEN_RE.findall(query)
+    if not tokens:
+        return ""
+    words = " ".join(f'"{token}"' for token in tokens[:-1]) + f' "{tokens[-1]}"*'
+    owner = user_email.replace('"', '""')
+    return f'user_email:"{owner}" AND ({words})'
+
+def encode_search_cursor(score: float, email_id: str) -> str:
+    raw = json.dumps([score, email_id])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_search_cursor(cursor: str) -> Tuple[float, str]:
+    score, email_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    return float(score), str(email_id)
+
+def search_emails(
+    db_session: Session, user_email: str, query: str, cursor: Optional[str] = None, page_size: int = SEARCH_PAGE_SIZE
+) -> Tuple[List, Optional[str]]:
+    """Returns one page of the user's emails matching the query, best match
+    first, and the cursor of the next page (None on the last page).
+
+    The cursor is the (score, id) of the last result, so a page continues
+    from it instead of ranking and skipping every earlier match."""
+    params = {"user_email": user_email, "limit": page_size + 1}
+    after = ""
+    if cursor:
+        params["score"], params["email_id"] = decode_search_cursor(cursor)
+
+    if _dialect(db_session.get_bind()) == "postgresql":
+        if not _TOKEN_RE.search(query):
+            return [], None
+        params["query"] = query
+        if cursor:
+            after = "WHERE score < :score OR (score = :score AND email_id > :email_id) "
+        # float8 so the score survives the round trip through the cursor exactly.
+        statement = text(
+            "SELECT email_id, score FROM ("
+            "SELECT email_id, ts_rank(document, q)::float8 AS score "
+            "FROM email_search, websearch_to_tsquery('simple', :query) AS q "
+            "WHERE user_email = :user_email AND document @@ q) AS ranked "
+            f"{after}ORDER BY score DESC, email_id LIMIT :limit"
+        )
+    else:
+        params["query"] = _fts5_query(query, user_email)
+        if not params["query"]:
+            return [], None
+        if cursor:
+            after = "AND (score > :score OR (score = :score AND email_id > :email_id)) "
+        statement = text(
+            "SELECT email_id, score FROM ("
+            f"SELECT email_id, user_email, bm25(email_search, {_FTS5_WEIGHTS}) AS score "
+            "FROM email_search WHERE email_search MATCH :query) "
+            f"WHERE user_email = :user_email {after}ORDER BY score, email_id LIMIT :limit"
+        )
+
+    ranked = db_session.execute(statement, params).all()
+    next_cursor = encode_search_cursor(ranked[page_size - 1][1], ranked[page_size - 1][0]) if len(ranked) > page_size else None
+    ranked_ids = [row[0] for row in ranked[:page_size]]
+    if not ranked_ids:
+        return [], None
+
+    rows = db_session.exec(
+        select(Email.id, Email.from_address, Email.summary, Email.snippet, Email.sent_date, Email.category_id)
+        .where(Email.id.in_(ranked_ids), Email.user_email == user_email)
+    ).all()
+    rows_by_id = {row.id: row for row in rows}
+    return [rows_by_id[email_id] for email_id in ranked_ids if email_id in rows_by_id], next_cursor
@@ -1,81 +1,532 @@
+import os
+import json
 import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import func, update
 from sqlmodel import Session, select
 from google.api_core.exceptions import ResourceExhausted
-from sqlalchemy.exc import IntegrityError
 
-from app.db import engine
-from app.gmail import get_gmail_service, list_messages, get_message_details, archive_email
-from app.ai_utils import summarize_and_categorize_email
+from app.db import engine, insert_ignoring_conflicts
+from app.job_queue import enqueue_job
+from app.gmail import refreshed_token_data, GMAIL_BATCH_SIZE
+from app.gmail_async import (
+    GmailApiError, get_async_gmail_client, run_gmail, submit_gmail, sync_messages, list_messages_page, batch_get_message_details, batch_archive_emails
+)
+from app.ai_utils import summarize_and_categorize_emails, AI_BATCH_SIZE, AI_MAX_EMAIL_TOKENS
+from app.classification_cache import (
+    category_fingerprint, cache_key, lookup_classifications, store_classifications, purge_stale_entries
+)
+from app.email_content import content_hash, store_email_contents, load_email_body, load_email_text
+from app.text_processing import html_to_text, prepare_for_prompt, estimate_tokens
+from app.search import index_emails
+from app.unsubscribe import unsubscribe_emails
+from app.progress import progress_broker, sync_progress_event, SYNC_COUNTERS
+from app.metrics import SYNC_EMAILS, SYNC_SECONDS, SYNC_THROUGHPUT, EMAIL_PROMPT_TOKENS, CLASSIFICATIONS
+from app.local_classifier import get_local_classifier, extractive_summary, LOCAL_CLASSIFIER_THRESHOLD, LocalClassifier, TRAINING_LABEL_SOURCES
+from app.embedding_router import get_embedding_router, embed_emails, CategoryRouter
+from app.near_duplicates import find_near_duplicates, templated_summary, simhash, sender_address
 from app.models.category import Category
 from app.models.email import Email
 from app.models.sync_status import SyncStatus
+from app.models.sync_cursor import SyncCursor
+from app.models.linked_account import LinkedAccount
+from app.models.backfill_checkpoint import BackfillCheckpoint
+from app.models.unsubscribe_result import UnsubscribeResult
+
+BACKFILL_JOB_SECONDS = int(os.getenv("BACKFILL_JOB_SECONDS", "600"))
 
 def set_sync_status(owner_email: str, status: str, db_session: Session):
+    """Sets the status and publishes it. Starting a sync ('processing') also
+    resets the progress counters."""
+    now = datetime.now(timezone.utc)
+    status_obj = db_session.get(SyncStatus, owner_email)
+    if not status_obj:
+        status_obj = SyncStatus(owner_email=owner_email, status=status)
+    status_obj.status = status
+    status_obj.updated_at = now
+    if status == 'processing':
+        for name in SYNC_COUNTERS:
+            setattr(status_obj, name, 0)
+        status_obj.started_at = now
+    db_session.add(status_obj)
+    db_session.commit()
+    progress_broker.publish(owner_email, sync_progress_event(status_obj))
+
+def record_sync_progress(owner_email: str, db_session: Session, **increments: int):
+    """Adds to the owner's persisted progress counters (atomically, since the
+    owner's accounts may sync in parallel) and publishes the new totals."""
+    values = {name: func.coalesce(getattr(SyncStatus, name), 0) + count for name, count in increments.items() if count}
+    if not values:
+        return
+    for outcome in ("classified", "skipped", "errors"):
+        if increments.get(outcome):
+            SYNC_EMAILS.inc(increments[outcome], outcome=outcome)
+    values["updated_at"] = datetime.now(timezone.utc)
+    db_session.execute(update(SyncStatus).where(SyncStatus.owner_email == owner_email).values(**values))
+    db_session.commit()
     status_obj = db_session.get(SyncStatus, owner_email)
     if status_obj:
-        status_obj.status = status
+        db_session.refresh(status_obj)
+        progress_broker.publish(owner_email, sync_progress_event(status_obj))
+
+def save_sync_cursor(linked_email: str, history_id: str, db_session: Session):
+    cursor = db_session.get(SyncCursor, linked_email)
+    if cursor:
+        cursor.history_id = history_id
+        cursor.updated_at = datetime.now(timezone.utc)
     else:
-        status_obj = SyncStatus(owner_email=owner_email, status=status)
-        db_session.add(status_obj)
+        cursor = SyncCursor(linked_email=linked_email, history_id=history_id)
+        db_session.add(cursor)
     db_session.commit()
 
+def save_refreshed_token(linked_email: str, token_data: dict, client, db_session: Session) -> dict:
+    """Writes a token the Gmail client refreshed back to the linked accounts
+    so the next sync starts with it. Returns the current token data."""
+    updated = refreshed_token_data(client, token_data)
+    if not updated:
+        return token_data
+    accounts = db_session.exec(select(LinkedAccount).where(LinkedAccount.linked_email == linked_email)).all()
+    for account in accounts:
+        account.token_data = json.dumps(dict(json.loads(account.token_data), **updated))
+    db_session.commit()
+    return updated
+
+def load_account_token(owner_email: str, linked_email: str, db_session: Session) -> Optional[dict]:
+    """Token data of one of the owner's linked accounts. Jobs read it when they
+    run, so OAuth credentials are never copied into job payloads."""
+    account = db_session.exec(
+        select(LinkedAccount).where(LinkedAccount.owner_email == owner_email, LinkedAccount.linked_email == linked_email)
+    ).first()
+    return json.loads(account.token_data) if account else None
+
+def record_prompt_tokens(emails: List[dict]):
+    """Records estimated token counts of emails about to be sent to Gemini,
+    before and after preprocessing."""
+    if not emails:
+        return
+    stages = {
+        "html": sum(estimate_tokens(details.get("body")) for details in emails),
+        "text": sum(estimate_tokens(details['text']) for details in emails),
+        "prompt": sum(estimate_tokens(details['prompt_text']) for details in emails),
+    }
+    for stage, tokens in stages.items():
+        EMAIL_PROMPT_TOKENS.inc(tokens, stage=stage)
+    print(f"Preprocessed {len(emails)} emails for Gemini: ~{stages['html']} tokens of HTML, "
+          f"~{stages['text']} of text, ~{stages['prompt']} sent.")
+
+def classify_emails(
+    fetched: List[dict], owner_email: str, user_categories: List[Category], fingerprint: str,
+    local_classifier: LocalClassifier, db_session: Session, router: Optional[CategoryRouter] = None
+) -> Tuple[Dict[str, dict], Dict[str, str]]:
+    """Resolves {"summary", "category"} for each fetched email, cheapest source
+    first: the classification cache, the local classifier, a near-duplicate
+    already stored, the embedding router, then Gemini for the emails none of
+    them is sure about. Also returns which of those sources ("cache", "local",
+    "duplicate", "embedding" or "llm") labeled each email."""
+    category_map = {cat.name: cat for cat in user_categories}
+    category_names = {cat.id: cat.name for cat in user_categories}
+
+    keys_by_id = {details['id']: cache_key(details['text'], fingerprint) for details in fetched}
+    cached = lookup_classifications(list(keys_by_id.values()), db_session)
+    results = {msg_id: cached[key] for msg_id, key in keys_by_id.items() if key in cached}
+    sources = dict.fromkeys(results, "cache")
+    CLASSIFICATIONS.inc(len(results), source="cache")
+
+    uncached = []
+    for details in fetched:
+        if details['id'] in results:
+            continue
+        prediction = local_classifier.predict(details['from'], details['snippet'])
+        if prediction and prediction[1] >= LOCAL_CLASSIFIER_THRESHOLD:
+            results[details['id']] = {
+                "summary": extractive_summary(details['snippet']),
+                "category": category_names[prediction[0]]
+            }
+            sources[details['id']] = "local"
+            CLASSIFICATIONS.inc(source="local")
+        else:
+            uncached.append(details)
+
+    if uncached:
+        matches = find_near_duplicates(owner_email, uncached, db_session)
+        undecided = []
+        for details in uncached:
+            match = matches.get(details['id'])
+            if match and match[0].category_id in category_names:
+                matched = match[0]
+                matched_text = load_email_text(db_session, matched)
+                if matched_text:
+                    summary = templated_summary(
+                        matched.summary, prepare_for_prompt(matched_text, AI_MAX_EMAIL_TOKENS), details['prompt_text']
+                    )
+                else:
+                    summary = templated_summary(matched.summary, matched.snippet, details['snippet'])
+                results[details['id']] = {
+                    "summary": summary or extractive_summary(details['snippet']),
+                    "category": category_names[matched.category_id]
+                }
+                sources[details['id']] = "duplicate"
+                CLASSIFICATIONS.inc(source="duplicate")
+            else:
+                undecided.append(details)
+        uncached = undecided
+
+    record_prompt_tokens(uncached)
+    vectors_by_id = {}
+    if router and uncached:
+        vectors = embed_emails([details['prompt_text'] for details in uncached])
+        if vectors is not None:
+            routes = router.route(vectors)
+            unrouted = []
+            for index, details in enumerate(uncached):
+                if routes[index]:
+                    results[details['id']] = {
+                        "summary": extractive_summary(details['snippet']),
+                        "category": category_names[routes[index][0]]
+                    }
+                    sources[details['id']] = "embedding"
+                    CLASSIFICATIONS.inc(source="embedding")
+                else:
+                    vectors_by_id[details['id']] = vectors[index]
+                    unrouted.append(details)
+            uncached = unrouted
+
+    for ai_start in range(0, len(uncached), AI_BATCH_SIZE):
+        ai_batch = uncached[ai_start:ai_start + AI_BATCH_SIZE]
+        batch_results = summarize_and_categorize_emails(
+            [{"id": details['id'], "body": details['prompt_text']} for details in ai_batch],
+            user_categories
+        )
+        results.update(batch_results)
+        sources.update(dict.fromkeys(batch_results, "llm"))
+        CLASSIFICATIONS.inc(len(batch_results), source="llm")
+        store_classifications(
+            {keys_by_id[msg_id]: result for msg_id, result in batch_results.items()
+             if result.get("summary") and result.get("category") in category_map},
+            owner_email, fingerprint, db_session
+        )
+        if router:
+            for msg_id, result in batch_results.items():
+                if msg_id in vectors_by_id and result.get("category") in category_map:
+                    router.learn(category_map[result["category"]].id, vectors_by_id[msg_id][None, :])
+
+    return results, sources
+
+def prepare_classifiers(owner_email: str, user_categories: List[Category], db_session: Session) -> Tuple[str, LocalClassifier, Optional[CategoryRouter]]:
+    """The category fingerprint, local classifier and embedding router a sync
+    classifies with. Also purges cache entries of older category sets."""
+    fingerprint = category_fingerprint(user_categories)
+    purge_stale_entries(owner_email, fingerprint, db_session)
+    local_classifier = get_local_classifier(owner_email, user_categories, db_session)
+    router = get_embedding_router(owner_email, user_categories, db_session)
+    return fingerprint, local_classifier, router
+
+def process_message_ids(
+    owner_email: str, message_ids: List[str], client, user_categories: List[Category],
+    classifiers: Tuple[str, LocalClassifier, Optional[CategoryRouter]], db_session: Session,
+    on_chunk: Optional[Callable[[List[str]], None]] = None
+) -> int:
+    """Fetches, classifies, stores and archives the given messages that are
+    not stored yet, GMAIL_BATCH_SIZE at a time, and records the progress.
+    The next chunk is fetched while the current one is classified, so at
+    most two chunks are in flight. on_chunk is called with the ids of each
+    finished chunk. Returns how many emails were stored."""
+    fingerprint, local_classifier, router = classifiers
+    category_map = {cat.name: cat for cat in user_categories}
+
+    existing_ids = set(db_session.exec(
+        select(Email.id).where(Email.id.in_(message_ids), Email.user_email == owner_email)
+    ).all())
+    pending_ids = [msg_id for msg_id in message_ids if msg_id not in existing_ids]
+    record_sync_progress(owner_email, db_session, total=len(message_ids), skipped=len(existing_ids))
+
+    chunks = [pending_ids[start:start + GMAIL_BATCH_SIZE] for start in range(0, len(pending_ids), GMAIL_BATCH_SIZE)]
+    next_fetch = submit_gmail(batch_get_message_details(client, chunks[0])) if chunks else None
+    stored = 0
+    for index, batch_ids in enumerate(chunks):
+        details_by_id, fetch_errors = next_fetch.result()
+        if index + 1 < len(chunks):
+            next_fetch = submit_gmail(batch_get_message_details(client, chunks[index + 1]))
+        for msg_id, error in fetch_errors.items():
+            print(f"Skipping email {msg_id}, it could not be fetched: {error}")
+
+        fetched = [details_by_id[msg_id] for msg_id in batch_ids if details_by_id.get(msg_id)]
+        for details in fetched:
+            details['text'] = html_to_text(details.get("body") or "")
+            details['prompt_text'] = prepare_for_prompt(details['text'], AI_MAX_EMAIL_TOKENS)
+            details['simhash'] = simhash(details['prompt_text'])
+
+        ai_results, sources = classify_emails(
+            fetched, owner_email, user_categories, fingerprint, local_classifier, db_session, router=router
+        )
+        new_rows = []
+        new_bodies = []
+        new_texts = {}
+        texts_by_id = {}
+        for details in fetched:
+            msg_id = details['id']
+            ai_result = ai_results.get(msg_id)
+            if not ai_result: continue
+
+            chosen_category_name = ai_result.get("category")
+            summary = ai_result.get("summary")
+            category_obj = category_map.get(chosen_category_name)
+            if not category_obj: continue
+
+            body = details.get("body") or ""
+            body_hash = content_hash(body)
+            new_bodies.append(body)
+            new_texts[body_hash] = details['text']
+            texts_by_id[msg_id] = details['text']
+            new_rows.append(dict(
+                id=details['id'], user_email=owner_email, summary=summary,
+                category_id=category_obj.id, snippet=details['snippet'],
+                sent_date=details['date'], sent_at=details.get("sent_at"), from_address=details['from'],
+                sender_address=sender_address(details['from']), simhash=details['simhash'],
+                content_hash=body_hash,
+                list_unsubscribe=details.get("list_unsubscribe"),
+                list_unsubscribe_post=details.get("list_unsubscribe_post"),
+                label_source=sources.get(msg_id)
+            ))
+
+        store_email_contents(db_session, new_bodies, texts=new_texts)
+        inserted_ids = insert_ignoring_conflicts(db_session, Email, new_rows)
+        index_emails(db_session, [
+            dict(row, body_text=texts_by_id[row['id']]) for row in new_rows if row['id'] in inserted_ids
+        ])
+        db_session.commit()
+
+        archive_ids = [row['id'] for row in new_rows if row['id'] in inserted_ids]
+        for row in new_rows:
+            if row['id'] in inserted_ids and row['label_source'] in TRAINING_LABEL_SOURCES:
+                local_classifier.learn(row['from_address'], row['snippet'], row['category_id'])
+
+        archive_errors = {}
+        if archive_ids:
+            archive_errors = run_gmail(batch_archive_emails(client, archive_ids))
+            for msg_id, error in archive_errors.items():
+                print(f"Email {msg_id} was stored but could not be archived: {error}")
+
+        record_sync_progress(
+            owner_email, db_session,
+            fetched=len(fetched), classified=len(archive_ids), archived=len(archive_ids) - len(archive_errors),
+            skipped=len(fetched) - len(archive_ids), errors=len(fetch_errors),
+            duplicates=sum(1 for msg_id in archive_ids if sources.get(msg_id) == "duplicate")
+        )
+
+        stored += len(archive_ids)
+        if on_chunk:
+            on_chunk(batch_ids)
+    return stored
+
 def process_emails_task_logic(owner_email: str, processing_user_info: dict, token_data: dict, db_session: Session):
+    started = time.perf_counter()
     user_categories = db_session.exec(select(Category).where(Category.user_email == owner_email)).all()
     if not user_categories:
         set_sync_status(owner_email, 'completed', db_session)
         return
     
-    service = get_gmail_service(token_data)
-    messages = list_messages(service, max_results=10)
+    linked_email = processing_user_info.get("email") or owner_email
+    cursor = db_session.get(SyncCursor, linked_email)
+
+    client = get_async_gmail_client(token_data, account_email=linked_email)
+    messages, new_history_id = run_gmail(sync_messages(client, start_history_id=cursor.history_id if cursor else None))
+    save_refreshed_token(linked_email, token_data, client, db_session)
     if not messages:
+        if new_history_id:
+            save_sync_cursor(linked_email, new_history_id, db_session)
         set_sync_status(owner_email, 'completed', db_session)
         return
 
-    category_map = {cat.name: cat for cat in user_categories}
+    classifiers = prepare_classifiers(owner_email, user_categories, db_session)
+    message_ids = [msg_info['id'] for msg_info in messages]
+    process_message_ids(owner_email, message_ids, client, user_categories, classifiers, db_session)
 
-    for msg_info in messages:
-        msg_id = msg_info['id']
-        existing_email = db_session.exec(select(Email).where(Email.id == msg_id, Email.user_email == owner_email)).first()
-        if existing_email: continue
-        
-        details = get_message_details(service, msg_id)
-        if not details: continue
-        
-        email_body_for_ai = details.get("body") or ""
-        
-        time.sleep(2)
-
-        ai_result = summarize_and_categorize_email(email_body_for_ai, user_categories)
-        if not ai_result: continue
-        
-        chosen_category_name = ai_result.get("category")
-        summary = ai_result.get("summary")
-        category_obj = category_map.get(chosen_category_name)
-        if not category_obj: continue
-
-        new_email = Email(
-            id=details['id'], user_email=owner_email, summary=summary,
-            category_id=category_obj.id, snippet=details['snippet'],
-            sent_date=details['date'], from_address=details['from'],
-            body=details.get("body") or ""
-        )
-        
-        try:
-            db_session.add(new_email)
-            db_session.commit()
-            archive_email(service, msg_id)
-        except IntegrityError:
-            db_session.rollback()
-            continue
+    if new_history_id:
+        save_sync_cursor(linked_email, new_history_id, db_session)
 
-def process_emails_task_wrapper(owner_email: str, processing_user_info: dict, token_data: dict):
+    elapsed = time.perf_counter() - started
+    SYNC_SECONDS.observe(elapsed)
+    SYNC_THROUGHPUT.observe(len(message_ids) / elapsed if elapsed else 0)
+
+def process_emails_task_wrapper(owner_email: str, account_email: str):
+    """Job handler for "sync_emails". Errors are re-raised after the status is
+    recorded so the job queue can retry the sync."""
     with Session(engine) as session:
         try:
-            process_emails_task_logic(owner_email, processing_user_info, token_data, db_session=session)
+            token_data = load_account_token(owner_email, account_email, session)
+            if token_data is None:
+                print(f"Skipping sync of {account_email}, it is no longer linked to {owner_email}.")
+            else:
+                process_emails_task_logic(owner_email, {"email": account_email}, token_data, db_session=session)
             set_sync_status(owner_email, 'completed', session)
         except ResourceExhausted:
             print(f"Stopping task for {owner_email} due to rate limit.")
             set_sync_status(owner_email, 'rate_limit_exceeded', session)
+            raise
         except Exception as e:
             print(f"An unexpected error occurred in background task for {owner_email}: {e}")
-            set_sync_status(owner_email, 'failed', session)
\ No newline at end of file
+            set_sync_status(owner_email, 'failed', session)
+            raise
+
+def backfill_query(after: Optional[str] = None, before: Optional[str] = None) -> Optional[str]:
+    """Gmail search terms for a date range given as YYYY-MM-DD."""
+    terms = []
+    if after:
+        terms.append(f"after:{after.replace('-', '/')}")
+    if before:
+        terms.append(f"before:{before.replace('-', '/')}")
+    return " ".join(terms) or None
+
+def start_backfill(
+    owner_email: str, linked_email: str, db_session: Session, after: Optional[str] = None,
+    before: Optional[str] = None, label_ids: Tuple[str, ...] = ("INBOX",)
+) -> BackfillCheckpoint:
+    """Creates the account's backfill checkpoint, replacing an earlier one."""
+    checkpoint = db_session.get(BackfillCheckpoint, linked_email)
+    if checkpoint:
+        db_session.delete(checkpoint)
+        db_session.flush()
+    checkpoint = BackfillCheckpoint(
+        linked_email=linked_email, owner_email=owner_email, after=after, before=before,
+        label_ids=",".join(label_ids)
+    )
+    db_session.add(checkpoint)
+    db_session.commit()
+    return checkpoint
+
+def save_backfill_checkpoint(checkpoint: BackfillCheckpoint, db_session: Session, **values):
+    for name, value in values.items():
+        setattr(checkpoint, name, value)
+    checkpoint.updated_at = datetime.now(timezone.utc)
+    db_session.add(checkpoint)
+    db_session.commit()
+
+def process_backfill_task_logic(owner_email: str, processing_user_info: dict, token_data: dict, db_session: Session) -> bool:
+    """Pages through the account's mailbox from its checkpoint, processing
+    each page like a sync. The checkpoint (page token and last processed
+    message) is saved after every chunk, so a crashed or rate-limited job
+    resumes where it stopped. Stops between pages once BACKFILL_JOB_SECONDS
+    have passed. Returns True when the listing is exhausted."""
+    started = time.monotonic()
+    linked_email = processing_user_info.get("email") or owner_email
+    checkpoint = db_session.get(BackfillCheckpoint, linked_email)
+    if not checkpoint or checkpoint.status == 'completed':
+        return True
+    user_categories = db_session.exec(select(Category).where(Category.user_email == owner_email)).all()
+    if not user_categories:
+        return True
+
+    client = get_async_gmail_client(token_data, account_email=linked_email)
+    classifiers = prepare_classifiers(owner_email, user_categories, db_session)
+    query = backfill_query(checkpoint.after, checkpoint.before)
+    label_ids = tuple(label for label in checkpoint.label_ids.split(",") if label)
+
+    while True:
+        try:
+            messages, next_token = run_gmail(list_messages_page(client, checkpoint.page_token, query, label_ids))
+        except GmailApiError as e:
+            if not checkpoint.page_token or e.status not in (400, 404):
+                raise
+            # Stored messages are skipped, so starting over only costs the listing.
+            print(f"Backfill page token of {linked_email} was rejected ({e.status}), restarting the listing.")
+            save_backfill_checkpoint(checkpoint, db_session, page_token=None, last_message_id=None)
+            continue
+        save_refreshed_token(linked_email, token_data, client, db_session)
+
+        message_ids = [msg_info['id'] for msg_info in messages]
+        if checkpoint.last_message_id in message_ids:
+            message_ids = message_ids[message_ids.index(checkpoint.last_message_id) + 1:]
+        process_message_ids(
+            owner_email, message_ids, client, user_categories, classifiers, db_session,
+            on_chunk=lambda batch_ids: save_backfill_checkpoint(
+                checkpoint, db_session, last_message_id=batch_ids[-1], processed=checkpoint.processed + len(batch_ids)
+            )
+        )
+        save_backfill_checkpoint(
+            checkpoint, db_session, page_token=next_token, last_message_id=None, pages_done=checkpoint.pages_done + 1
+        )
+
+        if not next_token:
+            save_backfill_checkpoint(checkpoint, db_session, status='completed', completed_at=datetime.now(timezone.utc))
+            return True
+        if time.monotonic() - started >= BACKFILL_JOB_SECONDS:
+            print(f"Backfill of {linked_email} paused after {checkpoint.pages_done} pages, queueing a continuation.")
+            return False
+
+def process_backfill_task_wrapper(owner_email: str, account_email: str):
+    """Job handler for "backfill_emails". An unfinished backfill queues a job
+    that continues from the checkpoint; failed jobs are retried by the queue
+    and resume from it too."""
+    with Session(engine) as session:
+        try:
+            token_data = load_account_token(owner_email, account_email, session)
+            if token_data is None:
+                print(f"Skipping backfill of {account_email}, it is no longer linked to {owner_email}.")
+                set_sync_status(owner_email, 'completed', session)
+            elif process_backfill_task_logic(owner_email, {"email": account_email}, token_data, db_session=session):
+                set_sync_status(owner_email, 'completed', session)
+            else:
+                enqueue_job(
+                    "backfill_emails", {"owner_email": owner_email, "account_email": account_email},
+                    session, owner_email=owner_email, account_email=account_email
+                )
+        except ResourceExhausted:
+            print(f"Pausing backfill for {owner_email} due to rate limit.")
+            set_sync_status(owner_email, 'rate_limit_exceeded', session)
+            raise
+        except Exception as e:
+            print(f"An unexpected error occurred in backfill task for {owner_email}: {e}")
+            set_sync_status(owner_email, 'failed', session)
+            raise
+
+def record_unsubscribe_result(owner_email: str, batch_id: str, emails: List[Email], result: dict):
+    """Stores one list's result on the rows of all its emails and publishes
+    the batch's progress."""
+    email_ids = [email.id for email in emails]
+    with Session(engine) as session:
+        session.execute(
+            update(UnsubscribeResult)
+            .where(UnsubscribeResult.batch_id == batch_id, UnsubscribeResult.email_id.in_(email_ids))
+            .values(status='done', success=result.get("success", False), reason=result.get("reason"),
+                    updated_at=datetime.now(timezone.utc))
+        )
+        session.commit()
+        result_ids = session.exec(
+            select(UnsubscribeResult.id).where(UnsubscribeResult.batch_id == batch_id, UnsubscribeResult.email_id.in_(email_ids))
+        ).all()
+        done, total = session.exec(
+            select(func.count(UnsubscribeResult.id).filter(UnsubscribeResult.status == 'done'), func.count(UnsubscribeResult.id))
+            .where(UnsubscribeResult.batch_id == batch_id)
+        ).one()
+    progress_broker.publish(owner_email, {
+        "type": "unsubscribe", "batch_id": batch_id, "done": done, "total": total, "result_ids": list(result_ids),
+        "from_address": emails[0].from_address, "success": result.get("success", False), "reason": result.get("reason")
+    })
+
+def process_unsubscribe_task_wrapper(owner_email: str, batch_id: str):
+    """Job handler for "unsubscribe_emails". Runs the batch's unfinished
+    emails, so a retried job skips the lists that already have a result."""
+    with Session(engine) as session:
+        pending = session.exec(
+            select(UnsubscribeResult).where(UnsubscribeResult.batch_id == batch_id, UnsubscribeResult.status != 'done')
+        ).all()
+        emails = []
+        for row in pending:
+            email = session.get(Email, row.email_id)
+            if email and email.user_email == owner_email:
+                emails.append((email, load_email_body(session, email)))
+            else:
+                row.status, row.success, row.reason = 'done', False, "The email no longer exists."
+                session.add(row)
+        session.commit()
+        for email, _ in emails:
+            session.refresh(email)
+        session.expunge_all()
+
+    # The browser pool lives on one event loop, so the batch runs on the shared background loop.
+    lists = run_gmail(unsubscribe_emails(
+        emails, lambda list_emails, result: record_unsubscribe_result(owner_email, batch_id, list_emails, result)
+    ))
+    print(f"Unsubscribe batch {batch_id} of {owner_email}: {len(emails)} emails from {lists} lists.")
@@ -0,0 +1,135 @@
+import os
+import re
+from html.parser import HTMLParser
+from typing import List
+from urllib.parse import urlparse
+
+CHARS_PER_TOKEN = 4
+PROMPT_MAX_URL_CHARS = int(os.getenv("PROMPT_MAX_URL_CHARS", "60"))
+
+_BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "br", "div", "dl", "dt", "dd", "footer", "form",
+    "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main", "nav", "ol", "p", "pre",
+    "section", "table", "tbody", "td", "tfoot", "th", "thead", "tr", "ul",
+}
+_SKIPPED_TAGS = {"head", "script", "style", "title", "noscript", "template", "svg"}
+
+_QUOTE_HEADERS = [
+    re.compile(r"^On [^\n]{0,200}(\n[^\n]{0,200})?wrote:[ \t]*$", re.MULTILINE),
+    re.compile(r"^-{2,}\s*Original Message\s*-{2,}", re.MULTILINE | re.IGNORECASE),
+    re.compile(r"^From: [^\n]+\n(Sent|Date): ", re.MULTILINE),
+]
+_SIGNATURE_SEPARATOR = re.compile(r"^--[ \t]*$", re.MULTILINE)
+_MOBILE_SIGNATURE = re.compile(r"^(Sent from my \w+|Get Outlook for \w+)", re.IGNORECASE)
+_FOOTER = re.compile(
+    r"unsubscribe|opt[ -]out|manage (your )?(email )?preferences|update your preferences|privacy policy"
+    r"|all rights reserved|\u00a9|copyright|you are receiving this|you received this|this (e-?mail|message) was sent to",
+    re.IGNORECASE,
+)
+_BROWSER_LINK = re.compile(r"view (this )?(e-?mail )?(it )?in (your |a )?(web )?browser", re.IGNORECASE)
+_URL = re.compile(r"https?://[^\s<>\"')\]]+")
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIPPED_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(data)
+
+
+def normalize_whitespace(text: str) -> str:
+    lines = (re.sub(r"[ \t\r\f\v\u00a0\u200b\u200c\u034f]+", " ", line).strip() for line in text.split("\n"))
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+def html_to_text(body: str) -> str:
+    """Converts an HTML (or plain-text) email body to readable plain text."""
+    if not body:
+        return ""
+    if "<" not in body:
+        return normalize_whitespace(body)
+    parser = _TextExtractor()
+    try:
+        parser.feed(body)
+        parser.close()
+    except Exception as e:
+        print(f"Error converting email HTML to text: {e}")
+    return normalize_whitespace("".join(parser.parts))
+
+
+def estimate_tokens(text: str) -> int:
+    # Gemini averages roughly four characters per token, which is close enough for budgeting.
+    return len(text or "") // CHARS_PER_TOKEN + 1
+
+def _cut_at_first(text: str, patterns: List[re.Pattern]) -> str:
+    """Cuts the text at the earliest match of any pattern, unless that would
+    leave nothing, as it does for a reply written below the quote."""
+    cut = min((m.start() for m in (p.search(text) for p in patterns) if m), default=None)
+    if cut is None or not text[:cut].strip():
+        return text
+    return text[:cut]
+
+def strip_quoted_history(text: str) -> str:
+    """Drops the quoted thread below a reply and any ">"-quoted lines."""
+    text = _cut_at_first(text, _QUOTE_HEADERS)
+    return "\n".join(line for line in text.split("\n") if not line.lstrip().startswith(">"))
+
+def strip_signature(text: str) -> str:
+    text = _cut_at_first(text, [_SIGNATURE_SEPARATOR])
+    return "\n".join(line for line in text.split("\n") if not _MOBILE_SIGNATURE.match(line.strip()))
+
+def strip_footer(text: str) -> str:
+    """Drops trailing paragraphs that are mailing-list boilerplate, and a
+    leading "view in browser" line."""
+    paragraphs = [p for p in re.split(r"\n\s*\n", text) if p.strip()]
+    if paragraphs and _BROWSER_LINK.search(paragraphs[0]) and len(paragraphs[0]) < 200:
+        paragraphs = paragraphs[1:]
+    while len(paragraphs) > 1 and _FOOTER.search(paragraphs[-1]):
+        paragraphs.pop()
+    return "\n\n".join(paragraphs)
+
+def shorten_urls(text: str, max_chars: int = PROMPT_MAX_URL_CHARS) -> str:
+    """Replaces URLs longer than max_chars, mostly tracking parameters, with their host."""
+    def replace(match: re.Match) -> str:
+        url = match.group(0).rstrip(".,;:!?")
+        if len(url) <= max_chars:
+            return match.group(0)
+        return f"[link: {urlparse(url).netloc}]" + match.group(0)[len(url):]
+    return _URL.sub(replace, text)
+
+def truncate_to_token_budget(text: str, max_tokens: int) -> str:
+    """Truncates to about max_tokens, preferring to end on a paragraph,
+    sentence or word boundary in the last quarter of the budget."""
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    head = text[:limit]
+    for boundary in ("\n\n", ". ", "\n", " "):
+        position = head.rfind(boundary)
+        if position >= limit * 3 // 4:
+            return head[:position + len(boundary)].rstrip()
+    return head
+
+def prepare_for_prompt(text: str, max_tokens: int) -> str:
+    """Reduces an email's plain text (see html_to_text) to the part worth
+    sending to the model, within max_tokens."""
+    text = strip_quoted_history(text or "")
+    text = strip_signature(text)
+    text = strip_footer(text)
+    text = shorten_urls(text)
+    return truncate_to_token_budget(normalize_whitespace(text), max_tokens)
@@ -0,0 +1,146 @@
+import os
+import re
+import asyncio
+import httpx
+from html.parser import HTMLParser
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.models.email import Email
+from app.ai_utils import find_unsubscribe_link, agent_unsubscribe_from_link
+from app.near_duplicates import sender_address
+
+ONE_CLICK_TIMEOUT = float(os.getenv("ONE_CLICK_TIMEOUT", "10"))
+UNSUBSCRIBE_CONCURRENCY = int(os.getenv("UNSUBSCRIBE_CONCURRENCY", "4"))
+
+UNSUBSCRIBE_KEYWORDS = (
+    "unsubscribe", "opt-out", "opt out", "optout", "manage your preferences",
+    "email preferences", "manage preferences", "manage subscription", "descadastr", "cancelar inscri",
+)
+
+
+def parse_list_unsubscribe(header: Optional[str]) -> Tuple[List[str], List[str]]:
+    """Splits a List-Unsubscribe header (RFC 2369) into its http(s) URLs and mailto URIs."""
+    http_urls = []
+    mailto_uris = []
+    for target in re.findall(r"<([^>]+)>", header or ""):
+        target = target.strip()
+        if target.lower().startswith(("http://", "https://")):
+            http_urls.append(target)
+        elif target.lower().startswith("mailto:"):
+            mailto_uris.append(target)
+    return http_urls, mailto_uris
+
+def supports_one_click(list_unsubscribe_post: Optional[str]) -> bool:
+    return "list-unsubscribe=one-click" in (list_unsubscribe_post or "").replace(" ", "").lower()
+
+
+class _AnchorParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.anchors: List[Tuple[str, str]] = []
+        self._href: Optional[str] = None
+        self._text: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            self._href = dict(attrs).get("href")
+            self._text = []
+
+    def handle_data(self, data):
+        if self._href is not None:
+            self._text.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == "a" and self._href is not None:
+            self.anchors.append((self._href.strip(), " ".join("".join(self._text).split())))
+            self._href = None
+
+
+def find_unsubscribe_anchor(body: Optional[str]) -> Optional[str]:
+    """Scans the HTML anchors for an unsubscribe link, preferring a match on
+    the visible text over a match on the URL alone."""
+    if not body:
+        return None
+    parser = _AnchorParser()
+    try:
+        parser.feed(body)
+        parser.close()
+    except Exception as e:
+        print(f"Error parsing email HTML for unsubscribe links: {e}")
+
+    href_match = None
+    for href, anchor_text in parser.anchors:
+        if not href.lower().startswith(("http://", "https://")):
+            continue
+        if any(keyword in anchor_text.lower() for keyword in UNSUBSCRIBE_KEYWORDS):
+            return href
+        if href_match is None and any(keyword.replace(" ", "") in href.lower() for keyword in UNSUBSCRIBE_KEYWORDS):
+            href_match = href
+    return href_match
+
+async def one_click_unsubscribe(url: str) -> dict:
+    """Performs an RFC 8058 one-click unsubscribe POST."""
+    try:
+        async with httpx.AsyncClient(timeout=ONE_CLICK_TIMEOUT, follow_redirects=True) as client:
+            response = await client.post(url, data={"List-Unsubscribe": "One-Click"})
+        if response.is_success:
+            return {"success": True, "reason": "Unsubscribed with a one-click request (RFC 8058)."}
+        return {"success": False, "reason": f"One-click unsubscribe returned HTTP {response.status_code}."}
+    except httpx.HTTPError as e:
+        print(f"Error sending one-click unsubscribe to {url}: {e}")
+        return {"success": False, "reason": str(e)}
+
+async def unsubscribe_email(email: Email, body: str) -> dict:
+    """Unsubscribes from the list an email came from, cheapest method first:
+    RFC 8058 one-click POST, then the List-Unsubscribe or HTML anchor link in
+    the browser agent, and Gemini to find the link only when neither exists."""
+    http_urls, mailto_uris = parse_list_unsubscribe(email.list_unsubscribe)
+
+    if http_urls and supports_one_click(email.list_unsubscribe_post):
+        result = await one_click_unsubscribe(http_urls[0])
+        if result["success"]:
+            return result
+
+    link = next(iter(http_urls), None) or find_unsubscribe_anchor(body)
+    if not link:
+        link = await asyncio.to_thread(find_unsubscribe_link, body or "")
+
+    if link and link != "None":
+        return await agent_unsubscribe_from_link(link)
+
+    if mailto_uris:
+        return {"success": False, "reason": f"This list only supports unsubscribing by email: {mailto_uris[0]}"}
+    return {"success": False, "reason": "No unsubscribe link was found in this email."}
+
+def unsubscribe_key(email: Email, body: str) -> Tuple[str, Optional[str]]:
+    """The list an email would be unsubscribed from: its sender and the
+    target unsubscribe_email would use first (None when only Gemini could
+    find one)."""
+    http_urls, mailto_uris = parse_list_unsubscribe(email.list_unsubscribe)
+    target = next(iter(http_urls), None) or find_unsubscribe_anchor(body) or next(iter(mailto_uris), None)
+    return sender_address(email.from_address), target
+
+async def unsubscribe_emails(
+    emails: List[Tuple[Email, str]], on_result: Callable[[List[Email], dict], None],
+    concurrency: int = UNSUBSCRIBE_CONCURRENCY
+) -> int:
+    """Unsubscribes from the lists of the given (email, body) pairs, once per
+    list and at most `concurrency` lists at a time. on_result is called in a
+    thread with each list's emails and result as soon as it is done.
+    Returns the number of lists."""
+    lists: Dict[Tuple[str, Optional[str]], List[Tuple[Email, str]]] = {}
+    for email, body in emails:
+        lists.setdefault(unsubscribe_key(email, body), []).append((email, body))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def unsubscribe_list(group: List[Tuple[Email, str]]):
+        async with semaphore:
+            try:
+                result = await unsubscribe_email(*group[0])
+            except Exception as e:
+                print(f"Error unsubscribing from {group[0][0].from_address}: {e}")
+                result = {"success": False, "reason": str(e)}
+        await asyncio.to_thread(on_result, [email for email, _ in group], result)
+
+    await asyncio.gather(*(unsubscribe_list(group) for group in lists.values()))
+    return len(lists)
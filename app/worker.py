@@ -0,0 +1,135 @@
+import os
+import json
+import signal
+import argparse
+import threading
+from contextlib import contextmanager
+from typing import List, Tuple
+from sqlmodel import Session
+
+from app.db import engine, create_db_and_tables
+from app.metrics import serve_metrics
+from app.job_queue import claim_job, complete_job, fail_job, fail_abandoned_jobs, extend_lease, JOB_HEARTBEAT_INTERVAL
+from app.models.job import Job
+from app.browser_pool import browser_pool
+from app.gmail_async import run_gmail, close_http_client
+from app.tasks import process_emails_task_wrapper, process_backfill_task_wrapper, process_unsubscribe_task_wrapper
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "4"))
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "2"))
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "0"))
+
+JOB_HANDLERS = {
+    "sync_emails": process_emails_task_wrapper,
+    "backfill_emails": process_backfill_task_wrapper,
+    "unsubscribe_emails": process_unsubscribe_task_wrapper,
+}
+
+
+def run_job(job: Job):
+    handler = JOB_HANDLERS.get(job.kind)
+    if handler is None:
+        raise ValueError(f"No handler registered for job kind '{job.kind}'")
+    handler(**json.loads(job.payload))
+
+@contextmanager
+def hold_lease(job: Job):
+    """Extends the job's lease every JOB_HEARTBEAT_INTERVAL seconds while it
+    runs, so a long job is not claimed again by another worker."""
+    job_id, attempts = job.id, job.attempts
+    stop_event = threading.Event()
+
+    def heartbeat():
+        while not stop_event.wait(JOB_HEARTBEAT_INTERVAL):
+            try:
+                with Session(engine) as session:
+                    if not extend_lease(job_id, attempts, session):
+                        print(f"Job {job_id} attempt {attempts} lost its lease.")
+                        return
+            except Exception as e:
+                print(f"Error extending the lease of job {job_id}: {e}")
+
+    thread = threading.Thread(target=heartbeat, name=f"job-heartbeat-{job_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop_event.set()
+        thread.join()
+
+def run_next_job() -> bool:
+    """Claims and runs one job. Returns False when the queue had nothing to run."""
+    with Session(engine) as session:
+        fail_abandoned_jobs(session)
+        job = claim_job(session)
+        if not job:
+            return False
+        session.expunge(job)
+
+        print(f"Running job {job.id} ({job.kind}), attempt {job.attempts}/{job.max_attempts}.")
+        try:
+            with hold_lease(job):
+                run_job(job)
+        except Exception as e:
+            print(f"Job {job.id} ({job.kind}) failed: {e}")
+            session.rollback()
+            fail_job(job, str(e), session)
+            return True
+
+        complete_job(job, session)
+        return True
+
+def worker_loop(stop_event: threading.Event):
+    while not stop_event.is_set():
+        try:
+            ran_job = run_next_job()
+        except Exception as e:
+            print(f"Worker error while polling for jobs: {e}")
+            ran_job = False
+        if not ran_job:
+            stop_event.wait(WORKER_POLL_INTERVAL)
+
+def start_workers(concurrency: int = WORKER_CONCURRENCY) -> Tuple[threading.Event, List[threading.Thread]]:
+    stop_event = threading.Event()
+    threads = []
+    for i in range(concurrency):
+        thread = threading.Thread(target=worker_loop, args=(stop_event,), name=f"job-worker-{i}", daemon=True)
+        thread.start()
+        threads.append(thread)
+    return stop_event, threads
+
+def stop_workers(stop_event: threading.Event, threads: List[threading.Thread], timeout: float = 30):
+    stop_event.set()
+    for thread in threads:
+        thread.join(timeout=timeout)
+
+def close_job_resources():
+    """Closes the browser pool and HTTP connections the jobs used. Jobs run
+    their async work on the shared background loop, which owns both."""
+    run_gmail(browser_pool.close())
+    run_gmail(close_http_client())
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background job workers.")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY)
+    args = parser.parse_args()
+
+    create_db_and_tables()
+    if WORKER_METRICS_PORT:
+        serve_metrics(WORKER_METRICS_PORT)
+        print(f"Serving worker metrics on port {WORKER_METRICS_PORT}.")
+    stop_event, threads = start_workers(args.concurrency)
+    print(f"Started {args.concurrency} job workers.")
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    try:
+        while not stop_event.is_set():
+            stop_event.wait(1)
+    except KeyboardInterrupt:
+        pass
+    print("Stopping job workers...")
+    stop_workers(stop_event, threads)
+    close_job_resources()
+
+if __name__ == "__main__":
+    main()
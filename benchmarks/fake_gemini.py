@@ -0,0 +1,111 @@
+"""A local stand-in for google.generativeai's GenerativeModel.
+
+Answers every prompt the app sends in the format it expects, after a
+configurable latency, and raises ResourceExhausted for a configurable share
+of calls so backoff behaviour can be measured.
+"""
+import re
+import json
+import zlib
+import time
+import random
+import asyncio
+import threading
+from google.api_core.exceptions import ResourceExhausted
+
+_EMAIL_ID_RE = re.compile(r'<email id="([^"]+)">')
+_CATEGORY_RE = re.compile(r'^- "([^"]+)":', re.MULTILINE)
+_WORD_RE = re.compile(r"[a-z]{3,}")
+EMBEDDING_DIMENSIONS = 64
+
+
+class FakeUsage:
+    def __init__(self, prompt: str, text: str):
+        self.prompt_token_count = len(prompt) // 4 + 1
+        self.candidates_token_count = len(text) // 4 + 1
+
+
+class FakeResponse:
+    def __init__(self, prompt: str, text: str):
+        self.text = text
+        self.usage_metadata = FakeUsage(prompt, text)
+
+
+class FakeGemini:
+    def __init__(self, latency: float = 0.2, jitter: float = 0.05, rate_limit_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_rate = rate_limit_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.rate_limited = 0
+        self.embed_calls = 0
+        self._lock = threading.Lock()
+
+    def _next_delay_and_outcome(self):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            limited = self.random.random() < self.rate_limit_rate
+            if limited:
+                self.rate_limited += 1
+        return delay, limited
+
+    def answer(self, prompt: str) -> str:
+        categories = [name for name in _CATEGORY_RE.findall(prompt) if name != "Other"] or ["Other"]
+        email_ids = _EMAIL_ID_RE.findall(prompt)
+        if email_ids:
+            return json.dumps([
+                {"id": email_id, "summary": f"Synthetic summary of {email_id}.", "category": categories[zlib.crc32(email_id.encode()) % len(categories)]}
+                for email_id in email_ids
+            ])
+        if '"selector"' in prompt:
+            return json.dumps({"selector": None})
+        if "Unsubscribe URL" in prompt:
+            return "None"
+        return json.dumps({"summary": "Synthetic summary.", "category": categories[0]})
+
+    def generate(self, prompt: str) -> FakeResponse:
+        delay, limited = self._next_delay_and_outcome()
+        time.sleep(delay)
+        if limited:
+            raise ResourceExhausted("Fake quota exceeded")
+        return FakeResponse(prompt, self.answer(prompt))
+
+    async def generate_async(self, prompt: str) -> FakeResponse:
+        delay, limited = self._next_delay_and_outcome()
+        await asyncio.sleep(delay)
+        if limited:
+            raise ResourceExhausted("Fake quota exceeded")
+        return FakeResponse(prompt, self.answer(prompt))
+
+    def embed_content(self, model: str = "", content=None, task_type=None, **kwargs) -> dict:
+        """A drop-in for genai.embed_content: hashed bag-of-words vectors, so
+        emails sharing words with a category land near it."""
+        with self._lock:
+            self.embed_calls += 1
+        time.sleep(self.latency / 4)
+        texts = [content] if isinstance(content, str) else list(content)
+        vectors = []
+        for text in texts:
+            vector = [0.0] * EMBEDDING_DIMENSIONS
+            for word in _WORD_RE.findall(text.lower()):
+                vector[zlib.crc32(word.encode()) % EMBEDDING_DIMENSIONS] += 1.0
+            vectors.append(vector)
+        return {"embedding": vectors[0] if isinstance(content, str) else vectors}
+
+    def model_factory(self):
+        """A drop-in for genai.GenerativeModel."""
+        fake = self
+
+        class FakeGenerativeModel:
+            def __init__(self, model_name: str = "", **kwargs):
+                self.model_name = model_name
+
+            def generate_content(self, prompt):
+                return fake.generate(prompt)
+
+            async def generate_content_async(self, prompt):
+                return await fake.generate_async(prompt)
+
+        return FakeGenerativeModel
@@ -0,0 +1,283 @@
+"""A local stand-in for the Gmail REST API, serving synthetic mailboxes.
+
+Only the endpoints the app uses are implemented. Each mailbox is selected by
+the bearer token of the request, so several accounts can be served at once.
+"""
+import json
+import time
+import base64
+import re
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import urlparse, parse_qs
+
+COMPLEXITIES = ("plain", "alternative", "nested")
+SENDERS = [f"news{i}@sender{i % 17}.example.com" for i in range(60)]
+WORDS = (
+    "invoice order shipped meeting agenda offer discount newsletter update account security "
+    "report weekly team project deadline event ticket flight hotel receipt subscription"
+).split()
+
+
+def _encode(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+
+class FakeMailbox:
+    def __init__(self, address: str, size: int = 0, complexity: str = "alternative", body_bytes: int = 4000, seed: int = 0):
+        self.address = address
+        self.complexity = complexity
+        self.body_bytes = body_bytes
+        self.random = random.Random(seed)
+        self.history_id = 1000
+        self.messages: Dict[str, dict] = {}
+        self.attachments: Dict[str, str] = {}
+        self.order: List[str] = []
+        self.lock = threading.Lock()
+        self.add_messages(size)
+
+    def add_messages(self, count: int) -> List[str]:
+        added = []
+        with self.lock:
+            for _ in range(count):
+                self.history_id += 1
+                msg_id = f"{self.address.split('@')[0]}-{self.history_id:x}"
+                self.messages[msg_id] = {
+                    "id": msg_id, "threadId": msg_id, "historyId": str(self.history_id),
+                    "labelIds": ["INBOX"], "message": self._build_message(msg_id),
+                }
+                self.order.append(msg_id)
+                added.append(msg_id)
+        return added
+
+    def _build_message(self, msg_id: str) -> dict:
+        sender = self.random.choice(SENDERS)
+        subject = " ".join(self.random.choice(WORDS) for _ in range(5)).capitalize()
+        paragraph_count = max(1, self.body_bytes // 400)
+        paragraphs = [" ".join(self.random.choice(WORDS) for _ in range(55)) for _ in range(paragraph_count)]
+        plain = "\n\n".join(paragraphs)
+        html = (
+            "<html><head><style>p{margin:0}</style></head><body>"
+            + "".join(f"<p>{p}</p>" for p in paragraphs)
+            + f'<p><a href="https://{sender.split("@")[1]}/unsubscribe?u={msg_id}">Unsubscribe</a></p></body></html>'
+        )
+        headers = [
+            {"name": "From", "value": f"Sender <{sender}>"},
+            {"name": "Subject", "value": subject},
+            {"name": "Date", "value": time.strftime("%a, %d %b %Y %H:%M:%S +0000", time.gmtime(1700000000 + self.history_id * 60))},
+            {"name": "List-Unsubscribe", "value": f"<{{fake_base}}/unsubscribe/{msg_id}>"},
+            {"name": "List-Unsubscribe-Post", "value": "List-Unsubscribe=One-Click"},
+        ]
+        plain_part = {"mimeType": "text/plain", "body": {"data": _encode(plain), "size": len(plain)}}
+        html_part = {"mimeType": "text/html", "body": {"data": _encode(html), "size": len(html)}}
+
+        if self.complexity == "plain":
+            payload = {"mimeType": "text/plain", "headers": headers, "body": plain_part["body"]}
+        elif self.complexity == "alternative":
+            payload = {"mimeType": "multipart/alternative", "headers": headers, "parts": [plain_part, html_part]}
+        else:
+            # Like Gmail does for large parts, the HTML is only available through the attachments endpoint.
+            self.attachments[f"{msg_id}-html"] = html_part["body"].pop("data")
+            html_part["body"]["attachmentId"] = f"{msg_id}-html"
+            payload = {"mimeType": "multipart/mixed", "headers": headers, "parts": [
+                {"mimeType": "multipart/related", "parts": [
+                    {"mimeType": "multipart/alternative", "parts": [plain_part, html_part]},
+                    {"mimeType": "image/png", "filename": "logo.png", "body": {"attachmentId": f"{msg_id}-logo", "size": 20480}},
+                ]},
+                {"mimeType": "application/pdf", "filename": "statement.pdf", "body": {"attachmentId": f"{msg_id}-pdf", "size": 204800}},
+            ]}
+        return {"id": msg_id, "threadId": msg_id, "snippet": plain[:120], "labelIds": ["INBOX"], "payload": payload}
+
+    def inbox_ids(self) -> List[str]:
+        with self.lock:
+            return [msg_id for msg_id in reversed(self.order) if "INBOX" in self.messages[msg_id]["labelIds"]]
+
+
+class FakeGmailServer:
+    """Serves mailboxes over HTTP from a background thread. `latency` seconds
+    are added to every request, with `jitter` of random extra delay."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, history_page_size: int = 100):
+        self.latency = latency
+        self.jitter = jitter
+        self.history_page_size = history_page_size
+        self.mailboxes: Dict[str, FakeMailbox] = {}
+        self.requests_served = 0
+        self.unsubscribes = 0
+        self._counter_lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def api_url(self) -> str:
+        return f"{self.base_url}/gmail/v1/users"
+
+    def add_mailbox(self, token: str, mailbox: FakeMailbox) -> FakeMailbox:
+        self.mailboxes[token] = mailbox
+        return mailbox
+
+    def start(self) -> "FakeGmailServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-gmail", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, unsubscribe: bool = False):
+        with self._counter_lock:
+            self.requests_served += 1
+            if unsubscribe:
+                self.unsubscribes += 1
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, payload: Optional[dict] = None):
+                body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _read_json(self) -> dict:
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                try:
+                    return json.loads(raw) if raw else {}
+                except ValueError:
+                    return {}
+
+            def _mailbox(self) -> Optional[FakeMailbox]:
+                token = (self.headers.get("Authorization") or "").removeprefix("Bearer ")
+                return server.mailboxes.get(token)
+
+            def _delay(self):
+                delay = server.latency + (random.uniform(0, server.jitter) if server.jitter else 0)
+                if delay:
+                    time.sleep(delay)
+
+            def do_GET(self):
+                self._delay()
+                server._count()
+                mailbox = self._mailbox()
+                if mailbox is None:
+                    return self._send(401, {"error": {"code": 401, "message": "Invalid Credentials"}})
+                return self._send(*self._get(mailbox, self.path))
+
+            def _batch(self, mailbox: FakeMailbox):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length).decode("utf-8") if length else ""
+                parts = []
+                for content_id, path in re.findall(r"Content-ID: <([^>]+)>\r\n\r\nGET (\S+)", raw):
+                    status, payload = self._get(mailbox, path)
+                    parts.append(
+                        f"--fake_batch\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+                        f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n\r\n{json.dumps(payload)}\r\n"
+                    )
+                body = ("".join(parts) + "--fake_batch--\r\n").encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "multipart/mixed; boundary=fake_batch")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _get(self, mailbox: FakeMailbox, path: str):
+                url = urlparse(path)
+                query = parse_qs(url.query)
+                resource = url.path.split("/users/", 1)[-1].split("/", 1)[-1]
+
+                if resource == "profile":
+                    return 200, {"emailAddress": mailbox.address, "historyId": str(mailbox.history_id)}
+                if resource == "messages":
+                    max_results = int(query.get("maxResults", ["100"])[0])
+                    ids = mailbox.inbox_ids()[:max_results]
+                    return 200, {"messages": [{"id": i, "threadId": i} for i in ids], "resultSizeEstimate": len(ids)}
+                if "/attachments/" in resource:
+                    data = mailbox.attachments.get(resource.rsplit("/", 1)[-1])
+                    if data is None:
+                        return 404, {"error": {"code": 404, "message": "Not Found"}}
+                    return 200, {"size": len(data) * 3 // 4, "data": data}
+                if resource.startswith("messages/"):
+                    record = mailbox.messages.get(resource.split("/", 1)[1])
+                    if record is None:
+                        return 404, {"error": {"code": 404, "message": "Not Found"}}
+                    message = json.loads(json.dumps(record["message"]).replace("{fake_base}", server.base_url))
+                    message["labelIds"] = list(record["labelIds"])
+                    if query.get("format", ["full"])[0] == "metadata":
+                        wanted = {name.lower() for name in query.get("metadataHeaders", [])}
+                        headers = message["payload"].get("headers", [])
+                        message["payload"] = {
+                            "mimeType": message["payload"]["mimeType"],
+                            "headers": [h for h in headers if not wanted or h["name"].lower() in wanted],
+                        }
+                    elif "fields" in query and "headers" not in query["fields"][0]:
+                        message["payload"].pop("headers", None)
+                    return 200, message
+                if resource == "history":
+                    start = int(query["startHistoryId"][0])
+                    offset = int(query.get("pageToken", ["0"])[0])
+                    if start < 1000:
+                        return 404, {"error": {"code": 404, "message": "Requested entity was not found."}}
+                    with mailbox.lock:
+                        records = [r for r in (mailbox.messages[i] for i in mailbox.order) if int(r["historyId"]) > start]
+                    page = records[offset:offset + server.history_page_size]
+                    response = {
+                        "history": [
+                            {"id": r["historyId"], "messagesAdded": [{"message": {"id": r["id"], "threadId": r["threadId"], "labelIds": r["labelIds"]}}]}
+                            for r in page
+                        ],
+                        "historyId": str(mailbox.history_id),
+                    }
+                    if offset + server.history_page_size < len(records):
+                        response["nextPageToken"] = str(offset + server.history_page_size)
+                    return 200, response
+                return 404, {"error": {"code": 404, "message": "Unknown endpoint"}}
+
+            def do_POST(self):
+                self._delay()
+                url = urlparse(self.path)
+                if url.path.startswith("/unsubscribe/"):
+                    self._read_json()
+                    server._count(unsubscribe=True)
+                    return self._send(200, {})
+                server._count()
+                mailbox = self._mailbox()
+                if mailbox is None:
+                    return self._send(401, {"error": {"code": 401, "message": "Invalid Credentials"}})
+                if url.path == "/batch/gmail/v1":
+                    return self._batch(mailbox)
+                body = self._read_json()
+                resource = url.path.split("/users/", 1)[-1].split("/", 1)[-1]
+                with mailbox.lock:
+                    if resource == "messages/batchModify":
+                        for msg_id in body.get("ids", []):
+                            record = mailbox.messages.get(msg_id)
+                            if record:
+                                labels = (set(record["labelIds"]) | set(body.get("addLabelIds", []))) - set(body.get("removeLabelIds", []))
+                                record["labelIds"] = sorted(labels)
+                        return self._send(204)
+                    if resource == "messages/batchDelete":
+                        for msg_id in body.get("ids", []):
+                            if mailbox.messages.pop(msg_id, None):
+                                mailbox.order.remove(msg_id)
+                        return self._send(204)
+                return self._send(404, {"error": {"code": 404, "message": "Unknown endpoint"}})
+
+        return Handler
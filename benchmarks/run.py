@@ -0,0 +1,357 @@
+"""Offline benchmarks for the sync pipeline and the batch-action routes.
+
+Every scenario runs in its own process against a fresh SQLite database, the
+fake Gmail server in benchmarks/fake_gmail.py and the fake Gemini model in
+benchmarks/fake_gemini.py, so no Google service is contacted.
+
+    python -m benchmarks.run                       # all scenarios, results saved as JSON
+    python -m benchmarks.run --scenario backfill --mailbox-size 2000
+    python -m benchmarks.run --compare benchmarks/results/<old>.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+from benchmarks.fake_gmail import FakeGmailServer, FakeMailbox, COMPLEXITIES
+from benchmarks.fake_gemini import FakeGemini
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+CATEGORIES = [("Newsletters", "Mailing lists and marketing"), ("Receipts", "Orders and invoices"), ("Work", "Projects and meetings")]
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered) + 0.5) - 1))]
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class Bench:
+    """Wires the app to the fakes inside a scenario's process."""
+
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix="email-ai-bench-")
+        self.gmail = FakeGmailServer(latency=args.gmail_latency, jitter=args.gmail_latency / 2).start()
+        self.gemini = FakeGemini(latency=args.gemini_latency, jitter=args.gemini_latency / 4, rate_limit_rate=args.rate_limit_rate)
+
+        os.environ.update({
+            "DATABASE_URL": f"sqlite:///{self.workdir}/bench.db",
+            "GOOGLE_API_KEY": "benchmark",
+            "GMAIL_API_URL": self.gmail.api_url,
+            "GMAIL_FULL_SYNC_MAX_RESULTS": str(max(args.mailbox_size, args.messages_per_account)),
+            "GEMINI_REQUESTS_PER_MINUTE": str(args.gemini_rpm),
+            "GEMINI_TOKENS_PER_MINUTE": "1000000000",
+            "WORKER_POLL_INTERVAL": "0.05",
+        })
+
+        from app import db, ai_utils, worker, scheduler, category_routes  # noqa: F401 - registers every model
+        from app.rate_limiter import gemini_limiter
+        db.engine.echo = False
+        db.create_db_and_tables()
+        ai_utils.genai.GenerativeModel = self.gemini.model_factory()
+        ai_utils.genai.embed_content = self.gemini.embed_content
+        # Keep injected rate limits from turning into minute-long sleeps.
+        gemini_limiter.base_backoff = args.gemini_backoff
+        gemini_limiter.max_backoff = args.gemini_backoff * 8
+        self.engine = db.engine
+
+    def session(self):
+        from sqlmodel import Session
+        return Session(self.engine)
+
+    def add_account(self, owner_email: str, linked_email: str, mailbox_size: int, seed: int) -> dict:
+        from app.models.category import Category
+        from app.models.linked_account import LinkedAccount
+        token_data = {"access_token": f"token-{linked_email}", "client_id": "bench", "client_secret": "bench"}
+        self.gmail.add_mailbox(token_data["access_token"], FakeMailbox(
+            linked_email, size=mailbox_size, complexity=self.args.complexity, body_bytes=self.args.body_bytes, seed=seed
+        ))
+        with self.session() as session:
+            if owner_email == linked_email:
+                for name, description in CATEGORIES:
+                    session.add(Category(name=name, description=description, user_email=owner_email))
+            session.add(LinkedAccount(
+                owner_email=owner_email, linked_email=linked_email, token_data=json.dumps(token_data), is_primary=owner_email == linked_email
+            ))
+            session.commit()
+        return token_data
+
+    def sync(self, owner_email: str, linked_email: str, token_data: dict):
+        from app.tasks import process_emails_task_logic
+        with self.session() as session:
+            process_emails_task_logic(owner_email, {"email": linked_email}, token_data, db_session=session)
+
+    def email_ids(self, owner_email: str) -> List[str]:
+        from sqlmodel import select
+        from app.models.email import Email
+        with self.session() as session:
+            return list(session.exec(select(Email.id).where(Email.user_email == owner_email).order_by(Email.id)).all())
+
+    def batch_action(self, owner_email: str, token_data: dict, action: str, email_ids: List[str]):
+        from starlette.requests import Request
+        from app.category_routes import handle_batch_action
+        request = Request({
+            "type": "http", "method": "POST", "path": "/", "headers": [],
+            "session": {"user": {"email": owner_email}, "token": token_data},
+        })
+        with self.session() as session:
+            asyncio.run(handle_batch_action(request, category_id="bench", action=action, email_ids=email_ids, session=session))
+
+
+def _timed(samples: List[float], function: Callable, *args, **kwargs):
+    start = time.perf_counter()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        samples.append(time.perf_counter() - start)
+
+
+def scenario_backfill(bench: Bench) -> Dict:
+    """First sync of fresh accounts: full listing, fetch, classify, store, archive."""
+    samples = []
+    for i in range(bench.args.iterations):
+        email = f"backfill{i}@example.com"
+        token_data = bench.add_account(email, email, bench.args.mailbox_size, seed=i)
+        _timed(samples, bench.sync, email, email, token_data)
+    return {"emails": bench.args.mailbox_size * bench.args.iterations, "latencies": samples, "unit": "account sync"}
+
+def scenario_incremental(bench: Bench) -> Dict:
+    """Syncs that pick up new messages from the history cursor."""
+    email = "incremental@example.com"
+    token_data = bench.add_account(email, email, 0, seed=1)
+    bench.sync(email, email, token_data)
+    mailbox = bench.gmail.mailboxes[token_data["access_token"]]
+    samples = []
+    for _ in range(bench.args.iterations):
+        mailbox.add_messages(bench.args.messages_per_account)
+        _timed(samples, bench.sync, email, email, token_data)
+    return {"emails": bench.args.messages_per_account * bench.args.iterations, "latencies": samples, "unit": "incremental sync"}
+
+def scenario_cron(bench: Bench) -> Dict:
+    """/cron/sync-all over many accounts, run by the job workers."""
+    from sqlmodel import select, func
+    from app import worker
+    from app.models.job import Job
+    from app.scheduler import schedule_sync_all
+
+    owners = max(1, bench.args.accounts // 3)
+    for i in range(bench.args.accounts):
+        owner = f"owner{i % owners}@example.com"
+        linked = owner if i < owners else f"linked{i}@example.com"
+        bench.add_account(owner, linked, bench.args.messages_per_account, seed=100 + i)
+
+    samples = []
+    handler = worker.JOB_HANDLERS["sync_emails"]
+    lock = threading.Lock()
+
+    def timed_handler(**payload):
+        start = time.perf_counter()
+        try:
+            handler(**payload)
+        finally:
+            with lock:
+                samples.append(time.perf_counter() - start)
+
+    worker.JOB_HANDLERS["sync_emails"] = timed_handler
+    with bench.session() as session:
+        run_id = schedule_sync_all(session).id
+    stop_event, threads = worker.start_workers(bench.args.concurrency)
+    try:
+        while True:
+            with bench.session() as session:
+                pending = session.exec(
+                    select(func.count()).select_from(Job).where(Job.run_id == run_id, Job.status.in_(["queued", "running"]))
+                ).one()
+            if not pending:
+                break
+            time.sleep(0.05)
+    finally:
+        worker.stop_workers(stop_event, threads)
+        worker.JOB_HANDLERS["sync_emails"] = handler
+    return {"emails": bench.args.accounts * bench.args.messages_per_account, "latencies": samples, "unit": "account sync job"}
+
+def _stored_account(bench: Bench, email: str) -> dict:
+    token_data = bench.add_account(email, email, bench.args.mailbox_size, seed=7)
+    bench.sync(email, email, token_data)
+    return token_data
+
+def scenario_bulk_delete(bench: Bench) -> Dict:
+    """The batch-action route deleting stored emails, batch_size at a time."""
+    email = "delete@example.com"
+    token_data = _stored_account(bench, email)
+    ids = bench.email_ids(email)
+    samples = []
+    for start in range(0, len(ids), bench.args.batch_size):
+        _timed(samples, bench.batch_action, email, token_data, "delete", ids[start:start + bench.args.batch_size])
+    return {"emails": len(ids), "latencies": samples, "unit": "delete request"}
+
+def scenario_unsubscribe(bench: Bench) -> Dict:
+    """The batch-action route queueing unsubscribes and the job running them
+    through one-click List-Unsubscribe."""
+    from app import worker
+    email = "unsubscribe@example.com"
+    token_data = _stored_account(bench, email)
+    ids = bench.email_ids(email)
+    samples = []
+
+    def unsubscribe_batch(batch_ids: List[str]):
+        bench.batch_action(email, token_data, "unsubscribe", batch_ids)
+        while worker.run_next_job():
+            pass
+
+    for start in range(0, len(ids), bench.args.batch_size):
+        _timed(samples, unsubscribe_batch, ids[start:start + bench.args.batch_size])
+    return {"emails": len(ids), "latencies": samples, "unit": "unsubscribe batch"}
+
+SCENARIOS = {
+    "backfill": scenario_backfill,
+    "incremental": scenario_incremental,
+    "cron": scenario_cron,
+    "bulk_delete": scenario_bulk_delete,
+    "unsubscribe": scenario_unsubscribe,
+}
+
+
+def run_scenario(name: str, args) -> Dict:
+    bench = Bench(args)
+    try:
+        start = time.perf_counter()
+        outcome = SCENARIOS[name](bench)
+        seconds = time.perf_counter() - start
+    finally:
+        bench.gmail.stop()
+    latencies = outcome["latencies"]
+    return {
+        "emails": outcome["emails"],
+        "seconds": round(seconds, 3),
+        "emails_per_second": round(outcome["emails"] / seconds, 2) if seconds else None,
+        "latency_unit": outcome["unit"],
+        "latency_samples": len(latencies),
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "peak_rss_mb": peak_rss_mb(),
+        "gmail_requests": bench.gmail.requests_served,
+        "one_click_unsubscribes": bench.gmail.unsubscribes,
+        "gemini_calls": bench.gemini.calls,
+        "gemini_embed_calls": bench.gemini.embed_calls,
+        "gemini_rate_limited": bench.gemini.rate_limited,
+    }
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def _config(args) -> Dict:
+    return {key: value for key, value in vars(args).items() if key not in ("child", "scenario", "output", "compare")}
+
+def _child_command(name: str, args, result_file: str) -> List[str]:
+    command = [sys.executable, "-m", "benchmarks.run", "--child", result_file, "--scenario", name]
+    for key, value in _config(args).items():
+        flag = "--" + key.replace("_", "-")
+        if isinstance(value, bool):
+            if value:
+                command.append(flag)
+        else:
+            command += [flag, str(value)]
+    return command
+
+def compare(baseline_path: str, results: Dict):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('commit')}):")
+    print(f"{'scenario':<14}{'metric':<20}{'before':>12}{'after':>12}{'change':>10}")
+    for name, after in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        for metric in ("emails_per_second", "latency_p50_ms", "latency_p99_ms", "peak_rss_mb"):
+            old, new = before.get(metric), after.get(metric)
+            if not old or new is None:
+                continue
+            print(f"{name:<14}{metric:<20}{old:>12}{new:>12}{(new - old) / old * 100:>+9.1f}%")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the offline benchmarks.")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="Scenario to run (repeatable, default: all).")
+    parser.add_argument("--quick", action="store_true", help="Tiny sizes, for checking the harness itself.")
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--mailbox-size", type=int, default=200, help="Messages per account for backfill, delete and unsubscribe.")
+    parser.add_argument("--messages-per-account", type=int, default=50, help="New messages per incremental or cron sync.")
+    parser.add_argument("--accounts", type=int, default=12, help="Linked accounts in the cron scenario.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Job workers in the cron scenario.")
+    parser.add_argument("--batch-size", type=int, default=50, help="Emails per delete/unsubscribe request.")
+    parser.add_argument("--complexity", choices=COMPLEXITIES, default="alternative", help="MIME structure of synthetic messages.")
+    parser.add_argument("--body-bytes", type=int, default=4000)
+    parser.add_argument("--gmail-latency", type=float, default=0.01, help="Seconds added to every fake Gmail request.")
+    parser.add_argument("--gemini-latency", type=float, default=0.2, help="Seconds per fake Gemini call.")
+    parser.add_argument("--gemini-rpm", type=float, default=100000, help="Requests per minute allowed by the app's Gemini limiter.")
+    parser.add_argument("--gemini-backoff", type=float, default=0.05, help="Base backoff after an injected rate limit.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of Gemini calls that fail with ResourceExhausted.")
+    parser.add_argument("--output", help="Where to write the JSON results (default: benchmarks/results/<time>-<commit>.json).")
+    parser.add_argument("--compare", help="A previous results file to compare against.")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.iterations, args.mailbox_size, args.messages_per_account, args.accounts = 1, 20, 10, 3
+        args.gmail_latency, args.gemini_latency = 0.0, 0.01
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        result = run_scenario(args.scenario[0], args)
+        with open(args.child, "w") as f:
+            json.dump(result, f)
+        return
+
+    results = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": _config(args),
+        "scenarios": {},
+    }
+    for name in args.scenario or list(SCENARIOS):
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+            result_file = f.name
+        print(f"Running {name}...", flush=True)
+        completed = subprocess.run(_child_command(name, args, result_file), stdout=subprocess.DEVNULL)
+        if completed.returncode != 0:
+            print(f"Scenario {name} failed with exit code {completed.returncode}.")
+            continue
+        with open(result_file) as f:
+            results["scenarios"][name] = json.load(f)
+        os.unlink(result_file)
+        scenario = results["scenarios"][name]
+        print(f"  {scenario['emails_per_second']} emails/s, p50 {scenario['latency_p50_ms']} ms, "
+              f"p99 {scenario['latency_p99_ms']} ms per {scenario['latency_unit']}, peak RSS {scenario['peak_rss_mb']} MB")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        compare(args.compare, results)
+    if len(results["scenarios"]) != len(args.scenario or SCENARIOS):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,14 @@ from unittest.mock import MagicMock
 
 from fastapi.testclient import TestClient
 from sqlmodel import SQLModel, Session, create_engine
+from sqlalchemy.pool import StaticPool
 
 from app.main import app
 from app.db import engine as real_engine
 from app.auth import get_session 
+from app.search import create_search_index, drop_search_index
 DATABASE_URL = "sqlite:///:memory:"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool)
 
 
 def get_session_override() -> Generator[Session, None, None]:
@@ -23,8 +25,10 @@ app.dependency_overrides[get_session] = get_session_override
 @pytest.fixture(name="session")
 def session_fixture() -> Generator[Session, None, None]:
     SQLModel.metadata.create_all(engine)
+    create_search_index(engine)
     with Session(engine) as session:
         yield session
+    drop_search_index(engine)
     SQLModel.metadata.drop_all(engine)
 
 
@@ -38,6 +42,12 @@ def mocker_fixture(mocker):
     return mocker
 
 
+@pytest.fixture(autouse=True)
+def no_embedding_router(mocker):
+    # Routing would call the Gemini embeddings API; tests that need it patch it in.
+    return mocker.patch("app.tasks.get_embedding_router", return_value=None)
+
+
 @pytest.fixture
 def authenticated_client(client: TestClient, mocker) -> TestClient:
     mock_user_data = {"email": "test@example.com", "name": "Test User"}
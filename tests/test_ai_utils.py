@@ -0,0 +1,70 @@
+import json
+from unittest.mock import MagicMock
+
+from app.ai_utils import summarize_and_categorize_emails
+from app.models.category import Category
+
+
+def _mock_gemini(mocker, *texts):
+    model = MagicMock()
+    model.generate_content.side_effect = [MagicMock(text=text) for text in texts]
+    mocker.patch("app.ai_utils.genai.GenerativeModel", return_value=model)
+    return model
+
+
+def test_batch_classification_uses_one_prompt_for_all_emails(mocker):
+
+    categories = [Category(name="Jobs", description="Job offers", user_email="u@example.com")]
+    model = _mock_gemini(mocker, "```json\n" + json.dumps([
+        {"id": "a", "summary": "A job offer.", "category": "Jobs"},
+        {"id": "b", "summary": "A newsletter.", "category": "Other"},
+    ]) + "\n```")
+
+    results = summarize_and_categorize_emails(
+        [{"id": "a", "body": "We are hiring"}, {"id": "b", "body": "Weekly digest"}], categories
+    )
+
+    assert results == {
+        "a": {"summary": "A job offer.", "category": "Jobs"},
+        "b": {"summary": "A newsletter.", "category": "Other"},
+    }
+    assert model.generate_content.call_count == 1
+
+
+def test_batch_classification_retries_invalid_entries_on_their_own(mocker):
+
+    categories = [Category(name="Jobs", description="Job offers", user_email="u@example.com")]
+    model = _mock_gemini(
+        mocker,
+        json.dumps([
+            {"id": "a", "summary": "A job offer.", "category": "Jobs"},
+            {"id": "b", "summary": "Made up.", "category": "Not A Category"},
+        ]),
+        json.dumps({"summary": "A newsletter.", "category": "Other"}),
+    )
+
+    results = summarize_and_categorize_emails(
+        [{"id": "a", "body": "We are hiring"}, {"id": "b", "body": "Weekly digest"}], categories
+    )
+
+    assert results["b"] == {"summary": "A newsletter.", "category": "Other"}
+    assert model.generate_content.call_count == 2
+    assert "Weekly digest" in model.generate_content.call_args.args[0]
+
+
+def test_invalid_retry_answers_leave_emails_unclassified(mocker):
+
+    categories = [Category(name="Jobs", description="Job offers", user_email="u@example.com")]
+    _mock_gemini(
+        mocker,
+        "not json",
+        json.dumps(["a list"]),
+        json.dumps({"summary": "A newsletter.", "category": "Newsletters"}),
+        json.dumps({"summary": " ", "category": "Jobs"}),
+    )
+
+    results = summarize_and_categorize_emails(
+        [{"id": "a", "body": "One"}, {"id": "b", "body": "Two"}, {"id": "c", "body": "Three"}], categories
+    )
+
+    assert results == {}
@@ -1,17 +1,24 @@
+import json
 from fastapi.testclient import TestClient
-from sqlmodel import Session
-from unittest.mock import MagicMock
+from sqlmodel import Session, select
+from unittest.mock import MagicMock, PropertyMock
+from datetime import datetime, timedelta, timezone
 
 from app.main import app
 from app.category_routes import get_session
+from app.email_routes import get_session as get_email_session
+from app.models.backfill_checkpoint import BackfillCheckpoint
 from app.models.category import Category
 from app.models.email import Email
+from app.models.job import Job
 
 def test_create_category_passes(authenticated_client: TestClient, mocker):
 
-    mocker.patch("fastapi.BackgroundTasks.add_task")
+    mock_enqueue_job = mocker.patch("app.category_routes.enqueue_job")
     mocker.patch("app.category_routes.set_sync_status")
-    
+    mocker.patch("fastapi.Request.session", new_callable=PropertyMock, return_value={
+        "user": {"email": "test@example.com"}, "token": {"access_token": "fake_token", "client_secret": "fake_secret"}
+    })
 
     mock_session = MagicMock(spec=Session)
 
@@ -30,6 +37,9 @@ def test_create_category_passes(authenticated_client: TestClient, mocker):
 
     mock_session.add.assert_called_once()
     mock_session.commit.assert_called_once()
+    mock_enqueue_job.assert_called_once()
+    assert mock_enqueue_job.call_args.args[0] == "sync_emails"
+    assert mock_enqueue_job.call_args.args[1] == {"owner_email": "test@example.com", "account_email": "test@example.com"}
     
 
     app.dependency_overrides.clear()
@@ -38,6 +48,7 @@ def test_create_category_passes(authenticated_client: TestClient, mocker):
 def test_batch_delete_emails_passes(authenticated_client: TestClient, mocker):
 
     mock_batch_delete = mocker.patch("app.category_routes.batch_delete_emails")
+    mocker.patch("app.category_routes.get_async_gmail_client")
     mock_session = MagicMock(spec=Session)
     
 
@@ -52,4 +63,82 @@ def test_batch_delete_emails_passes(authenticated_client: TestClient, mocker):
 
     mock_batch_delete.assert_called_once()
     
-    app.dependency_overrides.clear()
\ No newline at end of file
+    app.dependency_overrides.clear()
+
+def test_category_emails_api_pages_with_a_cursor(client: TestClient, session: Session, mocker):
+
+    mocker.patch("fastapi.Request.session", new_callable=PropertyMock, return_value={"user": {"email": "test@example.com"}})
+    category = Category(id="cat1", name="Promotions", description="Offers", user_email="test@example.com")
+    session.add(category)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for i in range(5):
+        session.add(Email(
+            id=f"m{i}", user_email="test@example.com", summary=f"Offer {i}", snippet="", sent_date="",
+            sent_at=start + timedelta(days=i), from_address="shop@store.com", body="<p>big body</p>", category_id="cat1"
+        ))
+    session.add(Email(
+        id="legacy", user_email="test@example.com", summary="Old", snippet="", sent_date="",
+        from_address="shop@store.com", category_id="cat1"
+    ))
+    session.commit()
+    app.dependency_overrides[get_session] = lambda: session
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/api/categories/cat1/emails", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        assert all("body" not in email for email in page["emails"])
+        seen.extend(email["id"] for email in page["emails"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    assert seen == ["m4", "m3", "m2", "m1", "m0", "legacy"]
+
+    app.dependency_overrides.clear()
+
+def test_batch_unsubscribe_queues_a_job_and_reports_progress(client: TestClient, session: Session, mocker):
+
+    mocker.patch("fastapi.Request.session", new_callable=PropertyMock, return_value={
+        "user": {"email": "test@example.com"}, "token": {"access_token": "fake_token"}
+    })
+    session.add(Email(id="m1", user_email="test@example.com", summary="", snippet="", sent_date="", from_address="shop@store.com"))
+    session.add(Email(id="other", user_email="other@example.com", summary="", snippet="", sent_date="", from_address="a@b.com"))
+    session.commit()
+    app.dependency_overrides[get_session] = lambda: session
+
+    response = client.post(
+        "/categories/cat1/batch-action", data={"action": "unsubscribe", "email_ids": ["m1", "other"]}, follow_redirects=False
+    )
+
+    assert response.status_code == 303
+    batch_id = response.headers["location"].rsplit("/", 1)[1]
+    job = session.exec(select(Job)).one()
+    assert job.kind == "unsubscribe_emails"
+    assert json.loads(job.payload) == {"owner_email": "test@example.com", "batch_id": batch_id}
+    status = client.get(f"/unsubscribe-results/{batch_id}/status").json()
+    assert (status["done"], status["total"]) == (0, 1)
+    assert status["results"][0]["status"] == "pending"
+
+    app.dependency_overrides.clear()
+
+def test_backfill_accepts_only_iso_dates(client: TestClient, session: Session, mocker):
+
+    mocker.patch("fastapi.Request.session", new_callable=PropertyMock, return_value={
+        "user": {"email": "test@example.com"}, "token": {"access_token": "fake_token"}
+    })
+    app.dependency_overrides[get_email_session] = lambda: session
+
+    rejected = client.post("/backfill", data={"after": "2024-01-01 OR from:me"}, follow_redirects=False)
+    accepted = client.post("/backfill", data={"after": "2024-01-05", "before": ""}, follow_redirects=False)
+
+    assert rejected.status_code == 400
+    assert accepted.status_code == 303
+    checkpoint = session.get(BackfillCheckpoint, "test@example.com")
+    assert (checkpoint.after, checkpoint.before) == ("2024-01-05", None)
+    assert len(session.exec(select(Job)).all()) == 1
+
+    app.dependency_overrides.clear()
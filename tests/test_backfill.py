@@ -0,0 +1,110 @@
+import json
+import pytest
+from sqlmodel import Session, select
+from google.api_core.exceptions import ResourceExhausted
+
+from app.tasks import process_backfill_task_logic, process_backfill_task_wrapper, start_backfill, backfill_query
+from app.gmail_async import GmailApiError
+from app.classification_cache import clear_cache
+from app.models.backfill_checkpoint import BackfillCheckpoint
+from app.models.category import Category
+from app.models.email import Email
+from app.models.job import Job
+from app.models.linked_account import LinkedAccount
+
+OWNER = "test@example.com"
+PAGES = {None: (["a", "b", "c"], "p2"), "p2": (["d", "e", "f"], None)}
+
+
+def _list_page(client, page_token=None, query=None, label_ids=("INBOX",)):
+    if page_token not in PAGES:
+        raise GmailApiError(400, "Invalid pageToken")
+    ids, next_token = PAGES[page_token]
+    return [{"id": msg_id} for msg_id in ids], next_token
+
+def _details(client, ids):
+    return {msg_id: {
+        "id": msg_id, "snippet": f"Message {msg_id}", "body": f"<p>Job offer number {msg_id}</p>",
+        "date": "Some Date", "from": f"{msg_id}@example.com"
+    } for msg_id in ids}, {}
+
+def _classify(emails, user_categories):
+    return {email["id"]: {"summary": "A job offer.", "category": "Jobs"} for email in emails}
+
+@pytest.fixture
+def gmail(session: Session, mocker, monkeypatch):
+    clear_cache()
+    monkeypatch.setattr("app.tasks.GMAIL_BATCH_SIZE", 2)
+    session.add(Category(name="Jobs", description="Job offers", user_email=OWNER))
+    session.commit()
+    mocker.patch("app.tasks.batch_archive_emails", return_value={})
+    return {
+        "client": mocker.patch("app.tasks.get_async_gmail_client"),
+        "list": mocker.patch("app.tasks.list_messages_page", side_effect=_list_page),
+        "details": mocker.patch("app.tasks.batch_get_message_details", side_effect=_details),
+    }
+
+
+def test_backfill_query_uses_gmail_date_syntax():
+
+    assert backfill_query("2024-01-31", "2024-03-01") == "after:2024/01/31 before:2024/03/01"
+    assert backfill_query() is None
+
+
+def test_backfill_resumes_from_the_last_processed_message(session: Session, mocker, gmail):
+
+    start_backfill(OWNER, OWNER, session, after="2024-01-01")
+    calls = []
+    def classify_until_f(emails, user_categories):
+        calls.append([email["id"] for email in emails])
+        if any(email["id"] == "f" for email in emails):
+            raise ResourceExhausted("quota")
+        return _classify(emails, user_categories)
+    mocker.patch("app.tasks.summarize_and_categorize_emails", side_effect=classify_until_f)
+
+    with pytest.raises(ResourceExhausted):
+        process_backfill_task_logic(OWNER, {"email": OWNER}, {}, db_session=session)
+
+    checkpoint = session.get(BackfillCheckpoint, OWNER)
+    assert (checkpoint.page_token, checkpoint.last_message_id, checkpoint.pages_done) == ("p2", "e", 1)
+    assert gmail["list"].call_args.args[2] == "after:2024/01/01"
+
+    mocker.patch("app.tasks.summarize_and_categorize_emails", side_effect=_classify)
+    assert process_backfill_task_logic(OWNER, {"email": OWNER}, {}, db_session=session) is True
+
+    assert gmail["details"].call_args.args[1] == ["f"]
+    assert sorted(session.exec(select(Email.id)).all()) == ["a", "b", "c", "d", "e", "f"]
+    session.refresh(checkpoint)
+    assert (checkpoint.status, checkpoint.pages_done, checkpoint.processed) == ("completed", 2, 6)
+
+
+def test_rejected_page_token_restarts_without_reprocessing(session: Session, mocker, gmail):
+
+    checkpoint = start_backfill(OWNER, OWNER, session)
+    checkpoint.page_token = "expired"
+    session.add(Email(id="a", user_email=OWNER, summary="", snippet="", sent_date="Some Date", from_address="a@example.com"))
+    session.commit()
+    mocker.patch("app.tasks.summarize_and_categorize_emails", side_effect=_classify)
+
+    assert process_backfill_task_logic(OWNER, {"email": OWNER}, {}, db_session=session) is True
+
+    assert [call.args[1] for call in gmail["list"].call_args_list] == ["expired", None, "p2"]
+    assert gmail["details"].call_args_list[0].args[1] == ["b", "c"]
+    assert session.get(BackfillCheckpoint, OWNER).status == "completed"
+
+
+def test_backfill_over_its_time_budget_queues_a_continuation(session: Session, mocker, gmail, monkeypatch):
+
+    monkeypatch.setattr("app.tasks.BACKFILL_JOB_SECONDS", 0)
+    mocker.patch("app.tasks.Session", return_value=session)
+    mocker.patch("app.tasks.summarize_and_categorize_emails", side_effect=_classify)
+    session.add(LinkedAccount(owner_email=OWNER, linked_email=OWNER, token_data=json.dumps({"access_token": "t"}), is_primary=True))
+    start_backfill(OWNER, OWNER, session)
+
+    process_backfill_task_wrapper(OWNER, OWNER)
+
+    assert session.get(BackfillCheckpoint, OWNER).page_token == "p2"
+    assert gmail["client"].call_args.args[0] == {"access_token": "t"}
+    job = session.exec(select(Job)).one()
+    assert (job.kind, job.account_email) == ("backfill_emails", OWNER)
+    assert json.loads(job.payload) == {"owner_email": OWNER, "account_email": OWNER}
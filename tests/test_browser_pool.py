@@ -0,0 +1,130 @@
+import asyncio
+
+from app.browser_pool import BrowserPool
+from app.gmail_async import run_gmail
+from app.worker import close_job_resources
+
+
+class FakeContext:
+    def __init__(self, browser):
+        self.browser = browser
+
+    async def new_page(self):
+        return self
+
+    async def close(self):
+        self.browser.open_contexts -= 1
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.connected = True
+        self.closed = False
+        self.open_contexts = 0
+
+    def is_connected(self):
+        return self.connected
+
+    async def new_context(self):
+        self.open_contexts += 1
+        return FakeContext(self)
+
+    async def close(self):
+        self.closed = True
+        self.connected = False
+
+
+class FakePlaywright:
+    def __init__(self):
+        self.launched = []
+        self.chromium = self
+
+    async def launch(self, headless=True):
+        self.launched.append(FakeBrowser())
+        return self.launched[-1]
+
+    async def start(self):
+        return self
+
+    async def stop(self):
+        pass
+
+
+def _patch_playwright(mocker) -> FakePlaywright:
+    playwright = FakePlaywright()
+    mocker.patch("app.browser_pool.async_playwright", return_value=playwright)
+    return playwright
+
+
+def test_pool_reuses_browser_and_recycles_after_max_uses(mocker):
+
+    playwright = _patch_playwright(mocker)
+    pool = BrowserPool(max_pages=2, max_uses=2)
+
+    async def scenario():
+        for _ in range(3):
+            async with pool.page():
+                pass
+        await pool.close()
+
+    asyncio.run(scenario())
+
+    assert len(playwright.launched) == 2
+    assert playwright.launched[0].closed
+    assert playwright.launched[0].open_contexts == 0
+
+
+def test_pool_replaces_crashed_browser(mocker):
+
+    playwright = _patch_playwright(mocker)
+    pool = BrowserPool(max_pages=2, max_uses=10)
+
+    async def scenario():
+        async with pool.page() as page:
+            page.browser.connected = False
+        async with pool.page() as page:
+            assert page.browser is playwright.launched[1]
+        await pool.close()
+
+    asyncio.run(scenario())
+
+    assert len(playwright.launched) == 2
+
+
+def test_pool_caps_concurrent_pages(mocker):
+
+    _patch_playwright(mocker)
+    pool = BrowserPool(max_pages=2, max_uses=100)
+    in_flight = []
+    peak = []
+
+    async def job():
+        async with pool.page():
+            in_flight.append(1)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.pop()
+
+    async def scenario():
+        await asyncio.gather(*(job() for _ in range(6)))
+        await pool.close()
+
+    asyncio.run(scenario())
+
+    assert max(peak) == 2
+
+
+def test_job_resources_close_the_pool_on_the_loop_that_opened_it(mocker):
+
+    playwright = _patch_playwright(mocker)
+    pool = BrowserPool(max_pages=2, max_uses=10)
+    mocker.patch("app.worker.browser_pool", pool)
+
+    async def use_page():
+        async with pool.page():
+            pass
+
+    run_gmail(use_page())
+    close_job_resources()
+
+    assert playwright.launched[0].closed
@@ -0,0 +1,57 @@
+from sqlmodel import Session
+
+from app import classification_cache
+from app.classification_cache import (
+    category_fingerprint, cache_key, lookup_classifications, store_classifications,
+    purge_stale_entries, get_cache_stats, clear_cache
+)
+from app.models.category import Category
+from app.models.classification_cache import ClassificationCache
+
+
+def test_cache_key_ignores_whitespace_but_not_categories():
+
+    jobs = [Category(name="Jobs", description="Job offers", user_email="u@example.com")]
+    renamed = [Category(name="Jobs", description="Recruiters only", user_email="u@example.com")]
+
+    assert cache_key("Hello   world\n", category_fingerprint(jobs)) == cache_key("Hello world", category_fingerprint(jobs))
+    assert category_fingerprint(jobs) != category_fingerprint(renamed)
+
+
+def test_lookup_hits_lru_then_table_and_counts_stats(session: Session):
+
+    clear_cache()
+    fingerprint = "f" * 64
+    key = cache_key("Weekly digest", fingerprint)
+
+    assert lookup_classifications([key], session) == {}
+    store_classifications({key: {"summary": "A digest.", "category": "Other"}}, "u@example.com", fingerprint, session)
+
+    clear_cache()
+    assert lookup_classifications([key], session) == {key: {"summary": "A digest.", "category": "Other"}}
+    assert lookup_classifications([key], session) == {key: {"summary": "A digest.", "category": "Other"}}
+    assert get_cache_stats()["hits"] == 2
+    assert get_cache_stats()["misses"] == 0
+
+
+def test_lru_evicts_oldest_entries(session: Session, monkeypatch):
+
+    clear_cache()
+    monkeypatch.setattr(classification_cache, "CLASSIFICATION_CACHE_SIZE", 1)
+
+    store_classifications({"k1": {"summary": "One.", "category": "Other"}}, "u@example.com", "f", session)
+    store_classifications({"k2": {"summary": "Two.", "category": "Other"}}, "u@example.com", "f", session)
+
+    assert get_cache_stats()["evictions"] == 1
+    assert get_cache_stats()["size"] == 1
+
+
+def test_purge_stale_entries_drops_rows_from_old_category_sets(session: Session):
+
+    store_classifications({"old:1": {"summary": "Old.", "category": "Other"}}, "u@example.com", "old", session)
+    store_classifications({"new:1": {"summary": "New.", "category": "Other"}}, "u@example.com", "new", session)
+
+    purge_stale_entries("u@example.com", "new", session)
+
+    assert session.get(ClassificationCache, "old:1") is None
+    assert session.get(ClassificationCache, "new:1") is not None
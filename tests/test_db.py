@@ -0,0 +1,34 @@
+from sqlalchemy import inspect, text
+from sqlmodel import SQLModel, create_engine
+
+from app.db import add_missing_columns, drop_obsolete_indexes
+
+
+def test_add_missing_columns_upgrades_existing_tables():
+
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        connection.execute(text(
+            'CREATE TABLE email (id VARCHAR PRIMARY KEY, user_email VARCHAR, summary VARCHAR, snippet VARCHAR, '
+            'sent_date VARCHAR, from_address VARCHAR, body VARCHAR, category_id VARCHAR)'
+        ))
+    SQLModel.metadata.create_all(engine)
+
+    add_missing_columns(engine)
+
+    columns = {column["name"] for column in inspect(engine).get_columns("email")}
+    assert {"list_unsubscribe", "list_unsubscribe_post"} <= columns
+
+
+def test_replaced_category_index_is_dropped():
+
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE INDEX ix_email_category_sent_at_id ON email (category_id, sent_at, id)"))
+
+    drop_obsolete_indexes(engine)
+
+    indexes = {index["name"] for index in inspect(engine).get_indexes("email")}
+    assert "ix_email_category_sent_at_id" not in indexes
+    assert "ix_email_category_sent_at_desc" in indexes
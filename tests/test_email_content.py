@@ -0,0 +1,55 @@
+from sqlmodel import Session
+
+from app.email_content import store_email_contents, load_email_body, load_email_text, delete_orphaned_contents
+from app.migrate import move_bodies_to_content_table
+from app.models.email import Email
+from app.models.email_content import EmailContent
+
+
+def _email(email_id: str, **kwargs) -> Email:
+    return Email(id=email_id, user_email="test@example.com", summary="", snippet="", sent_date="", from_address="a@b.com", **kwargs)
+
+
+def test_identical_bodies_are_stored_once_and_compressed(session: Session):
+
+    body = "<html><body><p>Weekly digest</p>" + "<p>Same footer</p>" * 200 + "</body></html>"
+
+    first, second = store_email_contents(session, [body, body])
+    session.commit()
+
+    assert first == second
+    content = session.get(EmailContent, first)
+    assert len(content.html) < len(body) / 10
+    assert content.size == len(body)
+
+    email = _email("m1", content_hash=first)
+    assert load_email_body(session, email) == body
+    assert load_email_text(session, email).startswith("Weekly digest\n\nSame footer")
+
+
+def test_orphaned_contents_are_deleted_only_when_unreferenced(session: Session):
+
+    shared, unique = store_email_contents(session, ["<p>shared</p>", "<p>unique</p>"])
+    session.add(_email("m1", content_hash=shared))
+    session.commit()
+
+    delete_orphaned_contents(session, [shared, unique])
+    session.commit()
+
+    assert session.get(EmailContent, shared) is not None
+    assert session.get(EmailContent, unique) is None
+
+
+def test_migration_moves_legacy_bodies(session: Session):
+
+    session.add(_email("m1", body="<p>legacy</p>"))
+    session.add(_email("m2", body="<p>legacy</p>"))
+    session.commit()
+
+    assert move_bodies_to_content_table(session) == 2
+
+    session.expire_all()
+    migrated = session.get(Email, "m1")
+    assert migrated.body is None
+    assert migrated.content_hash == session.get(Email, "m2").content_hash
+    assert load_email_body(session, migrated) == "<p>legacy</p>"
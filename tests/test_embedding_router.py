@@ -0,0 +1,117 @@
+import numpy as np
+from sqlmodel import Session
+
+from app.embedding_router import CategoryRouter, get_embedding_router, clear_embedding_routers
+from app.tasks import process_emails_task_logic
+from app.classification_cache import clear_cache
+from app.models.category import Category
+from app.models.email import Email
+
+
+def _fake_embeddings(texts):
+    # One dimension per keyword, so similarity follows the words an email shares with a category.
+    keywords = ["job", "invoice", "newsletter"]
+    return np.array([[1.0 + text.lower().count(word) * 5 for word in keywords] for text in texts])
+
+
+def test_router_routes_confident_emails_and_defers_close_calls(monkeypatch):
+
+    monkeypatch.setattr("app.embedding_router.EMBEDDING_ROUTER_MARGIN", 0.1)
+    router = CategoryRouter(["jobs", "bills"], np.array([[1.0, 0.0], [0.0, 1.0]]), "fingerprint")
+
+    routes = router.route(np.array([[0.9, 0.1], [0.6, 0.55], [0.05, 1.0]]))
+
+    assert routes[0][0] == "jobs"
+    assert routes[1] is None
+    assert routes[2][0] == "bills"
+
+
+def test_single_category_router_leaves_emails_nearest_to_other_unrouted():
+
+    router = CategoryRouter(["jobs"], np.array([[1.0, 0.0]]), "fingerprint", other_vector=np.array([0.0, 1.0]))
+
+    routes = router.route(np.array([[1.0, 0.1], [0.6, 0.8]]))
+
+    assert routes[0][0] == "jobs"
+    assert routes[1] is None
+
+
+def test_built_router_has_an_other_centroid(session: Session, mocker):
+
+    clear_embedding_routers()
+    mocker.patch("app.embedding_router.embed_texts", side_effect=_fake_embeddings)
+    categories = [Category(id="jobs", name="Jobs", description="Job offers", user_email="u@example.com")]
+
+    router = get_embedding_router("u@example.com", categories, session)
+
+    assert router.category_ids == ["jobs", None]
+    routes = router.route(_fake_embeddings(["A job opening, apply to this job", "Our monthly newsletter"]))
+    assert routes[0][0] == "jobs"
+    assert routes[1] is None
+
+
+def test_learning_moves_a_category_centroid():
+
+    router = CategoryRouter(["jobs", "bills"], np.array([[1.0, 0.0], [0.0, 1.0]]), "fingerprint")
+    before = router.route(np.array([[0.7, 0.7]]))
+
+    router.learn("bills", np.array([[0.7, 0.7], [0.6, 0.8]]))
+
+    assert before == [None]
+    assert router.route(np.array([[0.7, 0.7]]))[0][0] == "bills"
+
+
+def test_router_is_cached_until_categories_change(session: Session, mocker):
+
+    clear_embedding_routers()
+    embed = mocker.patch("app.embedding_router.embed_texts", side_effect=_fake_embeddings)
+    categories = [Category(id="jobs", name="Jobs", description="Job offers", user_email="u@example.com")]
+
+    first = get_embedding_router("u@example.com", categories, session)
+    assert get_embedding_router("u@example.com", categories, session) is first
+    assert embed.call_count == 1
+
+    categories[0].description = "Job offers and recruiters"
+    assert get_embedding_router("u@example.com", categories, session) is not first
+
+
+def test_failed_embeddings_disable_routing_until_retry(session: Session, mocker):
+
+    clear_embedding_routers()
+    embed = mocker.patch("app.embedding_router.embed_texts", return_value=None)
+    categories = [Category(id="jobs", name="Jobs", description="Job offers", user_email="u@example.com")]
+
+    assert get_embedding_router("u@example.com", categories, session) is None
+    assert get_embedding_router("u@example.com", categories, session) is None
+    assert embed.call_count == 1
+
+
+def test_sync_sends_only_unrouted_emails_to_gemini(session: Session, mocker, no_embedding_router):
+
+    clear_cache()
+    clear_embedding_routers()
+    owner_email = "test@example.com"
+    session.add(Category(id="jobs", name="Jobs", description="Job offers", user_email=owner_email))
+    session.add(Category(id="bills", name="Bills", description="Invoice and payments", user_email=owner_email))
+    session.commit()
+    no_embedding_router.side_effect = get_embedding_router
+    mocker.patch("app.embedding_router.embed_texts", side_effect=_fake_embeddings)
+    mocker.patch("app.tasks.get_async_gmail_client")
+    mocker.patch("app.tasks.batch_archive_emails", return_value={})
+    mocker.patch("app.tasks.sync_messages", return_value=([{"id": "a"}, {"id": "b"}], "1"))
+    mocker.patch("app.tasks.batch_get_message_details", return_value=({
+        "a": {"id": "a", "snippet": "A new job for you.", "body": "<p>A new job opening, apply to this job.</p>",
+              "date": "Some Date", "from": "jobs@example.com"},
+        "b": {"id": "b", "snippet": "Our newsletter.", "body": "<p>Our monthly newsletter.</p>",
+              "date": "Some Date", "from": "news@example.com"},
+    }, {}))
+    mock_summarize = mocker.patch("app.tasks.summarize_and_categorize_emails", return_value={
+        "b": {"summary": "A newsletter.", "category": "Bills"}
+    })
+
+    process_emails_task_logic(owner_email, {"email": owner_email}, {}, db_session=session)
+
+    assert [email["id"] for email in mock_summarize.call_args.args[0]] == ["b"]
+    assert session.get(Email, "a").category_id == "jobs"
+    assert session.get(Email, "a").summary == "A new job for you."
+    assert session.get(Email, "b").category_id == "bills"
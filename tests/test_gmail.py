@@ -0,0 +1,60 @@
+import json
+import base64
+from sqlmodel import Session
+
+from app.gmail import refreshed_token_data, select_body_parts, parse_message_metadata, _decode_part, decode_base64url
+from app.gmail_async import AsyncGmailClient
+from app.tasks import save_refreshed_token
+from app.models.linked_account import LinkedAccount
+
+TOKEN_DATA = {"access_token": "old-token", "refresh_token": "refresh", "client_id": "id", "client_secret": "secret"}
+
+
+def _b64(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode()).decode().rstrip("=")
+
+
+def test_body_parts_find_the_html_part_of_nested_multiparts():
+
+    message = {"id": "m1", "snippet": "hi", "payload": {
+        "mimeType": "multipart/mixed", "headers": [{"name": "From", "value": "a@b.com"}],
+        "parts": [
+            {"mimeType": "multipart/related", "parts": [
+                {"mimeType": "multipart/alternative", "parts": [
+                    {"mimeType": "text/plain", "body": {"data": _b64("plain")}},
+                    {"mimeType": "text/html", "body": {"data": _b64("<p>html</p>")}},
+                ]},
+                {"mimeType": "image/png", "filename": "logo.png", "body": {"attachmentId": "a1"}},
+            ]},
+            {"mimeType": "text/html", "filename": "invoice.html", "body": {"data": _b64("<p>attached</p>")}},
+        ],
+    }}
+
+    parts = select_body_parts(message["payload"])
+
+    assert [_decode_part(part) for part in parts] == ["<p>html</p>", "plain"]
+    assert parse_message_metadata(message)["from"] == "a@b.com"
+
+
+def test_decode_base64url_stops_at_the_size_limit():
+
+    data = _b64("x" * 200000)
+
+    assert decode_base64url(data) == b"x" * 200000
+    assert decode_base64url(data, max_bytes=100) == b"x" * 100
+
+
+def test_refreshed_token_is_written_back_to_linked_accounts(session: Session):
+
+    session.add(LinkedAccount(owner_email="owner@example.com", linked_email="a@example.com", token_data=json.dumps(TOKEN_DATA)))
+    session.commit()
+    client = AsyncGmailClient(TOKEN_DATA)
+    assert refreshed_token_data(client, TOKEN_DATA) is None
+
+    client.credentials.token = "new-token"
+    current = save_refreshed_token("a@example.com", TOKEN_DATA, client, session)
+
+    assert current["access_token"] == "new-token"
+    account = session.get(LinkedAccount, 1)
+    assert json.loads(account.token_data)["access_token"] == "new-token"
+    assert json.loads(account.token_data)["refresh_token"] == "refresh"
@@ -0,0 +1,162 @@
+import re
+import json
+import asyncio
+import base64
+import httpx
+
+from app.gmail import refreshed_token_data
+from app.gmail_async import AsyncGmailClient, batch_get_message_details, sync_messages, run_gmail
+
+TOKEN_DATA = {"access_token": "old-token", "refresh_token": "refresh", "client_id": "id", "client_secret": "secret"}
+
+
+def _message(msg_id: str) -> dict:
+    body = base64.urlsafe_b64encode(b"hello").decode()
+    return {"id": msg_id, "snippet": "hi", "payload": {"headers": [{"name": "From", "value": "a@b.com"}], "body": {"data": body}}}
+
+def _batch_response(request: httpx.Request, respond) -> httpx.Response:
+    """Answers a batch request with respond(msg_id, params) -> (status, body) per part."""
+    parts = []
+    for msg_id, query in re.findall(rb"GET [^ ]*/messages/([^?\s]+)\?(\S*)", request.content):
+        status, body = respond(msg_id.decode(), httpx.QueryParams(query.decode()))
+        parts.append(
+            f"--resp\r\nContent-Type: application/http\r\nContent-ID: <response-{msg_id.decode()}>\r\n\r\n"
+            f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n\r\n{json.dumps(body)}\r\n"
+        )
+    return httpx.Response(200, headers={"Content-Type": "multipart/mixed; boundary=resp"}, content="".join(parts) + "--resp--\r\n")
+
+def _use_transport(mocker, handler):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    mocker.patch("app.gmail_async.get_http_client", return_value=client)
+
+
+def test_messages_are_fetched_in_one_batch_request_per_chunk(mocker):
+
+    batches = []
+    attempts = {}
+
+    def handler(request: httpx.Request):
+        assert request.url.path == "/batch/gmail/v1"
+        batches.append(request)
+
+        def respond(msg_id, params):
+            attempts[msg_id] = attempts.get(msg_id, 0) + 1
+            if msg_id == "missing":
+                return 404, {"error": {"code": 404}}
+            if msg_id == "flaky" and attempts[msg_id] == 1:
+                return 503, {"error": {"code": 503}}
+            return 200, _message(msg_id)
+        return _batch_response(request, respond)
+
+    _use_transport(mocker, handler)
+    mocker.patch("app.gmail_async.asyncio.sleep")
+    client = AsyncGmailClient(TOKEN_DATA)
+
+    details_by_id, errors_by_id = asyncio.run(batch_get_message_details(
+        client, ["m1", "m2", "m3", "flaky", "missing"], batch_size=3
+    ))
+
+    assert len(batches) == 3
+    assert set(details_by_id) == {"m1", "m2", "m3", "flaky"}
+    assert details_by_id["m1"]["body"] == "hello"
+    assert set(errors_by_id) == {"missing"}
+    assert b"fields=id%2Csnippet%2Cpayload%28headers" in batches[0].content
+
+
+def test_message_details_fetch_headers_and_only_the_best_body_part(mocker):
+
+    html = base64.urlsafe_b64encode(b"<p>stored by attachment</p>").decode()
+    requests = []
+
+    def handler(request: httpx.Request):
+        requests.append(request)
+        if "/attachments/" in request.url.path:
+            return httpx.Response(200, json={"size": 27, "data": html})
+        return _batch_response(request, lambda msg_id, params: (200, {"id": "m1", "snippet": "hi", "payload": {
+            "mimeType": "multipart/mixed",
+            "headers": [{"name": "From", "value": "a@b.com"}, {"name": "List-Unsubscribe", "value": "<https://u.example.com>"}],
+            "parts": [
+                {"mimeType": "multipart/alternative", "parts": [
+                    {"mimeType": "text/plain", "body": {"size": 5, "data": "cGxhaW4"}},
+                    {"mimeType": "text/html", "body": {"size": 27, "attachmentId": "big-html"}},
+                ]},
+                {"mimeType": "application/pdf", "filename": "a.pdf", "body": {"size": 90000, "attachmentId": "pdf"}},
+            ]
+        }}))
+
+    _use_transport(mocker, handler)
+
+    details_by_id, errors_by_id = asyncio.run(batch_get_message_details(AsyncGmailClient(TOKEN_DATA), ["m1"]))
+
+    assert errors_by_id == {}
+    assert details_by_id["m1"]["body"] == "<p>stored by attachment</p>"
+    assert details_by_id["m1"]["list_unsubscribe"] == "<https://u.example.com>"
+    assert len([r for r in requests if "/attachments/" not in r.url.path]) == 1
+    assert [r.url.path.rsplit("/", 1)[-1] for r in requests if "/attachments/" in r.url.path] == ["big-html"]
+
+
+def test_oversized_body_parts_fall_back_to_plain_text(mocker):
+
+    mocker.patch("app.gmail_async.GMAIL_MAX_BODY_BYTES", 1000)
+
+    def handler(request: httpx.Request):
+        return _batch_response(request, lambda msg_id, params: (200, {"id": "m1", "snippet": "hi", "payload": {
+            "mimeType": "multipart/alternative", "headers": [], "parts": [
+                {"mimeType": "text/plain", "body": {"size": 5, "data": "cGxhaW4"}},
+                {"mimeType": "text/html", "body": {"size": 5000000, "attachmentId": "huge"}},
+            ]
+        }}))
+
+    _use_transport(mocker, handler)
+
+    details_by_id, _ = asyncio.run(batch_get_message_details(AsyncGmailClient(TOKEN_DATA), ["m1"]))
+
+    assert details_by_id["m1"]["body"] == "plain"
+
+
+def test_expired_token_is_refreshed_once_and_the_request_retried(mocker):
+
+    seen_tokens = []
+
+    def handler(request: httpx.Request):
+        if request.url.host == "oauth2.googleapis.com":
+            return httpx.Response(200, json={"access_token": "new-token", "expires_in": 3600})
+        seen_tokens.append(request.headers["Authorization"])
+        if request.headers["Authorization"] == "Bearer old-token":
+            return httpx.Response(401, text="expired")
+        return httpx.Response(200, json={"historyId": "42", "messages": [{"id": "m1"}]})
+
+    _use_transport(mocker, handler)
+    client = AsyncGmailClient(TOKEN_DATA)
+
+    messages, history_id = asyncio.run(sync_messages(client))
+
+    assert messages == [{"id": "m1"}] and history_id == "42"
+    assert seen_tokens.count("Bearer new-token") == 2
+    assert refreshed_token_data(client, TOKEN_DATA)["access_token"] == "new-token"
+
+
+def test_sync_messages_falls_back_to_full_sync_when_the_cursor_expired(mocker):
+
+    def handler(request: httpx.Request):
+        if request.url.path.endswith("/history"):
+            return httpx.Response(404, text="history expired")
+        if request.url.path.endswith("/profile"):
+            return httpx.Response(200, json={"historyId": "900"})
+        return httpx.Response(200, json={"messages": [{"id": "m9"}]})
+
+    _use_transport(mocker, handler)
+
+    messages, history_id = asyncio.run(sync_messages(AsyncGmailClient(TOKEN_DATA), start_history_id="100"))
+
+    assert messages == [{"id": "m9"}]
+    assert history_id == "900"
+
+
+def test_run_gmail_runs_coroutines_from_synchronous_code():
+
+    async def answer():
+        await asyncio.sleep(0)
+        return 42
+
+    assert run_gmail(answer()) == 42
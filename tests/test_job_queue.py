@@ -0,0 +1,120 @@
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from sqlmodel import Session
+
+from app.job_queue import enqueue_job, claim_job, complete_job, fail_job, fail_abandoned_jobs, extend_lease
+from app.migrate import strip_job_credentials
+from app.models.job import Job
+from app.worker import run_next_job
+
+
+def test_claim_marks_job_running_and_hides_it_from_other_workers(session: Session):
+
+    job = enqueue_job("sync_emails", {"owner_email": "test@example.com"}, session)
+
+    claimed = claim_job(session)
+
+    assert claimed.id == job.id
+    assert claimed.status == "running"
+    assert claimed.attempts == 1
+    assert claim_job(session) is None
+
+    complete_job(claimed, session)
+    assert session.get(Job, job.id).status == "completed"
+
+
+def test_failed_job_is_retried_with_backoff_then_marked_failed(session: Session):
+
+    job = enqueue_job("sync_emails", {}, session, max_attempts=2)
+
+    claimed = claim_job(session)
+    fail_job(claimed, "boom", session)
+    assert claimed.status == "queued"
+    assert claimed.run_after > datetime.now(timezone.utc)
+    assert claim_job(session) is None
+
+    claimed.run_after = datetime.now(timezone.utc) - timedelta(seconds=1)
+    session.add(claimed)
+    session.commit()
+
+    claimed = claim_job(session)
+    fail_job(claimed, "boom again", session)
+    assert session.get(Job, job.id).status == "failed"
+    assert session.get(Job, job.id).last_error == "boom again"
+
+
+def test_expired_visibility_timeout_makes_job_claimable_again(session: Session):
+
+    job = enqueue_job("sync_emails", {}, session, max_attempts=2)
+    claim_job(session, visibility_timeout=-1)
+
+    reclaimed = claim_job(session, visibility_timeout=-1)
+    assert reclaimed.id == job.id
+    assert reclaimed.attempts == 2
+
+    assert fail_abandoned_jobs(session) == 1
+    assert session.get(Job, job.id).status == "failed"
+
+
+def test_stale_attempt_cannot_finish_a_reclaimed_job(session: Session):
+
+    job = enqueue_job("sync_emails", {}, session, max_attempts=3)
+    with Session(session.get_bind()) as stale_worker:
+        stale = claim_job(stale_worker, visibility_timeout=-1)
+        stale_worker.expunge(stale)
+        current = claim_job(session)
+
+        assert extend_lease(job.id, stale.attempts, stale_worker) is False
+        assert complete_job(stale, stale_worker) is False
+        assert fail_job(stale, "late", stale_worker) is False
+
+    assert session.get(Job, job.id).status == "running"
+    assert extend_lease(job.id, current.attempts, session) is True
+    assert complete_job(current, session) is True
+    assert session.get(Job, job.id).status == "completed"
+
+
+def test_worker_extends_the_lease_while_a_job_runs(session: Session, mocker):
+
+    mocker.patch("app.worker.engine", session.get_bind())
+    mocker.patch("app.worker.JOB_HEARTBEAT_INTERVAL", 0.01)
+    extend = mocker.patch("app.worker.extend_lease", return_value=True)
+    mocker.patch.dict("app.worker.JOB_HANDLERS", {"sync_emails": lambda: time.sleep(0.1)})
+    job = enqueue_job("sync_emails", {}, session)
+
+    assert run_next_job() is True
+
+    assert extend.call_count >= 2
+    assert extend.call_args.args[:2] == (job.id, 1)
+
+
+def test_worker_runs_registered_handler(session: Session, mocker):
+
+    handler = mocker.MagicMock()
+    mocker.patch("app.worker.engine", session.get_bind())
+    mocker.patch.dict("app.worker.JOB_HANDLERS", {"sync_emails": handler})
+    job = enqueue_job("sync_emails", {"owner_email": "test@example.com"}, session)
+
+    assert run_next_job() is True
+    assert run_next_job() is False
+
+    handler.assert_called_once_with(owner_email="test@example.com")
+    session.expire_all()
+    assert session.get(Job, job.id).status == "completed"
+
+
+def test_credentials_migration_leaves_only_the_account_in_job_payloads(session: Session):
+
+    legacy = enqueue_job(
+        "sync_emails",
+        {"owner_email": "test@example.com", "processing_user_info": {"email": "linked@example.com"}, "token_data": {"refresh_token": "secret"}},
+        session, owner_email="test@example.com", account_email="linked@example.com"
+    )
+    current = enqueue_job("unsubscribe_emails", {"owner_email": "test@example.com", "batch_id": "b"}, session)
+
+    assert strip_job_credentials(session) == 1
+
+    session.expire_all()
+    assert json.loads(session.get(Job, legacy.id).payload) == {"owner_email": "test@example.com", "account_email": "linked@example.com"}
+    assert json.loads(session.get(Job, current.id).payload) == {"owner_email": "test@example.com", "batch_id": "b"}
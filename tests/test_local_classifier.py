@@ -0,0 +1,75 @@
+from sqlmodel import Session
+
+from app.local_classifier import LocalClassifier, get_local_classifier, extractive_summary, sender_domain, clear_local_classifiers
+from app.models.category import Category
+from app.models.email import Email
+
+
+def test_sender_rule_predicts_category_for_repetitive_domains():
+
+    classifier = LocalClassifier(["jobs", "promos"])
+    for _ in range(9):
+        classifier.learn("LinkedIn <jobs-noreply@linkedin.com>", "New jobs for you", "jobs")
+
+    category_id, confidence = classifier.predict("LinkedIn Jobs <alerts@linkedin.com>", "Anything at all")
+
+    assert category_id == "jobs"
+    assert confidence == 0.9
+
+
+def test_sender_rule_keys_freemail_senders_by_address():
+
+    classifier = LocalClassifier(["jobs", "personal"])
+    for _ in range(9):
+        classifier.learn("Recruiter <recruiter.jane@gmail.com>", "A role for you", "jobs")
+
+    assert classifier.predict("recruiter.jane@gmail.com", "")[0] == "jobs"
+    assert classifier.predict("Mom <mom@gmail.com>", "") is None
+
+
+def test_naive_bayes_separates_categories_by_content(monkeypatch):
+
+    monkeypatch.setattr("app.local_classifier.LOCAL_CLASSIFIER_MIN_EXAMPLES", 4)
+    classifier = LocalClassifier(["jobs", "bills"])
+    classifier.learn("a@one.com", "Senior engineer position at our company, apply now", "jobs")
+    classifier.learn("b@two.com", "Recruiter here about an engineer position", "jobs")
+    classifier.learn("c@three.com", "Your invoice is ready, payment due Friday", "bills")
+    classifier.learn("d@four.com", "Payment received for invoice 1234", "bills")
+
+    category_id, confidence = classifier.predict("new@five.com", "Invoice payment reminder")
+
+    assert category_id == "bills"
+    assert 0.5 < confidence <= 1.0
+
+
+def test_classifier_is_trained_from_the_email_table(session: Session):
+
+    clear_local_classifiers()
+    owner_email = "test@example.com"
+    jobs = Category(name="Jobs", description="Job offers", user_email=owner_email)
+    session.add(jobs)
+    session.commit()
+    for i in range(3):
+        session.add(Email(
+            id=f"m{i}", user_email=owner_email, summary="A job.", snippet="Apply now",
+            sent_date="Some Date", from_address="talent@gupy.io", category_id=jobs.id,
+            label_source="llm" if i < 2 else "cache"
+        ))
+    # Labels the local model produced itself are not trained on again.
+    session.add(Email(
+        id="m3", user_email=owner_email, summary="A job.", snippet="Apply now",
+        sent_date="Some Date", from_address="talent@gupy.io", category_id=jobs.id,
+        label_source="local"
+    ))
+    session.commit()
+
+    classifier = get_local_classifier(owner_email, [jobs], session)
+
+    assert classifier.example_count == 3
+    assert classifier.predict("noreply@gupy.io", "")[0] == jobs.id
+
+
+def test_extractive_summary_keeps_first_sentence():
+
+    assert extractive_summary("Your order has shipped. Track it here &amp; more.") == "Your order has shipped."
+    assert sender_domain("Shop <News@Store.COM>") == "store.com"
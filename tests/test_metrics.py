@@ -0,0 +1,69 @@
+import asyncio
+import httpx
+from fastapi.testclient import TestClient
+
+from app.metrics import Counter, Histogram, GMAIL_REQUESTS, GMAIL_REQUEST_SECONDS
+from app.gmail_async import AsyncGmailClient
+
+
+def test_counter_and_histogram_render_in_prometheus_text_format():
+
+    counter = Counter("things_total", "Things.", ["kind"])
+    counter.inc(kind="a")
+    counter.inc(2, kind='quoted "b"')
+    histogram = Histogram("work_seconds", "Work.", ["step"], buckets=(0.1, 1.0))
+    histogram.observe(0.05, step="parse")
+    histogram.observe(0.5, step="parse")
+    histogram.observe(3, step="parse")
+
+    lines = counter.render() + histogram.render()
+
+    assert "# TYPE things_total counter" in lines
+    assert 'things_total{kind="a"} 1' in lines
+    assert 'things_total{kind="quoted \\"b\\""} 2' in lines
+    assert 'work_seconds_bucket{step="parse",le="0.1"} 1' in lines
+    assert 'work_seconds_bucket{step="parse",le="1"} 2' in lines
+    assert 'work_seconds_bucket{step="parse",le="+Inf"} 3' in lines
+    assert 'work_seconds_sum{step="parse"} 3.55' in lines
+    assert 'work_seconds_count{step="parse"} 3' in lines
+
+
+def test_timed_decorator_covers_sync_and_async_functions():
+
+    histogram = Histogram("calls_seconds", "Calls.", ["name"])
+
+    @histogram.timed(name="sync")
+    def work():
+        return 1
+
+    @histogram.timed(name="async")
+    async def async_work():
+        return 2
+
+    assert work() == 1
+    assert asyncio.run(async_work()) == 2
+    assert histogram.count(name="sync") == 1
+    assert histogram.count(name="async") == 1
+
+
+def test_gmail_requests_are_counted_by_method_and_status(mocker):
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, json={"historyId": "1"})))
+    mocker.patch("app.gmail_async.get_http_client", return_value=client)
+    before = GMAIL_REQUESTS.value(method="getProfile", status="200")
+    timed_before = GMAIL_REQUEST_SECONDS.count(method="getProfile")
+
+    asyncio.run(AsyncGmailClient({"access_token": "t", "client_id": "id", "client_secret": "secret"}).get_profile())
+
+    assert GMAIL_REQUESTS.value(method="getProfile", status="200") == before + 1
+    assert GMAIL_REQUEST_SECONDS.count(method="getProfile") == timed_before + 1
+
+
+def test_metrics_endpoint_exposes_the_registry(client: TestClient):
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert "# TYPE gmail_requests_total counter" in response.text
+    assert "# TYPE db_query_seconds histogram" in response.text
+    assert "# TYPE job_queue_depth gauge" in response.text
@@ -0,0 +1,81 @@
+from sqlmodel import Session
+
+from app.near_duplicates import simhash, hamming_distances, templated_summary
+from app.tasks import process_emails_task_logic
+from app.email_content import store_email_contents
+from app.classification_cache import clear_cache
+from app.progress import sync_progress_event
+from app.models.category import Category
+from app.models.email import Email
+from app.models.sync_status import SyncStatus
+
+TEMPLATE = (
+    "Hi {name}, your order {order} has shipped and should arrive on {day}. You can follow the parcel from the "
+    "tracking page in your account at any time. If anything is wrong with your order, reply to this email and our "
+    "support team will get back to you within one business day. Thank you for shopping with Acme, we hope to see "
+    "you again soon. Returns are free for thirty days from delivery."
+)
+
+
+def test_simhash_is_close_for_template_emails_and_far_for_others():
+
+    first = simhash(TEMPLATE.format(name="Ana", order="1234", day="Friday"))
+    second = simhash(TEMPLATE.format(name="Bob", order="98765", day="Monday"))
+    unrelated = simhash("Weekly digest: ten articles about gardening, spring planting tips and the tools we loved this season.")
+
+    close, far = hamming_distances(first, [second, unrelated])
+
+    assert close <= 6
+    assert far > 12
+    assert simhash("") is None
+
+
+def test_templated_summary_swaps_changed_words():
+
+    old = TEMPLATE.format(name="Ana", order="1234", day="Friday")
+    new = TEMPLATE.format(name="Bob", order="98765", day="Monday")
+
+    assert templated_summary("Order 1234 for Ana ships Friday.", old, new) == "Order 98765 for Bob ships Monday."
+    assert templated_summary("Acme shipped an order.", old, new) == "Acme shipped an order."
+    assert templated_summary("Ana's order shipped.", old, "Your order shipped.") is None
+    assert templated_summary("Order 1234 for Ana ships Friday.", "Hi Ana", "Hi Bob") is None
+
+
+def test_sync_reuses_a_near_duplicate_instead_of_calling_gemini(session: Session, mocker):
+
+    clear_cache()
+    owner_email = "test@example.com"
+    orders = Category(name="Orders", description="Shipping notices", user_email=owner_email)
+    session.add(orders)
+    session.commit()
+    old_text = TEMPLATE.format(name="Ana", order="1234", day="Friday")
+    old_hash, = store_email_contents(session, [f"<p>{old_text}</p>"])
+    session.add(Email(
+        id="old", user_email=owner_email, summary="Order 1234 ships Friday.", snippet=old_text[:20], content_hash=old_hash,
+        sent_date="Some Date", from_address="Acme <orders@acme.com>", sender_address="orders@acme.com",
+        simhash=simhash(old_text), category_id=orders.id
+    ))
+    session.add(SyncStatus(owner_email=owner_email, status="processing"))
+    session.commit()
+    new_text = TEMPLATE.format(name="Ana", order="5678", day="Monday")
+
+    mocker.patch("app.tasks.get_async_gmail_client")
+    mocker.patch("app.tasks.batch_archive_emails", return_value={})
+    mocker.patch("app.tasks.sync_messages", return_value=([{"id": "new"}], "1"))
+    mocker.patch("app.tasks.batch_get_message_details", return_value=({"new": {
+        "id": "new", "snippet": new_text[:100], "body": f"<p>{new_text}</p>",
+        "date": "Some Date", "from": "Acme Orders <orders@acme.com>"
+    }}, {}))
+    mock_summarize = mocker.patch("app.tasks.summarize_and_categorize_emails")
+
+    process_emails_task_logic(owner_email, {"email": owner_email}, {}, db_session=session)
+
+    mock_summarize.assert_not_called()
+    stored = session.get(Email, "new")
+    assert stored.category_id == orders.id
+    assert stored.summary == "Order 5678 ships Monday."
+    assert stored.sender_address == "orders@acme.com"
+    status = session.get(SyncStatus, owner_email)
+    session.refresh(status)
+    assert sync_progress_event(status)["duplicates"] == 1
+    assert sync_progress_event(status)["duplicate_rate"] == 1.0
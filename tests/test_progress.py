@@ -0,0 +1,86 @@
+import json
+import asyncio
+import threading
+from datetime import datetime, timedelta, timezone
+from sqlmodel import Session
+
+from app.progress import ProgressBroker, sync_progress_event, PROGRESS_CHANNEL
+from app.tasks import set_sync_status, record_sync_progress, process_emails_task_logic
+from app.models.category import Category
+from app.models.sync_status import SyncStatus
+
+
+def test_events_published_from_worker_threads_reach_subscribers():
+
+    broker = ProgressBroker(queue_size=2)
+
+    async def scenario():
+        queue = broker.subscribe("test@example.com")
+        thread = threading.Thread(target=lambda: [broker.publish("test@example.com", {"n": n}) for n in range(3)])
+        thread.start()
+        thread.join()
+        broker.publish("other@example.com", {"n": "not mine"})
+        await asyncio.sleep(0.01)
+        received = [queue.get_nowait() for _ in range(queue.qsize())]
+        broker.unsubscribe("test@example.com", queue)
+        return received
+
+    assert asyncio.run(scenario()) == [{"n": 1}, {"n": 2}]
+    assert broker.subscriber_count("test@example.com") == 0
+
+
+def test_events_go_through_notify_when_the_broker_has_a_postgres_engine(mocker):
+
+    engine = mocker.MagicMock()
+    broker = ProgressBroker(notify_engine=engine)
+    deliver = mocker.patch.object(broker, "deliver")
+
+    broker.publish("test@example.com", {"type": "sync", "status": "processing"})
+
+    params = engine.connect.return_value.__enter__.return_value.execute.call_args.args[1]
+    assert params["channel"] == PROGRESS_CHANNEL
+    assert json.loads(params["payload"]) == {"owner_email": "test@example.com", "event": {"type": "sync", "status": "processing"}}
+    deliver.assert_not_called()
+    assert broker.cross_process is False
+
+
+def test_progress_counters_are_persisted_and_estimate_time_left(session: Session):
+
+    set_sync_status("test@example.com", "processing", session)
+    record_sync_progress("test@example.com", session, total=10, skipped=2)
+    record_sync_progress("test@example.com", session, fetched=3, classified=3, archived=2)
+
+    status_obj = session.get(SyncStatus, "test@example.com")
+    status_obj.started_at = datetime.now(timezone.utc) - timedelta(seconds=50)
+    event = sync_progress_event(status_obj)
+
+    assert (event["total"], event["fetched"], event["classified"], event["archived"], event["skipped"]) == (10, 3, 3, 2, 2)
+    assert event["eta_seconds"] == 50
+    assert sync_progress_event(None) == {"type": "sync", "status": "idle"}
+
+    set_sync_status("test@example.com", "processing", session)
+    assert sync_progress_event(session.get(SyncStatus, "test@example.com"))["total"] == 0
+
+
+def test_sync_pipeline_reports_its_progress(session: Session, mocker):
+
+    owner_email = "test@example.com"
+    session.add(Category(name="Jobs", description="Job offers", user_email=owner_email))
+    session.commit()
+    set_sync_status(owner_email, "processing", session)
+
+    mocker.patch("app.tasks.get_async_gmail_client")
+    mocker.patch("app.tasks.sync_messages", return_value=([{"id": "m1"}, {"id": "m2"}], "1001"))
+    mocker.patch("app.tasks.batch_get_message_details", return_value=(
+        {"m1": {"id": "m1", "snippet": "Job", "body": "<p>Job</p>", "date": "Mon, 1 Jan 2024 10:00:00 +0000", "from": "hr@company.com"}},
+        {"m2": "HTTP 500"}
+    ))
+    mocker.patch("app.tasks.summarize_and_categorize_emails", return_value={"m1": {"summary": "Offer", "category": "Jobs"}})
+    mocker.patch("app.tasks.batch_archive_emails", return_value={})
+    publish = mocker.patch("app.tasks.progress_broker.publish")
+
+    process_emails_task_logic(owner_email, {"email": owner_email}, {}, db_session=session)
+
+    event = publish.call_args.args[1]
+    assert (event["total"], event["fetched"], event["classified"], event["archived"], event["errors"]) == (2, 1, 1, 1, 1)
+    assert session.get(SyncStatus, owner_email).classified == 1
@@ -0,0 +1,50 @@
+from app.rate_limiter import RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_requests_beyond_the_bucket_have_to_wait():
+
+    clock = FakeClock()
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=1_000_000, clock=clock)
+
+    waits = [limiter.reserve() for _ in range(61)]
+
+    assert waits[:60] == [0.0] * 60
+    assert waits[60] == 1.0
+
+    clock.now += 2
+    assert limiter.reserve() == 0.0
+
+
+def test_token_bucket_limits_large_prompts():
+
+    clock = FakeClock()
+    limiter = RateLimiter(requests_per_minute=1000, tokens_per_minute=6000, clock=clock)
+
+    assert limiter.reserve(tokens=6000) == 0.0
+    assert limiter.reserve(tokens=3000) == 30.0
+
+
+def test_rate_limit_errors_lower_the_rate_and_successes_restore_it():
+
+    clock = FakeClock()
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=1_000_000, clock=clock, recovery_step=0.25)
+
+    first_delay = limiter.record_rate_limited()
+    second_delay = limiter.record_rate_limited()
+
+    assert limiter.rate_fraction == 0.25
+    assert 1.0 <= first_delay <= 2.0
+    assert 2.0 <= second_delay <= 4.0
+    assert limiter.reserve() == 4.0
+
+    limiter.record_success()
+    limiter.record_success()
+    assert limiter.rate_fraction == 0.75
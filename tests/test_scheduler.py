@@ -0,0 +1,61 @@
+import json
+from sqlmodel import Session, select
+
+from app.job_queue import enqueue_job, claim_job, complete_job
+from app.scheduler import schedule_sync_all, get_sync_run_progress
+from app.models.job import Job
+from app.models.linked_account import LinkedAccount
+from app.models.sync_status import SyncStatus
+
+
+def _link(session: Session, owner_email: str, linked_email: str):
+    session.add(LinkedAccount(owner_email=owner_email, linked_email=linked_email, token_data=json.dumps({"access_token": linked_email})))
+
+
+def test_schedule_sync_all_pages_accounts_and_skips_pending_syncs(session: Session):
+
+    for i in range(5):
+        _link(session, f"owner{i % 2}@example.com", f"account{i}@example.com")
+    session.add(SyncStatus(owner_email="owner0@example.com", status="completed"))
+    session.commit()
+    enqueue_job("sync_emails", {}, session, owner_email="owner1@example.com", account_email="account1@example.com")
+
+    run = schedule_sync_all(session, page_size=2)
+
+    assert run.queued_accounts == 4
+    assert run.skipped_accounts == 1
+    jobs = session.exec(select(Job).where(Job.run_id == run.id)).all()
+    assert sorted(job.account_email for job in jobs) == ["account0@example.com", "account2@example.com", "account3@example.com", "account4@example.com"]
+    assert json.loads(jobs[0].payload) == {"owner_email": jobs[0].owner_email, "account_email": jobs[0].account_email}
+    assert session.get(SyncStatus, "owner0@example.com").status == "processing"
+    assert session.get(SyncStatus, "owner1@example.com").status == "processing"
+
+    progress = get_sync_run_progress(run.id, session)
+    assert progress["jobs"] == {"queued": 4, "running": 0, "completed": 0, "failed": 0}
+    assert progress["finished"] is False
+    assert get_sync_run_progress("missing", session) is None
+
+
+def test_claim_shares_workers_across_owners(session: Session):
+
+    busy_first = enqueue_job("sync_emails", {}, session, owner_email="busy@example.com", account_email="a@example.com")
+    busy_second = enqueue_job("sync_emails", {}, session, owner_email="busy@example.com", account_email="b@example.com")
+    other = enqueue_job("sync_emails", {}, session, owner_email="other@example.com", account_email="c@example.com")
+
+    assert claim_job(session).id == busy_first.id
+    assert claim_job(session).id == other.id
+    assert claim_job(session) is None
+
+    complete_job(session.get(Job, busy_first.id), session)
+    assert claim_job(session).id == busy_second.id
+
+
+def test_owner_cap_applies_to_each_job_kind(session: Session):
+
+    sync = enqueue_job("sync_emails", {}, session, owner_email="busy@example.com", account_email="a@example.com")
+    enqueue_job("sync_emails", {}, session, owner_email="busy@example.com", account_email="b@example.com")
+    unsubscribe = enqueue_job("unsubscribe_emails", {}, session, owner_email="busy@example.com")
+
+    assert claim_job(session).id == sync.id
+    assert claim_job(session).id == unsubscribe.id
+    assert claim_job(session) is None
@@ -0,0 +1,102 @@
+from sqlalchemy import text
+from sqlmodel import Session
+
+from app.search import index_emails, remove_emails, search_emails, create_search_index, drop_search_index
+from app.migrate import rebuild_search_index
+from app.email_content import store_email_contents
+from app.models.email import Email
+
+
+def _document(email_id: str, user_email: str = "test@example.com", **kwargs) -> dict:
+    document = dict(id=email_id, user_email=user_email, summary="", from_address="a@b.com", snippet="", body_text="")
+    document.update(kwargs)
+    return document
+
+def _store(session: Session, documents):
+    for document in documents:
+        session.add(Email(
+            id=document["id"], user_email=document["user_email"], summary=document["summary"],
+            snippet=document["snippet"], sent_date="", from_address=document["from_address"]
+        ))
+    index_emails(session, documents)
+    session.commit()
+
+
+def test_search_ranks_summary_matches_first_and_scopes_to_owner(session: Session):
+
+    _store(session, [
+        _document("body-match", body_text="Your invoice for March is attached."),
+        _document("summary-match", summary="Invoice from the electricity company"),
+        _document("other-user", user_email="other@example.com", summary="Invoice reminder"),
+        _document("unrelated", summary="Team lunch on Friday"),
+    ])
+
+    results, next_cursor = search_emails(session, "test@example.com", "invoice")
+
+    assert [row.id for row in results] == ["summary-match", "body-match"]
+    assert next_cursor is None
+
+
+def test_search_paginates_and_matches_prefixes(session: Session):
+
+    _store(session, [_document(f"m{i}", snippet=f"Newsletter issue {i}" + " extra" * (i % 2)) for i in range(5)])
+    _store(session, [_document("other", user_email="other@example.com", snippet="Newsletter issue")])
+
+    first_page, next_cursor = search_emails(session, "test@example.com", "newslet", page_size=3)
+    second_page, last_cursor = search_emails(session, "test@example.com", "newslet", cursor=next_cursor, page_size=3)
+
+    assert len(first_page) == 3 and next_cursor is not None
+    assert len(second_page) == 2 and last_cursor is None
+    assert sorted(row.id for row in first_page + second_page) == [f"m{i}" for i in range(5)]
+
+
+def test_outdated_search_index_is_recreated_with_an_indexed_owner_column(session: Session):
+
+    engine = session.get_bind()
+    drop_search_index(engine)
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE email_search USING fts5("
+            "email_id UNINDEXED, user_email UNINDEXED, summary, from_address, snippet, body_text)"
+        ))
+
+    create_search_index(engine)
+
+    _store(session, [_document("m1", summary="Flight confirmation")])
+    results, _ = search_emails(session, "test@example.com", "flight")
+    assert [row.id for row in results] == ["m1"]
+
+
+def test_search_treats_query_syntax_as_plain_words(session: Session):
+
+    _store(session, [_document("m1", from_address="billing@shop.com")])
+
+    results, _ = search_emails(session, "test@example.com", 'billing@shop.com" OR NEAR(')
+
+    assert [row.id for row in results] == []
+    results, _ = search_emails(session, "test@example.com", "billing@shop.com")
+    assert [row.id for row in results] == ["m1"]
+    assert search_emails(session, "test@example.com", "  ?! ") == ([], None)
+
+
+def test_removed_emails_drop_out_of_results(session: Session):
+
+    _store(session, [_document("m1", summary="Flight confirmation"), _document("m2", summary="Flight delayed")])
+
+    remove_emails(session, ["m1"])
+    session.commit()
+
+    results, _ = search_emails(session, "test@example.com", "flight")
+    assert [row.id for row in results] == ["m2"]
+
+
+def test_rebuild_search_index_indexes_stored_email_text(session: Session):
+
+    [body_hash] = store_email_contents(session, ["<p>Your parcel has shipped</p>"])
+    session.add(Email(id="m1", user_email="test@example.com", summary="", snippet="", sent_date="", from_address="a@b.com", content_hash=body_hash))
+    session.commit()
+
+    assert rebuild_search_index(session) == 1
+
+    results, _ = search_emails(session, "test@example.com", "parcel")
+    assert [row.id for row in results] == ["m1"]
@@ -2,9 +2,14 @@ from sqlmodel import Session, select
 from app.tasks import process_emails_task_logic
 from app.models.category import Category
 from app.models.email import Email
+from app.models.sync_cursor import SyncCursor
+from app.classification_cache import clear_cache
+from app.email_content import load_email_body
+from app.search import search_emails
 
 def test_process_emails_logic(session: Session, mocker):
 
+    clear_cache()
     owner_email = "test@example.com"
     user_info = {"email": owner_email}
     token_data = {"access_token": "fake_token"}
@@ -15,31 +20,152 @@ def test_process_emails_logic(session: Session, mocker):
     session.add(cat2)
     session.commit()
 
-    mock_list_messages = mocker.patch("app.tasks.list_messages", return_value=[{"id": "msg1"}])
-    mock_get_details = mocker.patch("app.tasks.get_message_details", return_value={
-        "id": "msg1",
-        "snippet": "Job opportunity...",
-        "body": "<html>...</html>",
-        "date": "Some Date",
-        "from": "recruiter@company.com"
-    })
-    mock_archive_email = mocker.patch("app.tasks.archive_email")
+    mock_sync_messages = mocker.patch("app.tasks.sync_messages", return_value=([{"id": "msg1"}], "1001"))
+    mock_get_details = mocker.patch("app.tasks.batch_get_message_details", return_value=({
+        "msg1": {
+            "id": "msg1",
+            "snippet": "Job opportunity...",
+            "body": "<html>...</html>",
+            "date": "Some Date",
+            "from": "recruiter@company.com"
+        }
+    }, {}))
+    mock_archive_email = mocker.patch("app.tasks.batch_archive_emails", return_value={})
 
     mock_ai_result = {"summary": "A great job offer", "category": "Jobs"}
-    mock_summarize = mocker.patch("app.tasks.summarize_and_categorize_email", return_value=mock_ai_result)
+    mock_summarize = mocker.patch("app.tasks.summarize_and_categorize_emails", return_value={"msg1": mock_ai_result})
     
-    mocker.patch("app.tasks.get_gmail_service")
+    mocker.patch("app.tasks.get_async_gmail_client")
 
     process_emails_task_logic(owner_email, user_info, token_data, db_session=session)
 
-    mock_list_messages.assert_called_once()
-    mock_get_details.assert_called_with(mocker.ANY, "msg1")
+    mock_sync_messages.assert_called_once_with(mocker.ANY, start_history_id=None)
+    mock_get_details.assert_called_once_with(mocker.ANY, ["msg1"])
     mock_summarize.assert_called_once()
-    mock_archive_email.assert_called_with(mocker.ANY, "msg1")
+    mock_archive_email.assert_called_once_with(mocker.ANY, ["msg1"])
 
     processed_email = session.exec(select(Email).where(Email.id == "msg1")).one_or_none()
     assert processed_email is not None
     assert processed_email.id == "msg1"
     assert processed_email.summary == "A great job offer"
     assert processed_email.category_id == cat1.id
-    assert processed_email.user_email == owner_email
\ No newline at end of file
+    assert processed_email.label_source == "llm"
+    assert processed_email.user_email == owner_email
+    assert processed_email.body is None
+    assert load_email_body(session, processed_email) == "<html>...</html>"
+    assert [row.id for row in search_emails(session, owner_email, "job offer")[0]] == ["msg1"]
+
+def test_process_emails_logic_resumes_from_cursor(session: Session, mocker):
+
+    owner_email = "test@example.com"
+    session.add(Category(name="Jobs", description="Job offers", user_email=owner_email))
+    session.add(SyncCursor(linked_email=owner_email, history_id="500"))
+    session.commit()
+
+    mock_sync_messages = mocker.patch("app.tasks.sync_messages", return_value=([], "750"))
+    mocker.patch("app.tasks.get_async_gmail_client")
+
+    process_emails_task_logic(owner_email, {"email": owner_email}, {"access_token": "fake_token"}, db_session=session)
+
+    mock_sync_messages.assert_called_once_with(mocker.ANY, start_history_id="500")
+    assert session.get(SyncCursor, owner_email).history_id == "750"
+
+
+
+def test_process_emails_logic_reuses_cached_classification(session: Session, mocker):
+
+    clear_cache()
+    owner_email = "test@example.com"
+    cat1 = Category(name="Promotions", description="Marketing emails", user_email=owner_email)
+    session.add(cat1)
+    session.commit()
+
+    def details(msg_id):
+        return {"id": msg_id, "snippet": "Sale!", "body": "<p>50% off</p>", "date": "Some Date", "from": "shop@store.com"}
+
+    mocker.patch("app.tasks.get_async_gmail_client")
+    mocker.patch("app.tasks.batch_archive_emails", return_value={})
+    mocker.patch("app.tasks.sync_messages", side_effect=[([{"id": "m1"}], "1"), ([{"id": "m2"}], "2")])
+    mocker.patch("app.tasks.batch_get_message_details", side_effect=[({"m1": details("m1")}, {}), ({"m2": details("m2")}, {})])
+    mock_summarize = mocker.patch("app.tasks.summarize_and_categorize_emails", return_value={
+        "m1": {"summary": "A sale.", "category": "Promotions"}
+    })
+
+    process_emails_task_logic(owner_email, {"email": owner_email}, {}, db_session=session)
+    process_emails_task_logic(owner_email, {"email": "linked@example.com"}, {}, db_session=session)
+
+    mock_summarize.assert_called_once()
+    second = session.get(Email, "m2")
+    assert second.summary == "A sale."
+    assert second.category_id == cat1.id
+
+
+def test_process_emails_logic_skips_llm_when_local_classifier_is_confident(session: Session, mocker):
+
+    clear_cache()
+    owner_email = "test@example.com"
+    jobs = Category(name="Jobs", description="Job offers", user_email=owner_email)
+    session.add(jobs)
+    session.commit()
+    for i in range(9):
+        session.add(Email(
+            id=f"old{i}", user_email=owner_email, summary="A job alert.", snippet="New jobs for you",
+            sent_date="Some Date", from_address="jobs-noreply@linkedin.com", category_id=jobs.id,
+            label_source="llm"
+        ))
+    session.commit()
+
+    mocker.patch("app.tasks.get_async_gmail_client")
+    mocker.patch("app.tasks.batch_archive_emails", return_value={})
+    mocker.patch("app.tasks.sync_messages", return_value=([{"id": "new1"}], "1"))
+    mocker.patch("app.tasks.batch_get_message_details", return_value=({"new1": {
+        "id": "new1", "snippet": "5 new jobs match your profile. See them all.", "body": "<html>...</html>",
+        "date": "Some Date", "from": "LinkedIn <jobs-noreply@linkedin.com>"
+    }}, {}))
+    mock_summarize = mocker.patch("app.tasks.summarize_and_categorize_emails")
+
+    process_emails_task_logic(owner_email, {"email": owner_email}, {}, db_session=session)
+
+    mock_summarize.assert_not_called()
+    stored = session.get(Email, "new1")
+    assert stored.category_id == jobs.id
+    assert stored.summary == "5 new jobs match your profile."
+    assert stored.label_source == "local"
+
+
+def test_process_emails_logic_only_archives_rows_it_inserted(session: Session, mocker):
+
+    clear_cache()
+    owner_email = "test@example.com"
+    jobs = Category(name="Jobs", description="Job offers", user_email=owner_email)
+    session.add(jobs)
+    session.add(Email(
+        id="taken", user_email="someone-else@example.com", summary="Theirs.", snippet="",
+        sent_date="Some Date", from_address="x@y.com"
+    ))
+    session.add(Email(
+        id="known", user_email=owner_email, summary="Already synced.", snippet="",
+        sent_date="Some Date", from_address="x@y.com", category_id=jobs.id
+    ))
+    session.commit()
+
+    def details(msg_id):
+        return {"id": msg_id, "snippet": "Hiring", "body": f"<p>{msg_id}</p>", "date": "Some Date", "from": "hr@company.com"}
+
+    mocker.patch("app.tasks.get_async_gmail_client")
+    mocker.patch("app.tasks.sync_messages", return_value=([{"id": "known"}, {"id": "taken"}, {"id": "fresh"}], "1"))
+    mock_get_details = mocker.patch("app.tasks.batch_get_message_details", return_value=(
+        {"taken": details("taken"), "fresh": details("fresh")}, {}
+    ))
+    mocker.patch("app.tasks.summarize_and_categorize_emails", return_value={
+        "taken": {"summary": "A job.", "category": "Jobs"},
+        "fresh": {"summary": "Another job.", "category": "Jobs"},
+    })
+    mock_archive = mocker.patch("app.tasks.batch_archive_emails", return_value={})
+
+    process_emails_task_logic(owner_email, {"email": owner_email}, {}, db_session=session)
+
+    mock_get_details.assert_called_once_with(mocker.ANY, ["taken", "fresh"])
+    mock_archive.assert_called_once_with(mocker.ANY, ["fresh"])
+    assert session.get(Email, "taken").user_email == "someone-else@example.com"
+    assert session.get(Email, "fresh").summary == "Another job."
@@ -0,0 +1,40 @@
+from app.text_processing import html_to_text, prepare_for_prompt, truncate_to_token_budget, estimate_tokens
+
+
+def test_prepare_for_prompt_keeps_only_the_new_message():
+
+    html = """
+    <html><head><style>p { color: red }</style></head><body>
+    <p>View this email in your browser</p>
+    <p>Hi Ana,</p>
+    <p>Your order 123 has shipped. Track it at
+    https://track.example.com/a?utm_source=mail&amp;utm_campaign=spring-sale-2024&amp;id=1234567890abcdef.</p>
+    <p>Thanks!</p>
+    <img src="https://pixel.example.com/open.gif" width="1" height="1">
+    <div>--<br>Bob<br>Sent from my iPhone</div>
+    <div>On Mon, Jan 1, 2024 at 10:00 AM Shop &lt;shop@example.com&gt; wrote:</div>
+    <blockquote>&gt; Where is my order?</blockquote>
+    <p>You are receiving this because you bought something. Unsubscribe.</p>
+    <p>&copy; 2024 Shop Inc. All rights reserved.</p>
+    </body></html>
+    """
+
+    text = prepare_for_prompt(html_to_text(html), max_tokens=500)
+
+    assert text == "Hi Ana,\n\nYour order 123 has shipped. Track it at\n[link: track.example.com].\n\nThanks!"
+
+
+def test_footers_and_quotes_are_kept_when_nothing_else_is_left():
+
+    assert prepare_for_prompt("Unsubscribe from this list.", max_tokens=100) == "Unsubscribe from this list."
+    assert prepare_for_prompt("On Monday Ana wrote:\nSee you then.", max_tokens=100) == "On Monday Ana wrote:\nSee you then."
+
+
+def test_truncation_respects_the_token_budget_and_sentence_boundaries():
+
+    text = "This is a sentence. " * 100
+
+    truncated = truncate_to_token_budget(text, max_tokens=50)
+
+    assert estimate_tokens(truncated) <= 50
+    assert truncated.endswith("sentence.")
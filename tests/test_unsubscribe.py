@@ -0,0 +1,115 @@
+import asyncio
+
+from sqlmodel import Session, select
+
+from app.models.email import Email
+from app.models.unsubscribe_result import UnsubscribeResult
+from app.tasks import process_unsubscribe_task_wrapper
+from app.unsubscribe import (
+    parse_list_unsubscribe, supports_one_click, find_unsubscribe_anchor, unsubscribe_email, unsubscribe_emails
+)
+
+
+def _email(**kwargs) -> Email:
+    return Email(**{"id": "m1", "user_email": "test@example.com", "summary": "", "snippet": "", "sent_date": "", "from_address": "news@shop.com", **kwargs})
+
+
+def test_parse_list_unsubscribe_header():
+
+    http_urls, mailto_uris = parse_list_unsubscribe("<mailto:leave@shop.com?subject=unsub>, <https://shop.com/u/abc>")
+
+    assert http_urls == ["https://shop.com/u/abc"]
+    assert mailto_uris == ["mailto:leave@shop.com?subject=unsub"]
+    assert supports_one_click("List-Unsubscribe=One-Click")
+    assert not supports_one_click(None)
+
+
+def test_anchor_scan_prefers_link_text_over_url():
+
+    body = """
+    <p>Hi! <a href="https://shop.com/unsubscribe-tracking-pixel">View in browser</a></p>
+    <footer><a href="https://shop.com/prefs?u=1">Click here to <b>Unsubscribe</b></a></footer>
+    """
+
+    assert find_unsubscribe_anchor(body) == "https://shop.com/prefs?u=1"
+    assert find_unsubscribe_anchor("<a href='https://shop.com'>Home</a>") is None
+
+
+def test_one_click_header_skips_gemini_and_browser(mocker):
+
+    one_click = mocker.patch("app.unsubscribe.one_click_unsubscribe", return_value={"success": True, "reason": "ok"})
+    find_link = mocker.patch("app.unsubscribe.find_unsubscribe_link")
+    agent = mocker.patch("app.unsubscribe.agent_unsubscribe_from_link")
+
+    result = asyncio.run(unsubscribe_email(_email(
+        list_unsubscribe="<https://shop.com/one-click/abc>", list_unsubscribe_post="List-Unsubscribe=One-Click"
+    ), ""))
+
+    assert result["success"]
+    one_click.assert_called_once_with("https://shop.com/one-click/abc")
+    find_link.assert_not_called()
+    agent.assert_not_called()
+
+
+def test_anchor_link_goes_to_browser_without_gemini_lookup(mocker):
+
+    find_link = mocker.patch("app.unsubscribe.find_unsubscribe_link")
+    agent = mocker.patch("app.unsubscribe.agent_unsubscribe_from_link", return_value={"success": True, "reason": "ok"})
+
+    asyncio.run(unsubscribe_email(_email(), '<a href="https://shop.com/leave">Unsubscribe</a>'))
+
+    find_link.assert_not_called()
+    agent.assert_called_once_with("https://shop.com/leave")
+
+
+def test_unsubscribe_emails_runs_each_list_once_with_bounded_concurrency(mocker):
+
+    running = []
+    peak = []
+    async def slow_unsubscribe(email, body):
+        running.append(email.id)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(email.id)
+        return {"success": True, "reason": email.id}
+    mocker.patch("app.unsubscribe.unsubscribe_email", side_effect=slow_unsubscribe)
+    emails = [
+        (Email(id=f"m{i}", user_email="test@example.com", summary="", snippet="", sent_date="",
+               from_address=f"News <news{i % 4}@shop.com>", list_unsubscribe=f"<https://shop.com/u/{i % 4}>"), "")
+        for i in range(12)
+    ]
+    results = {}
+
+    lists = asyncio.run(unsubscribe_emails(
+        emails, lambda list_emails, result: results.update({email.id: result["reason"] for email in list_emails}),
+        concurrency=2
+    ))
+
+    assert lists == 4
+    assert max(peak) == 2
+    assert results["m5"] == "m1" and results["m8"] == "m0"
+    assert len(results) == 12
+
+
+def test_unsubscribe_job_stores_a_result_per_email(session: Session, mocker):
+
+    mocker.patch("app.tasks.engine", session.get_bind())
+    mocker.patch("app.unsubscribe.unsubscribe_email", return_value={"success": True, "reason": "ok"})
+    publish = mocker.patch("app.tasks.progress_broker.publish")
+    for email_id in ("m1", "m2"):
+        session.add(_email(id=email_id))
+        session.add(UnsubscribeResult(batch_id="batch", owner_email="test@example.com", email_id=email_id))
+    session.add(UnsubscribeResult(batch_id="batch", owner_email="test@example.com", email_id="deleted"))
+    session.commit()
+
+    process_unsubscribe_task_wrapper("test@example.com", "batch")
+
+    session.expire_all()
+    rows = {row.email_id: row for row in session.exec(select(UnsubscribeResult)).all()}
+    assert all(row.status == "done" for row in rows.values())
+    assert rows["m1"].success and rows["m2"].reason == "ok"
+    assert rows["deleted"].success is False
+    event = publish.call_args.args[1]
+    assert (event["type"], event["batch_id"], event["done"], event["total"]) == ("unsubscribe", "batch", 3, 3)
+    assert set(event["result_ids"]) == {rows["m1"].id, rows["m2"].id}
+    assert event["reason"] == "ok"